@@ -0,0 +1,51 @@
+"""
+Notation A1 des plages Sheets (mêmes résultats que gspread.utils).
+
+Importer gspread.utils charge tout gspread et google-auth (plusieurs
+centaines de ms) : la couche de données n'en a besoin qu'à la connexion.
+"""
+import re
+
+_CELL = re.compile(r"([A-Za-z]*)(\d*)")
+
+
+def _col_number(letters: str) -> int:
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + ord(ch) - ord("A") + 1
+    return n
+
+
+def col_letter(col: int) -> str:
+    """Lettre(s) de la colonne col (1 = A)."""
+    letters = ""
+    while col > 0:
+        col, rest = divmod(col - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+def rowcol_to_a1(row: int, col: int) -> str:
+    """(3, 2) -> "B3"."""
+    return f"{col_letter(col)}{row}"
+
+
+def a1_range_to_grid_range(name: str) -> dict:
+    """
+    "A2:M" -> {"startRowIndex": 1, "startColumnIndex": 0, "endColumnIndex": 13} :
+    indices à partir de 0, fin exclue, bornes absentes si la plage est ouverte.
+    """
+    start, _, end = name.partition(":")
+    end = end or start
+    c0, r0 = _CELL.fullmatch(start).groups()
+    c1, r1 = _CELL.fullmatch(end).groups()
+    grid = {}
+    if r0:
+        grid["startRowIndex"] = int(r0) - 1
+    if r1:
+        grid["endRowIndex"] = int(r1)
+    if c0:
+        grid["startColumnIndex"] = _col_number(c0) - 1
+    if c1:
+        grid["endColumnIndex"] = _col_number(c1)
+    return grid
@@ -0,0 +1,164 @@
+"""
+Archive froide des trades anciens, en Parquet partitionné par semaine ISO.
+
+Les trades antérieurs aux hot_weeks dernières semaines quittent la feuille
+pour root/iso_year=AAAA/iso_week=SS/part-<id>.parquet : colonnes texte, telles
+que lues dans la feuille, pour que build_frame reste le seul chemin de
+parsing. Le schéma d'un fichier est l'en-tête de la feuille : les colonnes
+ajoutées à la main après les nôtres sont archivées avec leurs lignes. Un
+fichier n'est jamais réécrit : un nouvel archivage de la même semaine
+ajoute un fichier à la partition.
+
+manifest.json (remplacé de façon atomique, après les fichiers) liste les
+partitions et porte la version de l'archive : c'est le point de commit.
+Il désigne aussi le fichier des rollups des trades archivés, cumulés à
+chaque archivage : les vues multi-semaines ne relisent jamais l'archive.
+
+Lecture : seules les partitions et colonnes demandées sont lues, en
+mémoire mappée. pyarrow n'est importé qu'au premier accès aux fichiers.
+"""
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import rollup
+from a1 import col_letter
+
+MANIFEST = "manifest.json"
+
+
+def _week_dir(key: tuple) -> str:
+    return os.path.join(f"iso_year={key[0]}", f"iso_week={key[1]:02d}")
+
+
+def _schema(header) -> list:
+    """Noms de colonnes uniques : sans nom ou en double, la lettre de la colonne est ajoutée."""
+    names = []
+    for j, name in enumerate(header):
+        if not name or name in names:
+            name = f"{name}_{col_letter(j + 1)}" if name else col_letter(j + 1)
+        names.append(name)
+    return names
+
+
+def _fsync_replace(tmp: str, path: str):
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class TradeArchive:
+    def __init__(self, root: str, columns):
+        self.root = root
+        self.columns = list(columns)
+        self._manifest = {"version": 0, "partitions": {}, "rollups": None}
+        self._stat = None
+        self._rollups = (None, None)
+        self._lock = threading.Lock()
+
+    # ── manifeste ─────────────────────────────────────────
+    def _load(self) -> dict:
+        """Manifeste courant, relu seulement si le fichier a été remplacé (autre process)."""
+        try:
+            st = os.stat(os.path.join(self.root, MANIFEST))
+        except FileNotFoundError:
+            return self._manifest
+        sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if sig != self._stat:
+            with open(os.path.join(self.root, MANIFEST), encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._stat = sig
+        return self._manifest
+
+    @property
+    def version(self) -> int:
+        return self._load()["version"]
+
+    def weeks(self) -> list:
+        """(iso_year, iso_week) des partitions, triées."""
+        return sorted(tuple(map(int, k.split("-"))) for k in self._load()["partitions"])
+
+    def has_week(self, iso_year: int, iso_week: int) -> bool:
+        return f"{iso_year}-{iso_week}" in self._load()["partitions"]
+
+    # ── lecture ───────────────────────────────────────────
+    def read(self, weeks=None, columns=None) -> dict:
+        """{colonne: valeurs texte} des partitions weeks (toutes par défaut)."""
+        columns = list(columns or self.columns)
+        partitions = self._load()["partitions"]
+        keys = [f"{y}-{w}" for y, w in weeks] if weeks is not None else list(partitions)
+        files = [
+            os.path.join(self.root, _week_dir(tuple(map(int, k.split("-")))), name)
+            for k in keys for name in partitions.get(k, ())
+        ]
+        if not files:
+            return {c: np.empty(0, dtype=object) for c in columns}
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        # Fichiers lus en parallèle, en mémoire mappée
+        table = ds.dataset(files, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True)).to_table(columns=columns)
+        return {c: table.column(c).to_numpy(zero_copy_only=False) for c in columns}
+
+    def trade_ids(self) -> set:
+        ids = self.read(columns=["trade_id"])["trade_id"]
+        return {i for i in ids if i}
+
+    def rollups(self):
+        """Rollups des trades archivés (voir rollup.py), None si l'archive est vide."""
+        manifest = self._load()
+        if manifest["rollups"] is None:
+            return None
+        name, cached = self._rollups
+        if name != manifest["rollups"]:
+            cached = pd.read_parquet(os.path.join(self.root, manifest["rollups"]))
+            self._rollups = (manifest["rollups"], cached)
+        return cached
+
+    # ── écriture ──────────────────────────────────────────
+    def write(self, groups: dict, rollups: pd.DataFrame, header=None) -> int:
+        """
+        Archive {(iso_year, iso_week): lignes} (listes dans l'ordre de
+        header, par défaut columns) ; rollups : agrégats de ces lignes,
+        cumulés à ceux de l'archive.
+        """
+        names = _schema(header or self.columns)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            manifest = self._load()
+            partitions = {k: list(v) for k, v in manifest["partitions"].items()}
+            n = 0
+            for key, rows in groups.items():
+                if not rows:
+                    continue
+                folder = os.path.join(self.root, _week_dir(key))
+                os.makedirs(folder, exist_ok=True)
+                name = f"part-{uuid.uuid4().hex}.parquet"
+                cells = list(zip(*(list(r) + [""] * (len(names) - len(r)) for r in rows)))
+                table = pa.table({c: pa.array(cells[i], pa.string()) for i, c in enumerate(names)})
+                pq.write_table(table, os.path.join(folder, "." + name), compression="zstd")
+                _fsync_replace(os.path.join(folder, "." + name), os.path.join(folder, name))
+                partitions.setdefault(f"{key[0]}-{key[1]}", []).append(name)
+                n += len(rows)
+
+            previous = self.rollups()
+            merged = rollups if previous is None else rollup.merge(previous, rollups)
+            version = manifest["version"] + 1
+            name = f"rollups-{version}.parquet"
+            merged.to_parquet(os.path.join(self.root, "." + name))
+            _fsync_replace(os.path.join(self.root, "." + name), os.path.join(self.root, name))
+
+            tmp = os.path.join(self.root, MANIFEST + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "partitions": partitions, "rollups": name}, f)
+            _fsync_replace(tmp, os.path.join(self.root, MANIFEST))
+            if manifest["rollups"] is not None:
+                os.remove(os.path.join(self.root, manifest["rollups"]))
+            return n
@@ -0,0 +1,360 @@
+"""
+Benchmarks des chemins chauds sur des journaux de trades synthétiques.
+
+    python bench.py --sizes 1000 10000 100000 --output bench_output.json
+    python bench.py --sizes 1000000 --repeat 1 --compare old.json
+
+Le journal est généré avec les colonnes de TRADE_COLUMNS et servi par la
+feuille locale storage.FakeWorksheet (latence réglable). Chaque mesure
+donne le temps (médiane et min sur --repeat essais), le pic mémoire
+Python (tracemalloc, essai séparé) et le nombre d'appels API par type.
+Les résultats sont écrits en JSON ; --compare signale les écarts avec
+un fichier produit par une autre version.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from perf import breakdown, build_cube
+from rollup import apply_append, build_rollups, trend
+from search import SearchIndex, parse
+from scoring import MS_HTF_MAX, RULES, SESSIONS, score_frame, score_setup
+from storage import FakeWorksheet
+from trade_store import TRADE_COLUMNS, TradeStore, _dates, build_frame, build_week_index, new_trade_id
+from whatif import COLUMNS as WHATIF_COLUMNS, WhatIfModel, evaluated_trades
+
+PAIRS = ("XAUUSD", "US30", "NAS100", "EURUSD", "GBPUSD", "USDJPY", "GBPJPY", "AUDUSD", "NZDUSD")
+TIMEFRAMES = ("M1", "M5", "M15", "M30", "H1", "H2", "H4")
+COMMENTS = ("", "", "", "Entrée un peu tôt", "Retest propre", "News à 14h30", "SL trop serré", "Setup A+")
+TRADES_PER_DAY = 4
+HOT_WEEKS = 8
+REGRESSION_RATIO = 1.2
+
+
+# ──────────────────────────────
+# Journal synthétique
+# ──────────────────────────────
+def synthetic_setups(n: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Setups tirés au hasard parmi les issues de chaque règle de scoring."""
+    setups = {"pair": rng.choice(PAIRS, n)}
+    for rule in RULES:
+        if rule.name == "rr":
+            setups["rr"] = np.round(np.clip(rng.lognormal(1.0, 0.45, n), 0.5, 10.0), 1)
+        elif rule.name == "ms_htf":
+            setups["ms_htf"] = rng.integers(0, MS_HTF_MAX + 1, n)
+        else:
+            setups[rule.name] = rng.choice(rule.choices, n)
+    return pd.DataFrame(setups)
+
+
+def synthetic_journal(n: int, seed: int = 0, end: date = None) -> list:
+    """
+    n lignes de trades (valeurs texte, comme renvoyées par Sheets), environ
+    TRADES_PER_DAY par jour jusqu'à end, scores calculés par le vrai moteur.
+    """
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    setups = synthetic_setups(n, rng)
+    score = score_frame(setups, with_notes=False)["score"].to_numpy()
+
+    days = np.sort(rng.integers(0, max(1, n // TRADES_PER_DAY), n))[::-1]
+    seconds = rng.integers(0, 86400, n)
+    dates = [end - timedelta(days=int(d)) for d in days]
+    stamps = [
+        (datetime.combine(d, datetime.min.time()) + timedelta(seconds=int(s))).isoformat(timespec="seconds")
+        for d, s in zip(dates, seconds)
+    ]
+
+    # Les bons setups sont plus souvent pris, et gagnent un peu plus souvent
+    taken = rng.random(n) < np.where(score >= 80, 0.8, 0.25)
+    p_win = np.clip(0.25 + (score - 60) / 200, 0.1, 0.7)
+    u = rng.random(n)
+    result = np.where(u < p_win, "Win", np.where(u < p_win + 0.1, "BE", "Loss"))
+    result = np.where(taken, result, "Non pris")
+
+    columns = {
+        "datetime": stamps,
+        "date_trade": [d.isoformat() for d in dates],
+        "pair": setups["pair"],
+        "direction": rng.choice(("Buy", "Sell"), n),
+        "timeframe": rng.choice(TIMEFRAMES, n),
+        "session": rng.choice(SESSIONS, n),
+        "rr": setups["rr"].map("{:g}".format),
+        "score_percent": score.astype(str),
+        "commentaire": rng.choice(COMMENTS, n),
+        "taken": np.where(taken, "Oui", "Non"),
+        "result": result,
+        "trade_id": [rng.bytes(16).hex() for _ in range(n)],
+        "screenshot": [rng.bytes(32).hex() if shot else "" for shot in rng.random(n) < 0.1],
+    }
+    return [list(r) for r in zip(*(np.asarray(columns[c], dtype=object) for c in TRADE_COLUMNS))]
+
+
+# ──────────────────────────────
+# Mesure
+# ──────────────────────────────
+def measure(name, size, fn, setup=None, ws=None, repeat=3, memory=True, per_call=1) -> dict:
+    """
+    fn(arg) où arg = setup() est préparé hors chrono à chaque essai. Les
+    appels API sont comptés sur le premier essai et divisés par per_call.
+    """
+    times = []
+    calls = Counter()
+    for i in range(repeat):
+        arg = setup() if setup else None
+        before = Counter(ws.calls) if ws is not None else Counter()
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+        if i == 0 and ws is not None:
+            calls = Counter(ws.calls) - before
+
+    peak = None
+    if memory:
+        arg = setup() if setup else None
+        tracemalloc.start()
+        fn(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "size": size,
+        "repeat": repeat,
+        "median_s": statistics.median(times) / per_call,
+        "min_s": min(times) / per_call,
+        "peak_mib": round(peak / 2**20, 3) if peak is not None else None,
+        "api_calls": {k: v / per_call for k, v in sorted(calls.items())},
+    }
+
+
+def _wait_flushed(store: TradeStore):
+    """Compteur de lignes écrites par le worker, pour attendre la fin d'un envoi."""
+    cond = threading.Condition()
+    state = {"flushed": 0}
+    on_flushed = store.queue.on_flushed
+
+    def counting(entries):
+        on_flushed(entries)
+        with cond:
+            state["flushed"] += len(entries)
+            cond.notify_all()
+
+    store.queue.on_flushed = counting
+
+    def wait(target, timeout=120.0):
+        with cond:
+            if not cond.wait_for(lambda: state["flushed"] >= target, timeout):
+                raise TimeoutError(f"write-behind : {state['flushed']}/{target} lignes écrites")
+
+    return state, wait
+
+
+def bench_size(n: int, args, workdir: str) -> list:
+    rows = synthetic_journal(n, seed=args.seed)
+    ws = FakeWorksheet([TRADE_COLUMNS] + rows, latency=args.latency, seed=args.seed)
+    opts = {"repeat": args.repeat, "memory": not args.no_memory}
+    results = []
+    run = 0
+
+    def fresh_store(sheet=None, **kw):
+        nonlocal run
+        run += 1
+        return TradeStore(sheet or ws, data_dir=os.path.join(workdir, f"run{run}"), **kw)
+
+    def add(name, fn, setup=None, **kw):
+        res = measure(name, n, fn, setup=setup, ws=ws, **{**opts, **kw})
+        results.append(res)
+        print(f"  {name:<24} {res['median_s'] * 1000:10.2f} ms   "
+              f"{res['peak_mib'] if res['peak_mib'] is not None else '-':>8} MiB   "
+              f"{dict(res['api_calls']) or ''}", flush=True)
+
+    # Lecture : miroir vide (synchro complète) puis miroir à jour (delta)
+    add("load.cold", lambda s: s.load_all_trades(), setup=lambda: fresh_store(start_writer=False))
+    store = fresh_store()
+    store.load_all_trades()
+    add("load.sync_delta", lambda _: store.fetch_all_trades())
+    add("load.cached", lambda _: store.load_all_trades())
+    # Redémarrage : construction sans appel réseau, en-tête déjà vérifié par le miroir
+    reopen = lambda: TradeStore(ws, data_dir=store.data_dir, start_writer=False)
+    add("start.open", lambda _: reopen())
+    add("start.restart_load", lambda s: s.load_all_trades(), setup=reopen)
+
+    raw = store.mirror.read_columns()
+    add("parse.read_mirror", lambda _: store.mirror.read_columns())
+    add("parse.coerce_types", lambda _: build_frame(raw))
+    add("parse.iso_week", lambda _: _dates(raw["date_trade"]))
+
+    df = store.load_all_trades()
+    weeks = store.load_week_index()
+    latest = max(weeks)
+    add("week.build_index", lambda _: build_week_index(df))
+    add("week.filter", lambda _: store.load_week_trades(*latest))
+    add("week.filter_scan", lambda _: df[(df["iso_year"] == latest[0]) & (df["iso_week"] == latest[1])])
+
+    # Rollups hebdomadaires : construction complète, vue tendance et mise à jour par delta
+    rollups = store.load_rollups()
+    add("rollup.build", lambda _: build_rollups(df))
+    add("rollup.trend_26w", lambda _: trend(rollups, 26, 4))
+    add("rollup.apply_append", lambda _: apply_append(rollups, df.tail(50)))
+
+    # Recherche : index complet, puis requête combinée mot + facettes + plage
+    index = SearchIndex.build(df)
+    query = parse("retest AND XAUUSD AND Loss AND score>=80")
+    add("search.build", lambda _: SearchIndex.build(df))
+    add("search.query", lambda _: index.evaluate(query))
+    add("search.scan", lambda _: df[
+        df["commentaire"].str.contains("retest", case=False) & (df["pair"] == "XAUUSD")
+        & (df["result"] == "Loss") & (df["score_percent"] >= 80)
+    ])
+
+    # Archive Parquet : HOT_WEEKS semaines dans la feuille, le reste archivé
+    tiered_ws = FakeWorksheet([TRADE_COLUMNS] + rows, seed=args.seed)
+    archive_dir = os.path.join(workdir, "archive")
+    tiered = fresh_store(tiered_ws, start_writer=False, archive_dir=archive_dir)
+    tiered.archive_older_than(HOT_WEEKS)
+    cold_week = tiered.archive.weeks()[-1]
+    add("archive.load_hot", lambda s: s.load_week_index(),
+        setup=lambda: fresh_store(tiered_ws, start_writer=False, archive_dir=archive_dir))
+    add("archive.read_week", lambda _: tiered._read_cold((cold_week,), None, -1))
+    add("archive.read_whatif", lambda _: tiered._read_cold(None, WHATIF_COLUMNS, -1))
+
+    # Agrégats de perf (successeurs des groupby de agg_perf)
+    df_eval = evaluated_trades(df)
+    add("perf.build_cube", lambda _: build_cube(df_eval))
+    cube = build_cube(df_eval)
+    add("perf.breakdown", lambda _: [breakdown(cube, d) for d in ("pair", "direction", "session")])
+    add("whatif.sweep", lambda _: WhatIfModel(df).sweep())
+
+    setups = synthetic_setups(n, np.random.default_rng(args.seed))
+    add("score.frame", lambda _: score_frame(setups))
+    one = setups.iloc[0].to_dict()
+    add("score.setup", lambda _: score_setup(one))
+
+    # Écritures : ajout via la file différée, puis édition pris / résultat
+    state, wait = _wait_flushed(store)
+
+    def trade():
+        return {
+            "datetime": datetime.now().isoformat(timespec="seconds"),
+            "date_trade": date.today().isoformat(),
+            "pair": "XAUUSD", "direction": "Buy", "timeframe": "M15", "session": "London",
+            "rr": 3, "score_percent": 85, "commentaire": "", "taken": "Non", "result": "Non pris",
+            "trade_id": new_trade_id(),
+        }
+
+    def append(k):
+        target = state["flushed"] + k
+        for _ in range(k):
+            store.append_trade(trade())
+        wait(target)
+
+    def append_batch(k):
+        target = state["flushed"] + k
+        store.append_trades([trade() for _ in range(k)])
+        wait(target)
+
+    add("write.append_1", lambda _: append(1), memory=False)
+    add("write.append_50", lambda _: append(50), memory=False, per_call=50)
+    add("write.append_batch_1000", lambda _: append_batch(1000), memory=False, per_call=1000)
+
+    def edits():
+        week = store.load_week_trades(*latest).head(20)
+        flip = {"Oui": "Non", "Non": "Oui"}
+        return [
+            {"trade_id": r.trade_id, "sheet_row": r.sheet_row, "taken": flip.get(r.taken, "Oui"), "result": "Win"}
+            for r in week.itertuples()
+        ]
+
+    add("write.update_20", store.update_taken_and_result, setup=edits)
+    return results
+
+
+# ──────────────────────────────
+# Rapport
+# ──────────────────────────────
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current: list, baseline_path: str) -> int:
+    """Affiche les écarts avec un fichier de référence ; retourne le nombre de régressions."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nComparaison avec {baseline_path} (régression si > x{REGRESSION_RATIO}) :")
+    for r in current:
+        old = baseline.get((r["name"], r["size"]))
+        if old is None or not old["median_s"]:
+            continue
+        ratio = r["median_s"] / old["median_s"]
+        flags = []
+        if ratio > REGRESSION_RATIO:
+            flags.append("TEMPS")
+        if r["peak_mib"] and old["peak_mib"] and r["peak_mib"] / old["peak_mib"] > REGRESSION_RATIO:
+            flags.append("MÉMOIRE")
+        if sum(r["api_calls"].values()) > sum(old["api_calls"].values()):
+            flags.append("APPELS API")
+        regressions += bool(flags)
+        print(f"  {r['name']:<24} n={r['size']:<8} x{ratio:5.2f}  {' '.join(flags)}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="latence simulée par appel API (s)")
+    parser.add_argument("--no-memory", action="store_true", help="pas de mesure tracemalloc")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="fichier JSON d'une autre version")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="trade-bench-") as workdir:
+        for n in args.sizes:
+            print(f"n = {n}", flush=True)
+            results.extend(bench_size(n, args, os.path.join(workdir, str(n))))
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats écrits dans {args.output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Stockage local des screenshots, adressé par contenu.
+
+Chaque fichier est rangé sous son hash SHA-256 (root/ab/cdef…) : un même
+screenshot envoyé deux fois n'est stocké qu'une fois, et la feuille ne
+garde que le hash. L'écriture se fait par blocs dans un fichier
+temporaire, hashé au fil de l'eau puis renommé (atomique) : le fichier
+n'est jamais entièrement en mémoire.
+
+Les vignettes sont générées à la première demande (Pillow) et gardées
+dans root/thumbs/<largeur>/ ; sans Pillow, thumbnail() renvoie None.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_BYTES = 1 << 20
+THUMB_WIDTH = 240
+THUMB_DIR = "thumbs"
+
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        if not is_digest(digest):
+            raise ValueError(f"hash invalide : {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest: str) -> bool:
+        return is_digest(digest) and os.path.exists(self.path(digest))
+
+    def put(self, f) -> str:
+        """Copie le flux binaire f dans le store ; retourne son hash."""
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+                    h.update(block)
+                    out.write(block)
+            digest = h.hexdigest()
+            target = self.path(digest)
+            if os.path.exists(target):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp, target)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def put_file(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return self.put(f)
+
+    def open(self, digest: str):
+        return open(self.path(digest), "rb")
+
+    def thumbnail(self, digest: str, width: int = THUMB_WIDTH):
+        """Chemin de la vignette JPEG (générée si besoin), None si indisponible."""
+        if not self.exists(digest):
+            return None
+        thumb = os.path.join(self.root, THUMB_DIR, str(width), digest + ".jpg")
+        if os.path.exists(thumb):
+            return thumb
+        try:
+            from PIL import Image
+        except ImportError:
+            return None
+        os.makedirs(os.path.dirname(thumb), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(thumb), suffix=".jpg")
+        try:
+            with os.fdopen(fd, "wb") as out, Image.open(self.path(digest)) as img:
+                # JPEG : décodage directement à une résolution réduite
+                img.draft("RGB", (width, width))
+                img.thumbnail((width, width * 4))
+                img.convert("RGB").save(out, "JPEG", quality=80)
+        except OSError:
+            # Fichier illisible comme image
+            os.remove(tmp)
+            return None
+        os.replace(tmp, thumb)
+        return thumb
+
+
+def is_digest(value) -> bool:
+    return isinstance(value, str) and bool(_DIGEST.fullmatch(value))
@@ -0,0 +1,364 @@
+"""
+Score et journalisation des setups sans Streamlit (scanner, scripts).
+
+    python cli.py score setups.jsonl
+    scanner | python cli.py score - --log > scored.jsonl
+    python cli.py score setups.csv --output-format csv
+    python cli.py import relevé.csv --dayfirst
+    python cli.py archive --weeks 26
+    python cli.py report --weeks 12 --output reports
+
+Entrée : JSON lines (un setup par ligne), tableau JSON ou CSV, depuis un
+fichier ou stdin (-). Les setups portent les champs de SETUP_FIELDS
+(voir scoring.py) et, pour --log, direction, timeframe, commentaire,
+taken, result, datetime, date_trade, screenshot (chemin) si connus. Le flux est traité par
+lots de --batch setups : chaque lot est scoré en une passe vectorisée,
+écrit sur stdout puis, avec --log, journalisé dans la file d'écriture
+différée du même TradeStore que l'app. Un setup invalide donne une
+ligne {"error": ...} sans arrêter le flux.
+
+Le stockage (pandas + backend Sheets) n'est importé que pour --log,
+import, archive et report ; la configuration vient de .streamlit/secrets.toml (ou
+--secrets / TRADE_RATER_SECRETS), comme pour l'app.
+
+Fonctions réutilisables : score_setups(), log_setups(), open_headless_store().
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from blobstore import is_digest
+from scoring import NO_TRADE_THRESHOLD, SETUP_FIELDS, score_frame
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SECRETS = os.path.join(".streamlit", "secrets.toml")
+BATCH_SIZE = 1000
+SCORE_COLUMNS = ("score", "verdict", "notes")
+
+
+# ──────────────────────────────
+# API
+# ──────────────────────────────
+def _scored(setup: dict, score: int, notes) -> dict:
+    verdict = "TRADE" if score >= NO_TRADE_THRESHOLD else "NO TRADE"
+    return {**setup, "score": int(score), "verdict": verdict, "notes": list(notes)}
+
+
+def score_setups(setups, with_notes: bool = True) -> list:
+    """
+    Score d'une liste de setups (dicts) en une passe vectorisée. Chaque
+    résultat reprend le setup avec score, verdict et notes ; un setup
+    invalide donne {**setup, "error": message}.
+    """
+    setups = list(setups)
+    if not setups:
+        return []
+    # Champ absent ou vide : NaN classerait le setup dans une issue arbitraire
+    incomplete = [any(s.get(f) in (None, "") for f in SETUP_FIELDS) for s in setups]
+    if any(incomplete):
+        valid = iter(score_setups([s for s, bad in zip(setups, incomplete) if not bad], with_notes))
+        return [_missing(s) if bad else next(valid) for s, bad in zip(setups, incomplete)]
+    try:
+        res = score_frame(pd.DataFrame(setups), with_notes=with_notes)
+    except (KeyError, ValueError, TypeError):
+        # Lot invalide : on isole les setups en erreur par dichotomie
+        if len(setups) == 1:
+            return [_error(setups[0])]
+        mid = len(setups) // 2
+        return score_setups(setups[:mid], with_notes) + score_setups(setups[mid:], with_notes)
+    notes = res["notes"] if with_notes else [()] * len(setups)
+    return [_scored(s, score, n) for s, score, n in zip(setups, res["score"], notes)]
+
+
+def _missing(setup: dict) -> dict:
+    missing = [f for f in SETUP_FIELDS if setup.get(f) in (None, "")]
+    return {**setup, "error": f"Champs manquants : {', '.join(missing)}"}
+
+
+def _error(setup: dict) -> dict:
+    try:
+        score_frame(pd.DataFrame([setup]))
+    except (KeyError, ValueError, TypeError) as exc:
+        return {**setup, "error": str(exc.args[0] if exc.args else exc)}
+    return {**setup, "error": "setup invalide"}
+
+
+def trade_row(result: dict, now: datetime = None) -> dict:
+    """Ligne de la feuille des trades pour un setup scoré."""
+    now = now or datetime.now()
+    return {
+        "datetime": result.get("datetime") or now.isoformat(timespec="seconds"),
+        "date_trade": result.get("date_trade") or now.date().isoformat(),
+        "pair": result.get("pair", ""),
+        "direction": result.get("direction", ""),
+        "timeframe": result.get("timeframe", ""),
+        "session": result.get("session", ""),
+        "rr": result.get("rr", ""),
+        "score_percent": result["score"],
+        "commentaire": result.get("commentaire", ""),
+        "taken": result.get("taken") or "Non",
+        "result": result.get("result") or "Non pris",
+        "trade_id": result.get("trade_id", ""),
+        "screenshot": result.get("screenshot", ""),
+    }
+
+
+def log_setups(store, results) -> list:
+    """
+    Journalise les setups scorés (sans erreur) ; retourne leurs trade_id.
+    Un champ screenshot contenant un chemin de fichier est copié dans le
+    store de screenshots et remplacé par son hash.
+    """
+    now = datetime.now()
+    rows = [trade_row(r, now) for r in results if "error" not in r]
+    for row in rows:
+        path = row["screenshot"]
+        if path and not is_digest(path):
+            if os.path.isfile(path):
+                row["screenshot"] = store.blobs.put_file(path)
+            else:
+                log.warning("screenshot introuvable, ignoré : %s", path)
+                row["screenshot"] = ""
+    return store.append_trades(rows) if rows else []
+
+
+def load_secrets(path: str = None) -> dict:
+    path = path or os.environ.get("TRADE_RATER_SECRETS") or DEFAULT_SECRETS
+    if not os.path.exists(path):
+        return {}
+    import tomllib
+
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def open_headless_store(secrets_path: str = None):
+    """Même TradeStore que l'app, configuré depuis le fichier de secrets."""
+    from storage import open_store, storage_config
+
+    secrets = load_secrets(secrets_path)
+    config = storage_config(secrets.get("storage"))
+    info = secrets.get("gcp_service_account") if config["backend"] == "gsheets" else None
+    if config["backend"] == "gsheets" and not info:
+        raise SystemExit("gcp_service_account absent des secrets (ou TRADE_RATER_BACKEND=sqlite|memory)")
+    return open_store(config, info)
+
+
+def wait_flushed(store, timeout: float = None) -> bool:
+    """Attend l'envoi des lignes journalisées (elles restent dans le journal sinon)."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while store.queue.depth:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.2)
+    return True
+
+
+# ──────────────────────────────
+# Entrées / sorties
+# ──────────────────────────────
+def read_batches(stream, fmt: str, batch: int = BATCH_SIZE):
+    """Lots de setups (listes de dicts) lus au fil du flux texte."""
+    if fmt == "csv":
+        for chunk in pd.read_csv(stream, dtype=str, keep_default_na=False, chunksize=batch):
+            yield chunk.to_dict("records")
+        return
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+    if first == "[":
+        yield from _chunks(json.loads(first + stream.read()), batch)
+        return
+    lines = _prefixed(first, stream)
+    pending = []
+    for line in lines:
+        if line.strip():
+            try:
+                pending.append(json.loads(line))
+            except ValueError as exc:
+                pending.append({"error": f"JSON invalide : {exc}"})
+        if len(pending) >= batch:
+            yield pending
+            pending = []
+    if pending:
+        yield pending
+
+
+def _prefixed(first: str, stream):
+    yield first + stream.readline()
+    yield from stream
+
+
+def _chunks(items, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _input_format(path: str, fmt: str) -> str:
+    if fmt != "auto":
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "json"
+
+
+class _CsvOutput:
+    def __init__(self, out):
+        self.out = out
+        self.writer = None
+
+    def write(self, results):
+        if self.writer is None:
+            fields = [k for k in results[0] if k not in SCORE_COLUMNS and k != "error"]
+            self.writer = csv.DictWriter(
+                self.out, fields + list(SCORE_COLUMNS) + ["error"], extrasaction="ignore"
+            )
+            self.writer.writeheader()
+        for r in results:
+            self.writer.writerow({**r, "notes": " | ".join(r.get("notes", ()))})
+
+
+class _JsonOutput:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, results):
+        self.out.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in results))
+
+
+# ──────────────────────────────
+# Commandes
+# ──────────────────────────────
+def cmd_score(args) -> int:
+    fmt = _input_format(args.input, args.format)
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig", newline="")
+    out = (_CsvOutput if args.output_format == "csv" else _JsonOutput)(sys.stdout)
+    store = open_headless_store(args.secrets) if args.log else None
+    counts = {"scored": 0, "errors": 0, "logged": 0}
+    start = time.perf_counter()
+    try:
+        for batch in read_batches(stream, fmt, args.batch):
+            scored = iter(score_setups((s for s in batch if "error" not in s), with_notes=not args.no_notes))
+            # Lignes illisibles laissées à leur place dans le flux
+            results = [s if "error" in s else next(scored) for s in batch]
+            out.write(results)
+            sys.stdout.flush()
+            errors = sum("error" in r for r in results)
+            counts["errors"] += errors
+            counts["scored"] += len(results) - errors
+            if store is not None:
+                counts["logged"] += len(log_setups(store, results))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    if store is not None and not wait_flushed(store, args.flush_timeout):
+        print(f"{store.queue.depth} ligne(s) restent dans le journal (envoi au prochain lancement)", file=sys.stderr)
+    print(
+        f"{counts['scored']} setup(s) scoré(s), {counts['errors']} erreur(s), {counts['logged']} journalisé(s) "
+        f"en {elapsed:.2f} s ({counts['scored'] / max(elapsed, 1e-9):.0f} setups/s)",
+        file=sys.stderr,
+    )
+    return 1 if counts["errors"] else 0
+
+
+def cmd_import(args) -> int:
+    from importer import import_trades
+
+    store = open_headless_store(args.secrets)
+    mapping = dict(m.split("=", 1) for m in args.map)
+
+    def progress(stats):
+        total = f"/{stats['total']}" if stats["total"] else ""
+        print(
+            f"\r{stats['read']}{total} lue(s), {stats['imported']} importée(s), "
+            f"{stats['duplicates']} doublon(s), {stats['pending']} en attente",
+            end="", file=sys.stderr,
+        )
+
+    source = sys.stdin.buffer if args.input == "-" else args.input
+    try:
+        stats = import_trades(store, source, mapping=mapping, dayfirst=args.dayfirst, on_progress=progress)
+    except ValueError as exc:
+        print(f"\nImport impossible : {exc}", file=sys.stderr)
+        return 2
+    print(file=sys.stderr)
+    if not wait_flushed(store, args.flush_timeout):
+        print(f"{store.queue.depth} ligne(s) restent dans le journal (envoi au prochain lancement)", file=sys.stderr)
+    stats["pending"] = store.queue.depth
+    print(json.dumps({k: v for k, v in stats.items() if k != "error"}))
+    if stats["stalled"]:
+        print(f"Import interrompu à la ligne {stats['read'] + 1} (envoi bloqué) : relancer pour reprendre", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_archive(args) -> int:
+    store = open_headless_store(args.secrets)
+    weeks = args.weeks if args.weeks is not None else store.hot_weeks
+    if weeks is None:
+        print("Nombre de semaines à garder : --weeks ou hot_weeks dans [storage]", file=sys.stderr)
+        return 2
+    print(json.dumps(store.archive_older_than(weeks)))
+    return 0
+
+
+def cmd_report(args) -> int:
+    from reports import generate_reports
+
+    store = open_headless_store(args.secrets)
+    weeks = store.list_weeks()
+    stats = generate_reports(
+        store, weeks[-args.weeks:] if args.weeks else weeks, args.output,
+        workers=args.workers, force=args.force,
+    )
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Score et journalisation des setups sans Streamlit.")
+    parser.add_argument("--secrets", help=f"fichier de secrets TOML (défaut : {DEFAULT_SECRETS})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("score", help="score des setups (JSON lines, JSON ou CSV)")
+    p.add_argument("input", nargs="?", default="-", help="fichier ou - pour stdin")
+    p.add_argument("--format", choices=("auto", "json", "csv"), default="auto")
+    p.add_argument("--output-format", choices=("json", "csv"), default="json")
+    p.add_argument("--batch", type=int, default=BATCH_SIZE)
+    p.add_argument("--no-notes", action="store_true", help="score seul (plus rapide)")
+    p.add_argument("--log", action="store_true", help="journalise les setups scorés comme trades")
+    p.add_argument("--flush-timeout", type=float, default=60.0)
+    p.set_defaults(func=cmd_score)
+
+    p = sub.add_parser("import", help="import d'un relevé de broker / journal CSV")
+    p.add_argument("input", help="fichier CSV ou - pour stdin")
+    p.add_argument("--dayfirst", action="store_true", help="dates au format jour/mois/année")
+    p.add_argument("--map", action="append", default=[], metavar="EN_TÊTE=COLONNE",
+                   help="associe un en-tête du fichier à une colonne de la feuille")
+    p.add_argument("--flush-timeout", type=float, default=None)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("archive", help="déplace les anciennes semaines de la feuille vers l'archive Parquet")
+    p.add_argument("--weeks", type=int, help="semaines gardées dans la feuille, semaine en cours comprise (défaut : hot_weeks)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("report", help="rapports hebdo HTML + CSV (semaines inchangées sautées)")
+    p.add_argument("--weeks", type=int, help="dernières semaines seulement (défaut : toutes)")
+    p.add_argument("--output", default="reports", help="dossier des rapports")
+    p.add_argument("--workers", type=int, help="processus de rendu (défaut : nombre de CPU)")
+    p.add_argument("--force", action="store_true", help="régénère aussi les semaines inchangées")
+    p.set_defaults(func=cmd_report)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+Import en masse de relevés de broker et de journaux CSV.
+
+Le fichier est lu par morceaux (pandas, chunksize), chaque morceau est
+converti vers les colonnes de TRADE_COLUMNS, dédoublonné puis journalisé
+d'un coup dans la file d'écriture différée, qui l'envoie par append_rows
+sous le quota du pool. Chaque trade importé a pour trade_id
+"imp-<hash>" (date/heure, paire, sens) : l'index des hash des trades
+existants écarte les doublons, même entre deux fichiers.
+
+Reprise : après chaque morceau journalisé, le nombre de lignes lues est
+enregistré dans data_dir/imports/<empreinte du fichier>.json ; un nouvel
+import du même fichier repart de là. Le point de reprise est supprimé
+une fois l'import terminé. Si le worker n'envoie plus rien pendant
+stall_timeout secondes (quota, réseau, writer arrêté), la lecture s'arrête
+et le point de reprise est gardé.
+"""
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from trade_store import TRADE_COLUMNS
+
+CHUNK_ROWS = 5000
+# Lignes en attente d'envoi au-delà desquelles la lecture attend le worker
+MAX_PENDING = 5000
+# Attente maximale sans progrès du worker avant d'interrompre l'import
+STALL_SECONDS = 300
+IMPORT_DIR = "imports"
+# Colonnes lues pour l'index des trades existants (archive comprise)
+KEY_COLUMNS = ("datetime", "pair", "direction", "trade_id")
+FINGERPRINT_BYTES = 1 << 20
+
+# En-têtes usuels (minuscules, sans espaces ni ponctuation) -> colonne de la feuille
+COLUMN_ALIASES = {
+    "datetime": ("datetime", "opentime", "timeopen", "entrytime", "time", "date", "opendate"),
+    "pair": ("pair", "symbol", "instrument", "ticker", "market", "asset"),
+    "direction": ("direction", "side", "type", "action", "buysell"),
+    "timeframe": ("timeframe", "tf"),
+    "session": ("session",),
+    "rr": ("rr", "riskreward", "rmultiple"),
+    "score_percent": ("scorepercent", "score"),
+    "commentaire": ("commentaire", "comment", "comments", "note", "notes"),
+    "taken": ("taken", "pris"),
+    "result": ("result", "resultat", "outcome"),
+    "profit": ("profit", "pnl", "netprofit", "pl", "gain"),
+}
+DIRECTIONS = {
+    "buy": "Buy", "long": "Buy", "b": "Buy", "achat": "Buy",
+    "sell": "Sell", "short": "Sell", "s": "Sell", "vente": "Sell",
+}
+RESULTS = {
+    "win": "Win", "w": "Win", "tp": "Win", "gagnant": "Win",
+    "loss": "Loss", "l": "Loss", "sl": "Loss", "perdant": "Loss",
+    "be": "BE", "breakeven": "BE",
+    "nonpris": "Non pris",
+}
+
+
+def _norm(name) -> str:
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+def normalize_pairs(values: pd.Series) -> pd.Series:
+    """Paires en majuscules, sans séparateur ("eur/usd" -> "EURUSD")."""
+    return values.str.upper().str.replace(r"[^A-Z0-9]", "", regex=True)
+
+
+def resolve_columns(header, mapping: dict = None) -> dict:
+    """
+    {colonne de la feuille: en-tête du fichier}. mapping ({en-tête: colonne})
+    complète ou remplace la détection par COLUMN_ALIASES.
+    """
+    by_norm = {_norm(h): h for h in header}
+    resolved = {}
+    for col, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_norm:
+                resolved[col] = by_norm[alias]
+                break
+    for source, col in (mapping or {}).items():
+        resolved[col] = source
+    missing = [c for c in ("datetime", "pair", "direction") if c not in resolved]
+    if missing:
+        raise ValueError(f"Colonnes introuvables dans le fichier : {', '.join(missing)}")
+    return resolved
+
+
+def import_key(datetimes, pairs, directions) -> list:
+    """Hash de dédoublonnage : date/heure à la seconde, paire, sens."""
+    return [
+        hashlib.sha1(f"{d}|{p}|{s}".encode()).hexdigest()[:16]
+        for d, p, s in zip(datetimes, pairs, directions)
+    ]
+
+
+def existing_keys(df: pd.DataFrame) -> set:
+    """Index des hash des trades déjà présents (et de leurs trade_id)."""
+    if df.empty:
+        return set()
+    stamps = df["datetime"].dt.strftime("%Y-%m-%dT%H:%M:%S").fillna("")
+    pairs = normalize_pairs(df["pair"].astype(object).fillna("").astype(str))
+    keys = set(import_key(stamps, pairs, df["direction"].astype(object).fillna("")))
+    ids = df["trade_id"].dropna()
+    keys.update(i[4:] for i in ids if i.startswith("imp-"))
+    return keys
+
+
+def _mapped(values: pd.Series, table: dict) -> pd.Series:
+    return values.map(lambda v: table.get(_norm(v), ""))
+
+
+def _sniff_sep(first_line: str) -> str:
+    return max((",", ";", "\t"), key=first_line.count)
+
+
+def _parse_datetimes(values: pd.Series, dayfirst: bool) -> pd.Series:
+    """Formats variables selon le broker : parsés une fois par valeur distincte."""
+    codes, uniques = pd.factorize(values.str.strip())
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors="coerce", format="mixed", dayfirst=dayfirst)
+    return pd.Series(parsed.to_numpy().take(codes), index=values.index).where(codes >= 0)
+
+
+def convert_chunk(chunk: pd.DataFrame, columns: dict, dayfirst: bool = False) -> pd.DataFrame:
+    """Lignes d'un morceau dans l'ordre de TRADE_COLUMNS ; les invalides sont écartées."""
+    def get(col):
+        return chunk[columns[col]].fillna("").astype(str).str.strip()
+
+    stamps = _parse_datetimes(get("datetime"), dayfirst)
+    out = pd.DataFrame(index=chunk.index)
+    out["datetime"] = stamps.dt.strftime("%Y-%m-%dT%H:%M:%S")
+    out["date_trade"] = stamps.dt.strftime("%Y-%m-%d")
+    out["pair"] = normalize_pairs(get("pair"))
+    out["direction"] = _mapped(get("direction"), DIRECTIONS)
+    for col in ("timeframe", "session", "rr", "score_percent", "commentaire", "screenshot"):
+        out[col] = get(col) if col in columns else ""
+    if "result" in columns:
+        out["result"] = _mapped(get("result"), RESULTS)
+    elif "profit" in columns:
+        profit = pd.to_numeric(get("profit").str.replace(",", ".").str.replace(" ", ""), errors="coerce")
+        out["result"] = np.select([profit > 0, profit < 0, profit == 0], ["Win", "Loss", "BE"], "")
+    else:
+        out["result"] = ""
+    # Relevé de broker : les trades listés ont été pris
+    out["taken"] = get("taken") if "taken" in columns else np.where(out["result"] == "Non pris", "Non", "Oui")
+    valid = stamps.notna() & (out["pair"] != "") & (out["direction"] != "")
+    out = out[valid]
+    # dtype explicite : un morceau sans ligne valide garde une colonne texte (.str)
+    out["trade_id"] = pd.Series(
+        ["imp-" + k for k in import_key(out["datetime"], out["pair"], out["direction"])],
+        index=out.index, dtype=object,
+    )
+    return out[TRADE_COLUMNS]
+
+
+def _fingerprint(f) -> str:
+    """Empreinte du fichier (taille + début) pour retrouver son point de reprise."""
+    pos = f.tell()
+    head = f.read(FINGERPRINT_BYTES)
+    size = f.seek(0, os.SEEK_END)
+    f.seek(pos)
+    return hashlib.sha1(head + str(size).encode()).hexdigest()[:20]
+
+
+def _count_rows(f) -> int:
+    pos = f.tell()
+    n = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+    f.seek(pos)
+    return max(0, n - 1)
+
+
+class Checkpoint:
+    """Point de reprise d'un import (écrit de façon atomique)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self, state: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def import_trades(store, source, mapping: dict = None, dayfirst: bool = False,
+                  chunk_rows: int = CHUNK_ROWS, max_pending: int = MAX_PENDING,
+                  encoding: str = "utf-8-sig", resume: bool = True, on_progress=None,
+                  stall_timeout: float = STALL_SECONDS) -> dict:
+    """
+    Importe un CSV (chemin ou fichier binaire) dans le store. on_progress(stats)
+    est appelé après chaque morceau et pendant l'attente du worker. Retourne
+    {"total", "read", "imported", "duplicates", "invalid", "resumed_from",
+    "pending", "error", "stalled"} ("total" vaut None si la source n'est pas
+    relisible, ex. stdin ; "pending" : lignes journalisées pas encore
+    envoyées ; "stalled" : import interrompu, worker sans progrès).
+    """
+    owned = isinstance(source, (str, os.PathLike))
+    f = open(source, "rb") if owned else source
+    try:
+        seekable = f.seekable()
+        checkpoint = None
+        if resume and seekable:
+            name = _fingerprint(f) + ".json"
+            checkpoint = Checkpoint(os.path.join(store.data_dir, IMPORT_DIR, name))
+        state = checkpoint.load() if checkpoint else {}
+        stats = {
+            "total": _count_rows(f) if seekable else None,
+            "read": state.get("read", 0),
+            "imported": state.get("imported", 0),
+            "duplicates": state.get("duplicates", 0),
+            "invalid": state.get("invalid", 0),
+            "resumed_from": state.get("read", 0),
+            "pending": store.queue.depth,
+            "error": store.queue.last_error,
+            "stalled": False,
+        }
+
+        with instrument.stage("import.index"):
+            seen = existing_keys(store.load_all_trades(KEY_COLUMNS))
+            # Lignes d'un import précédent encore dans le journal : doublons aussi
+            seen.update(k[4:] for k in store.queue.pending_keys() if k.startswith("imp-"))
+        if seekable:
+            first_line = f.readline()
+            f.seek(0)
+        else:
+            # stdin, pipe… : on lit l'en-tête sans le consommer
+            f = f if hasattr(f, "peek") else io.BufferedReader(f)
+            first_line = f.peek(FINGERPRINT_BYTES).split(b"\n", 1)[0]
+        reader = pd.read_csv(
+            f, sep=_sniff_sep(first_line.decode(encoding, errors="replace")), dtype=str,
+            keep_default_na=False, encoding=encoding, chunksize=chunk_rows,
+            skiprows=range(1, stats["read"] + 1) if stats["read"] else None,
+        )
+        columns = None
+        for chunk in reader:
+            if columns is None:
+                columns = resolve_columns(chunk.columns, mapping)
+            with instrument.stage("import.chunk", rows=len(chunk)):
+                rows = convert_chunk(chunk, columns, dayfirst)
+                keys = rows["trade_id"].str[4:]
+                fresh = ~keys.isin(seen) & ~keys.duplicated()
+                seen.update(keys[fresh])
+                if fresh.any():
+                    store.append_trades(rows[fresh].to_dict("records"))
+            stats["read"] += len(chunk)
+            stats["invalid"] += len(chunk) - len(rows)
+            stats["duplicates"] += int((~fresh).sum())
+            stats["imported"] += int(fresh.sum())
+            if checkpoint:
+                checkpoint.save({k: stats[k] for k in ("read", "imported", "duplicates", "invalid")})
+            if not _wait_for_queue(store.queue, max_pending, stall_timeout, stats, on_progress):
+                # Point de reprise gardé : un nouvel import repartira d'ici
+                stats["stalled"] = True
+                return stats
+        # Le reste est journalisé : il sera envoyé même après un redémarrage
+        if checkpoint:
+            checkpoint.clear()
+        return stats
+    finally:
+        if owned:
+            f.close()
+
+
+def _wait_for_queue(queue, max_pending: int, stall_timeout: float, stats: dict, on_progress) -> bool:
+    """
+    Contre-pression : attend que le worker ait envoyé le surplus. False si
+    la file n'a pas baissé pendant stall_timeout secondes.
+    """
+    lowest, since = queue.depth, time.monotonic()
+    while True:
+        depth = queue.depth
+        stats["pending"] = depth
+        stats["error"] = queue.last_error
+        if on_progress is not None:
+            on_progress(stats)
+        if depth <= max_pending:
+            return True
+        if depth < lowest:
+            lowest, since = depth, time.monotonic()
+        elif time.monotonic() - since > stall_timeout:
+            return False
+        time.sleep(0.5)
+
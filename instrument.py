@@ -0,0 +1,284 @@
+"""
+Instrumentation des reruns : durée, lignes traitées et appels API par étape.
+
+Un « run » regroupe les étapes d'un rerun Streamlit (ou d'un envoi en fond
+du write-behind). Le run courant est propre au thread ; hors run, stage()
+ne mesure rien et ne coûte presque rien.
+
+    with instrument.stage("mirror.read") as s:
+        df = ...
+        s.rows = len(df)
+
+scope(label) mesure une section de page : étape du run en cours, ou run
+à part entière quand un st.fragment est relancé seul.
+
+Export : JSON lines (une ligne par étape) et texte au format Prometheus
+(compteurs cumulés). Si TRADE_RATER_METRICS_DIR est défini, chaque run
+terminé est ajouté à stages.jsonl et trade_rater.prom est réécrit.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+METRIC_PREFIX = "trade_rater"
+JSONL_NAME = "stages.jsonl"
+PROM_NAME = "trade_rater.prom"
+
+
+class Stage:
+    __slots__ = ("name", "depth", "start", "seconds", "rows", "api_calls")
+
+    def __init__(self, name: str, depth: int = 0, start: float = 0.0):
+        self.name = name
+        self.depth = depth
+        self.start = start
+        self.seconds = None
+        self.rows = None
+        self.api_calls = Counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "depth": self.depth,
+            "start_s": round(self.start, 6),
+            "seconds": round(self.seconds or 0.0, 6),
+            "rows": self.rows,
+            "api_calls": dict(self.api_calls),
+        }
+
+
+class Run:
+    """Étapes d'un rerun, dans l'ordre de démarrage."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label: str, profiler=None):
+        self.id = next(self._ids)
+        self.label = label
+        self.started = time.time()
+        self.status = "open"
+        self.seconds = None
+        self.stages = []
+        self._profiler = profiler
+        self._t0 = time.perf_counter()
+        self._last = self._t0
+        self._stack = []
+
+    @property
+    def done(self) -> bool:
+        return self.status != "open"
+
+    @property
+    def api_calls(self) -> Counter:
+        total = Counter()
+        for s in self.stages:
+            if s.depth == 0:
+                total.update(s.api_calls)
+        return total
+
+    def _open(self, name: str) -> Stage:
+        now = time.perf_counter()
+        s = Stage(name, len(self._stack), now - self._t0)
+        self.stages.append(s)
+        self._stack.append(s)
+        self._last = now
+        return s
+
+    def _close(self, s: Stage, end: float = None):
+        end = end if end is not None else time.perf_counter()
+        s.seconds = end - self._t0 - s.start
+        if self._stack and self._stack[-1] is s:
+            self._stack.pop()
+        self._last = end
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        s = self._open(name)
+        s.rows = rows
+        try:
+            yield s
+        finally:
+            self._close(s)
+
+    def api_call(self, method: str):
+        for s in self._stack:
+            s.api_calls[method] += 1
+        self._last = time.perf_counter()
+
+    def finish(self, status: str = "ok"):
+        """
+        Termine le run. status="stopped" : run interrompu (st.stop, st.rerun), les
+        étapes encore ouvertes s'arrêtent à la dernière activité mesurée.
+        """
+        if self.done:
+            return
+        end = self._last if status == "stopped" else time.perf_counter()
+        while self._stack:
+            self._close(self._stack[-1], end)
+        self.seconds = end - self._t0
+        self.status = status
+        if self._profiler is not None:
+            self._profiler._record(self)
+
+    def records(self) -> list:
+        base = {"run": self.id, "label": self.label, "started": round(self.started, 3), "status": self.status}
+        return [{**base, **s.as_dict()} for s in self.stages]
+
+
+class _NullStage:
+    """Étape hors run : les attributs posés par l'appelant sont ignorés."""
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+@contextmanager
+def _null_stage():
+    yield _NULL_STAGE
+
+
+class Profiler:
+    """
+    Runs terminés récents (bornés) et totaux cumulés depuis le démarrage,
+    partagés par toutes les sessions.
+    """
+
+    def __init__(self, max_runs: int = 50, export_dir: str = None):
+        self.export_dir = export_dir
+        self.runs = deque(maxlen=max_runs)
+        self.stage_totals = {}
+        self.api_totals = Counter()
+        self.run_totals = Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # ── run courant (par thread) ──────────────────────────
+    def current(self):
+        return getattr(self._local, "run", None)
+
+    def begin_run(self, label: str, enabled: bool = True):
+        """Démarre le run du thread courant (None si désactivé)."""
+        run = Run(label, self) if enabled or self.export_dir else None
+        self._local.run = run
+        return run
+
+    def end_run(self, status: str = "ok"):
+        run = self.current()
+        self._local.run = None
+        if run is not None:
+            run.finish(status)
+        return run
+
+    @contextmanager
+    def run(self, label: str, enabled: bool = True):
+        """
+        Run du thread courant le temps du bloc, fermé même si le bloc est
+        interrompu (exception, st.stop, st.rerun : status "stopped").
+        """
+        run = self.begin_run(label, enabled)
+        try:
+            yield run
+        except BaseException:
+            self.end_run("stopped")
+            raise
+        self.end_run()
+
+    @contextmanager
+    def scope(self, label: str, enabled: bool = True):
+        """
+        Étape du run en cours s'il y en a un, sinon run à part entière
+        (rerun partiel d'un st.fragment) : yield le Stage ou le Run.
+        """
+        if self.current() is not None:
+            with self.stage(label) as s:
+                yield s
+        elif enabled or self.export_dir:
+            with self.run(label) as r:
+                yield r
+        else:
+            yield _NULL_STAGE
+
+    def stage(self, name: str, rows: int = None):
+        run = self.current()
+        return run.stage(name, rows) if run is not None else _null_stage()
+
+    def api_call(self, method: str):
+        run = self.current()
+        if run is not None:
+            run.api_call(method)
+
+    # ── agrégats / export ─────────────────────────────────
+    def _record(self, run: Run):
+        with self._lock:
+            self.runs.append(run)
+            self.run_totals[(run.label, run.status)] += 1
+            for s in run.stages:
+                t = self.stage_totals.setdefault(s.name, {"count": 0, "seconds": 0.0, "rows": 0})
+                t["count"] += 1
+                t["seconds"] += s.seconds or 0.0
+                t["rows"] += s.rows or 0
+                for method, n in s.api_calls.items():
+                    self.api_totals[(s.name, method)] += n
+        if self.export_dir:
+            self.export(self.export_dir, [run])
+
+    def to_jsonl(self, runs=None) -> str:
+        with self._lock:
+            runs = list(self.runs) if runs is None else runs
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for run in runs for r in run.records())
+
+    def to_prometheus(self) -> str:
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_runs_total Runs terminés par libellé et statut.",
+            f"# TYPE {p}_runs_total counter",
+        ]
+        with self._lock:
+            for (label, status), n in sorted(self.run_totals.items()):
+                lines.append(f'{p}_runs_total{{label="{_escape(label)}",status="{status}"}} {n}')
+            for metric, key, help_text in (
+                ("stage_calls_total", "count", "Exécutions de l'étape."),
+                ("stage_seconds_total", "seconds", "Temps cumulé dans l'étape (s)."),
+                ("stage_rows_total", "rows", "Lignes traitées par l'étape."),
+            ):
+                lines += [f"# HELP {p}_{metric} {help_text}", f"# TYPE {p}_{metric} counter"]
+                for name, t in sorted(self.stage_totals.items()):
+                    lines.append(f'{p}_{metric}{{stage="{_escape(name)}"}} {t[key]:g}')
+            lines += [
+                f"# HELP {p}_api_calls_total Appels API Sheets par étape et méthode.",
+                f"# TYPE {p}_api_calls_total counter",
+            ]
+            for (name, method), n in sorted(self.api_totals.items()):
+                lines.append(f'{p}_api_calls_total{{stage="{_escape(name)}",method="{method}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str, runs):
+        """Ajoute les runs à stages.jsonl et réécrit trade_rater.prom (atomique)."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, JSONL_NAME), "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl(runs))
+        path = os.path.join(directory, PROM_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+PROFILER = Profiler(export_dir=os.environ.get("TRADE_RATER_METRICS_DIR") or None)
+
+stage = PROFILER.stage
+api_call = PROFILER.api_call
+begin_run = PROFILER.begin_run
+end_run = PROFILER.end_run
+run = PROFILER.run
+scope = PROFILER.scope
@@ -0,0 +1,214 @@
+"""
+Miroir local SQLite (WAL) de la feuille des trades.
+
+La synchro incrémentale ne relit que :
+  - l'en-tête, la colonne A, la colonne clé (trade_id, unique par ligne)
+    et les colonnes éditables (taken / result) en un seul batch_get ;
+  - les lignes ajoutées depuis le dernier nombre de lignes connu (la plus
+    longue des colonnes relues : une ligne saisie à la main sans trade_id
+    compte aussi).
+Une resynchro complète a lieu si la somme de contrôle de la colonne clé
+ne correspond plus (lignes triées, supprimées ou insérées au milieu), et
+au plus tard full_every secondes après la précédente : une modification
+manuelle des autres colonnes (pair, rr, commentaire…) n'est pas vue par
+la synchro incrémentale. Un en-tête qui ne commence plus par les colonnes
+attendues lève HeaderMismatch : c'est à l'appelant de remettre la feuille
+en ordre.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from a1 import col_letter
+
+EDITABLE_COLUMNS = ("taken", "result")
+# Délai maximal entre deux resynchros complètes
+FULL_RESYNC_SECONDS = 600
+
+
+class HeaderMismatch(Exception):
+    """En-tête de la feuille différent des colonnes du miroir."""
+
+    def __init__(self, header):
+        super().__init__(f"en-tête inattendu : {header}")
+        self.header = header
+
+
+def _checksum(keys) -> str:
+    h = hashlib.sha1()
+    for k in keys:
+        h.update(k.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _pad(row, width):
+    row = list(row[:width])
+    return row + [""] * (width - len(row))
+
+
+class SheetMirror:
+    """
+    Copie locale de la feuille, indexée par numéro de ligne Sheets. key :
+    colonne dont la somme de contrôle détecte les lignes déplacées.
+    """
+
+    def __init__(self, path: str, columns, key: str, full_every: float = FULL_RESYNC_SECONDS):
+        self.columns = list(columns)
+        self.key = key
+        self.full_every = full_every
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self._meta("header") not in (None, self._header_key()):
+            # Schéma local obsolète : on repart de zéro
+            self._conn.execute("DROP TABLE IF EXISTS trades")
+            self._conn.execute("DELETE FROM meta")
+        cols = ", ".join(f'"{c}" TEXT' for c in self.columns)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS trades (sheet_row INTEGER PRIMARY KEY, {cols})")
+        self._conn.commit()
+
+    # ── meta ──────────────────────────────────────────────
+    def _header_key(self) -> str:
+        return "\t".join(self.columns)
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def has_synced(self) -> bool:
+        """Une synchro complète a eu lieu : l'en-tête de la feuille a été vérifié."""
+        with self._lock:
+            return self._meta("header") is not None
+
+    def reset(self):
+        """Resynchro complète au prochain sync (feuille réorganisée)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM meta")
+            self._conn.commit()
+
+    def _check_header(self, header):
+        # Colonnes en plus après les nôtres : conservées, ignorées
+        if header[:len(self.columns)] != self.columns:
+            raise HeaderMismatch(header)
+
+    def row_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+
+    # ── synchro ───────────────────────────────────────────
+    def sync(self, ws) -> dict:
+        """Met le miroir à jour depuis la feuille ; retourne un résumé."""
+        with self._lock:
+            if self._meta("header") is None:
+                return self._full_resync(ws)
+            if time.time() - float(self._meta("synced_at") or 0) > self.full_every:
+                return self._full_resync(ws)
+
+            width = len(self.columns)
+            first = self.columns.index(EDITABLE_COLUMNS[0]) + 1
+            last = self.columns.index(EDITABLE_COLUMNS[-1]) + 1
+            key = col_letter(self.columns.index(self.key) + 1)
+            header, col_a, keys, edits = ws.batch_get([
+                "1:1",
+                "A2:A",
+                f"{key}2:{key}",
+                f"{col_letter(first)}2:{col_letter(last)}",
+            ])
+            self._check_header(header[0] if header else [])
+            n = max(len(col_a), len(keys), len(edits))
+            keys = [k[0] if k else "" for k in keys] + [""] * (n - len(keys))
+            edits = list(edits) + [[]] * (n - len(edits))
+
+            known = self.row_count()
+            local_keys = [r[0] for r in self._conn.execute(
+                f'SELECT "{self.key}" FROM trades ORDER BY sheet_row'
+            )]
+            if n < known or _checksum(keys[:known]) != _checksum(local_keys):
+                return self._full_resync(ws)
+
+            # Changements sur les colonnes éditables des lignes connues
+            local_edits = self._conn.execute(
+                "SELECT sheet_row, " + ", ".join(f'"{c}"' for c in self.columns[first - 1:last])
+                + " FROM trades ORDER BY sheet_row"
+            ).fetchall()
+            changed = []
+            for local, remote in zip(local_edits, edits):
+                remote = _pad(remote, last - first + 1)
+                if list(local[1:]) != remote:
+                    changed.append(remote + [local[0]])
+            if changed:
+                sets = ", ".join(f'"{c}" = ?' for c in self.columns[first - 1:last])
+                self._conn.executemany(f"UPDATE trades SET {sets} WHERE sheet_row = ?", changed)
+
+            # Lignes ajoutées depuis la dernière synchro
+            appended = 0
+            if n > known:
+                rows = ws.get(f"A{known + 2}:{col_letter(width)}{n + 1}")
+                self._insert(known + 2, rows)
+                appended = len(rows)
+
+            self._conn.commit()
+            return {"mode": "delta", "appended": appended, "changed": len(changed)}
+
+    def _full_resync(self, ws) -> dict:
+        values = ws.get_all_values()
+        self._check_header(values[0] if values else [])
+        rows = values[1:]
+        self._conn.execute("DELETE FROM trades")
+        self._insert(2, rows)
+        self._set_meta("header", self._header_key())
+        self._set_meta("synced_at", time.time())
+        self._conn.commit()
+        return {"mode": "full", "appended": len(rows), "changed": 0}
+
+    def _insert(self, first_row: int, rows):
+        width = len(self.columns)
+        params = ", ".join("?" * (width + 1))
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO trades VALUES ({params})",
+            ([first_row + i] + _pad(r, width) for i, r in enumerate(rows)),
+        )
+
+    # ── écritures locales (write-through) ─────────────────
+    def apply_appends(self, rows):
+        """rows : [(sheet_row, ligne)], écrits en une transaction."""
+        width = len(self.columns)
+        params = ", ".join("?" * (width + 1))
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO trades VALUES ({params})",
+                ([int(r)] + _pad([str(v) for v in row], width) for r, row in rows),
+            )
+            self._conn.commit()
+
+    def apply_cells(self, updates):
+        with self._lock:
+            for u in updates:
+                for col in EDITABLE_COLUMNS:
+                    if u.get(col) is not None:
+                        self._conn.execute(
+                            f'UPDATE trades SET "{col}" = ? WHERE sheet_row = ?',
+                            (u[col], int(u["sheet_row"])),
+                        )
+            self._conn.commit()
+
+    # ── lecture ───────────────────────────────────────────
+    def read_columns(self) -> dict:
+        """{colonne: valeurs brutes en texte} + sheet_row, transposés en une passe."""
+        names = self.columns + ["sheet_row"]
+        cols = ", ".join(f'"{c}"' for c in names)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {cols} FROM trades ORDER BY sheet_row").fetchall()
+        if not rows:
+            return {c: () for c in names}
+        return dict(zip(names, zip(*rows)))
@@ -0,0 +1,115 @@
+"""
+Agrégats de performance (Win / Loss / BE, winrate, score et RR moyens).
+
+Une seule passe groupby sur les trades évalués produit un « cube » de
+sommes au grain le plus fin (toutes les dimensions). Chaque tableau
+(par paire, direction, session, ...) est ensuite un re-groupement du
+cube, qui ne compte que quelques dizaines de lignes : ajouter une
+ventilation ne relit pas les trades.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ("pair", "direction", "session", "timeframe", "score_bucket", "week")
+SCORE_BUCKET_SIZE = 10
+
+_SUMS = ("trades", "win", "loss", "be", "score_sum", "score_n", "rr_sum", "rr_n")
+
+
+def _with_dimensions(df: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame(index=df.index)
+    for col in ("pair", "direction", "session", "timeframe"):
+        out[col] = df[col] if col in df.columns else ""
+    # Clés numériques (libellés formatés seulement dans breakdown)
+    out["score_bucket"] = np.floor(df["score_percent"] / SCORE_BUCKET_SIZE) * SCORE_BUCKET_SIZE
+    if "iso_year" in df.columns:
+        out["week"] = df["iso_year"] * 100 + df["iso_week"]
+    else:
+        out["week"] = pd.NA
+    return out
+
+
+def _labels(g: pd.DataFrame) -> pd.DataFrame:
+    if "score_bucket" in g.columns:
+        lo = g["score_bucket"].astype(int)
+        g["score_bucket"] = lo.astype(str) + "-" + (lo + SCORE_BUCKET_SIZE - 1).astype(str)
+    if "week" in g.columns:
+        key = g["week"].astype(int)
+        g["week"] = (key // 100).astype(str) + "-W" + (key % 100).astype(str)
+    return g
+
+
+def build_cube(df_eval: pd.DataFrame) -> pd.DataFrame:
+    """Sommes par combinaison de toutes les DIMENSIONS, en une passe."""
+    dims = _with_dimensions(df_eval)
+    n = len(dims)
+
+    # Codes entiers par dimension, combinés en une clé unique par ligne
+    key = np.zeros(n, dtype=np.int64)
+    uniques = []
+    for col in DIMENSIONS:
+        codes, u = pd.factorize(dims[col], use_na_sentinel=False)
+        key = key * max(len(u), 1) + codes
+        uniques.append(u)
+    group, keys = pd.factorize(key)
+
+    # Comparaisons sur des codes entiers plutôt que sur des chaînes
+    res_codes, res_uniques = pd.factorize(df_eval["result"], use_na_sentinel=False)
+    res_index = {v: i for i, v in enumerate(res_uniques)}
+    score = df_eval["score_percent"].to_numpy(dtype=float)
+    rr = df_eval["rr"].to_numpy(dtype=float) if "rr" in df_eval.columns else np.full(n, np.nan)
+    values = {
+        "trades": np.ones(n),
+        "win": res_codes == res_index.get("Win", -1),
+        "loss": res_codes == res_index.get("Loss", -1),
+        "be": res_codes == res_index.get("BE", -1),
+        "score_sum": np.nan_to_num(score),
+        "score_n": ~np.isnan(score),
+        "rr_sum": np.nan_to_num(rr),
+        "rr_n": ~np.isnan(rr),
+    }
+    cube = {}
+    # Décodage de la clé mixte -> valeur de chaque dimension
+    rest = np.asarray(keys, dtype=np.int64)
+    for col, u in zip(reversed(DIMENSIONS), reversed(uniques)):
+        size = max(len(u), 1)
+        cube[col] = np.asarray(u, dtype=object)[rest % size] if len(u) else np.empty(0, dtype=object)
+        rest = rest // size
+    cube = {col: cube[col] for col in DIMENSIONS}
+    for name in _SUMS:
+        sums = np.bincount(group, weights=values[name], minlength=len(keys))
+        cube[name] = sums if name in ("score_sum", "rr_sum") else sums.astype(np.int64)
+    return pd.DataFrame(cube)
+
+
+def breakdown(cube: pd.DataFrame, dims) -> pd.DataFrame:
+    """Tableau de perf par dims, même format que l'ancien agg_perf."""
+    dims = [dims] if isinstance(dims, str) else list(dims)
+    g = cube.groupby(dims)[list(_SUMS)].sum()
+    total = g["win"] + g["loss"] + g["be"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        winrate = np.where(total > 0, g["win"] / total * 100, 0.0)
+        score_mean = g["score_sum"] / g["score_n"].where(g["score_n"] > 0)
+        rr_mean = g["rr_sum"] / g["rr_n"].where(g["rr_n"] > 0)
+    out = pd.DataFrame({
+        "Trades": g["trades"],
+        "Win": g["win"],
+        "Loss": g["loss"],
+        "BE": g["be"],
+        "Winrate %": np.round(winrate, 1),
+        "Score moyen": score_mean.round(1),
+        "RR moyen": rr_mean.round(2),
+    }, index=g.index)
+    return _labels(out.reset_index()).sort_values("Winrate %", ascending=False, kind="stable")
+
+
+def totals(cube: pd.DataFrame) -> dict:
+    """Win / Loss / BE / winrate sur l'ensemble du cube."""
+    win, loss, be = (int(cube[c].sum()) for c in ("win", "loss", "be"))
+    total = win + loss + be
+    return {
+        "win": win,
+        "loss": loss,
+        "be": be,
+        "winrate": (win / total * 100) if total > 0 else 0.0,
+    }
@@ -0,0 +1,301 @@
+"""
+Rapports hebdomadaires statiques (HTML + CSV), générés hors de l'app.
+
+Un rapport reprend le contenu du dashboard pour une semaine : ranking par
+score, stats de score, perf des trades pris (Win / Loss / BE, winrate)
+et tableaux par paire, direction et session. Le CSV contient les trades
+de la semaine dans l'ordre du ranking.
+
+Les semaines sont rendues en parallèle dans un pool de processus, lancé
+dans un process à part (voir _render). Chaque rapport garde l'empreinte
+des trades dont il est issu (manifest.json du dossier) : une semaine dont
+les trades n'ont pas changé n'est pas régénérée. ReportJob lance une
+génération dans un thread de fond ; l'app ne fait que lire son état et
+les fichiers produits.
+"""
+import hashlib
+import html
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import instrument
+from perf import breakdown, build_cube, totals
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# À incrémenter quand le rendu change : tous les rapports sont régénérés
+FORMAT_VERSION = 1
+REPORT_COLUMNS = [
+    "datetime", "date_trade", "pair", "direction", "timeframe", "session",
+    "rr", "score_percent", "taken", "result", "commentaire", "trade_id",
+]
+EVAL_RESULTS = ("Win", "Loss", "BE")
+
+_STYLE = """
+body { font-family: system-ui, sans-serif; margin: 2rem; color: #222; }
+table { border-collapse: collapse; margin-bottom: 1.5rem; font-size: 0.9rem; }
+th, td { border-bottom: 1px solid #ddd; padding: 0.3rem 0.6rem; text-align: left; }
+th { background: #f4f4f4; }
+.metrics span { display: inline-block; margin-right: 2rem; }
+.metrics b { font-size: 1.3rem; display: block; }
+"""
+
+
+def week_label(iso_year: int, iso_week: int) -> str:
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def week_digest(df_week: pd.DataFrame) -> str:
+    """Empreinte des trades d'une semaine (colonnes du rapport)."""
+    values = pd.util.hash_pandas_object(df_week[REPORT_COLUMNS].astype(object), index=False)
+    h = hashlib.sha1(values.sort_values().to_numpy().tobytes())
+    h.update(str(FORMAT_VERSION).encode())
+    return h.hexdigest()
+
+
+# ──────────────────────────────
+# Rendu (processus du pool)
+# ──────────────────────────────
+def _table(df: pd.DataFrame) -> str:
+    return df.to_html(index=False, border=0, na_rep="", float_format=lambda v: f"{v:.1f}")
+
+
+def _metrics(items) -> str:
+    return '<p class="metrics">' + "".join(
+        f"<span>{html.escape(label)}<b>{html.escape(str(value))}</b></span>" for label, value in items
+    ) + "</p>"
+
+
+def render_week(df_week: pd.DataFrame, iso_year: int, iso_week: int) -> tuple:
+    """(html, csv) du rapport d'une semaine."""
+    label = week_label(iso_year, iso_week)
+    ranking = df_week.sort_values("score_percent", ascending=False, kind="stable")[REPORT_COLUMNS]
+    score = ranking["score_percent"]
+    parts = [
+        f"<h1>Rapport hebdo — {label}</h1>",
+        f"<p>{len(ranking)} trade(s)</p>",
+        "<h2>Stats rapides</h2>",
+        _metrics([
+            ("Score moyen", f"{score.mean():.1f} %"),
+            ("Meilleur score", f"{score.max():.1f} %"),
+            ("Pire score", f"{score.min():.1f} %"),
+        ]),
+        "<h2>Performance sur les trades pris</h2>",
+    ]
+    df_taken = df_week[df_week["taken"] == "Oui"]
+    df_eval = df_taken[df_taken["result"].isin(EVAL_RESULTS)]
+    if df_eval.empty:
+        parts.append("<p>Aucun résultat (Win/Loss/BE) renseigné pour les trades pris.</p>")
+    else:
+        cube = build_cube(df_eval)
+        tot = totals(cube)
+        parts.append(_metrics([
+            ("Trades pris", len(df_taken)),
+            ("Win", tot["win"]),
+            ("Loss", tot["loss"]),
+            ("Winrate (Win / (W+L+BE))", f"{tot['winrate']:.1f} %"),
+        ]))
+        for title, dim in (("Par paire", "pair"), ("Buy vs Sell", "direction"), ("Par session", "session")):
+            parts += [f"<h3>{title}</h3>", _table(breakdown(cube, dim))]
+    parts += ["<h2>Ranking des trades (par score)</h2>", _table(ranking.drop(columns="trade_id"))]
+
+    page = (
+        f'<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8"><title>{label}</title>'
+        f"<style>{_STYLE}</style></head><body>{''.join(parts)}</body></html>"
+    )
+    return page, ranking.to_csv(index=False)
+
+
+def _write(path: str, text: str):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def write_week(out_dir: str, df_week: pd.DataFrame, iso_year: int, iso_week: int) -> dict:
+    """Rend et écrit les fichiers d'une semaine ; retourne {"html", "csv"} (noms de fichiers)."""
+    page, csv = render_week(df_week, iso_year, iso_week)
+    label = week_label(iso_year, iso_week)
+    files = {"html": f"{label}.html", "csv": f"{label}.csv"}
+    _write(os.path.join(out_dir, files["html"]), page)
+    _write(os.path.join(out_dir, files["csv"]), csv)
+    return files
+
+
+# ──────────────────────────────
+# Génération
+# ──────────────────────────────
+def load_manifest(out_dir: str) -> dict:
+    """{libellé de semaine: {"digest", "html", "csv", "generated_at"}}."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir: str, manifest: dict):
+    _write(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def _is_current(out_dir: str, entry, digest: str) -> bool:
+    return bool(entry) and entry["digest"] == digest and all(
+        os.path.exists(os.path.join(out_dir, entry[kind])) for kind in ("html", "csv")
+    )
+
+
+def generate_reports(store, weeks, out_dir: str, workers: int = None,
+                     force: bool = False, on_progress=None) -> dict:
+    """
+    Rapports des semaines weeks ((iso_year, iso_week)) dans out_dir ; les
+    semaines inchangées sont sautées (sauf force). on_progress(stats) est
+    appelé après chaque semaine. Retourne {"weeks", "generated",
+    "skipped", "failed"}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    stats = {"weeks": len(weeks), "generated": 0, "skipped": 0, "failed": 0}
+    jobs = []
+    with instrument.stage("report.plan", rows=len(weeks)):
+        for iso_year, iso_week in weeks:
+            df_week = store.load_week_trades(iso_year, iso_week)
+            digest = week_digest(df_week)
+            current = _is_current(out_dir, manifest.get(week_label(iso_year, iso_week)), digest)
+            if df_week.empty or current and not force:
+                stats["skipped"] += 1
+            else:
+                jobs.append((iso_year, iso_week, df_week, digest))
+    if on_progress is not None:
+        on_progress(stats)
+
+    digests = {(y, w): d for y, w, _, d in jobs}
+    with instrument.stage("report.render", rows=len(jobs)):
+        for outcome in _render(jobs, out_dir, workers):
+            key = tuple(outcome["week"])
+            if "error" in outcome:
+                stats["failed"] += 1
+                log.warning("rapport %s en échec : %s", week_label(*key), outcome["error"])
+            else:
+                manifest[week_label(*key)] = {**outcome["files"], "digest": digests[key], "generated_at": time.time()}
+                stats["generated"] += 1
+            if on_progress is not None:
+                on_progress(stats)
+    _save_manifest(out_dir, manifest)
+    return stats
+
+
+def _render(jobs, out_dir: str, workers: int = None):
+    """
+    Rend les semaines ; produit {"week", "files"} ou {"week", "error"} au
+    fil des semaines terminées. Plusieurs semaines : pool de processus
+    dans un process Python à part (python -m reports). Un pool créé
+    depuis l'app relancerait le script Streamlit (__main__) dans chaque
+    worker, et fork n'est pas sûr dans un process qui a des threads.
+    """
+    if len(jobs) == 1:
+        # Une semaine : pas de démarrage de processus
+        y, w, df, _ = jobs[0]
+        try:
+            yield {"week": (y, w), "files": write_week(out_dir, df, y, w)}
+        except Exception as exc:
+            yield {"week": (y, w), "error": f"{type(exc).__name__}: {exc}"}
+        return
+    if not jobs:
+        return
+    fd, path = tempfile.mkstemp(dir=out_dir, prefix=".jobs-", suffix=".pkl")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"out_dir": out_dir, "workers": workers, "weeks": [j[:3] for j in jobs]}, f)
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")]))}
+        with subprocess.Popen([sys.executable, "-m", "reports", path], stdout=subprocess.PIPE, text=True, env=env) as proc:
+            seen = set()
+            for line in proc.stdout:
+                outcome = json.loads(line)
+                seen.add(tuple(outcome["week"]))
+                yield outcome
+        for y, w, _, _ in jobs:
+            if (y, w) not in seen:
+                yield {"week": (y, w), "error": f"process de rendu arrêté (code {proc.returncode})"}
+    finally:
+        os.remove(path)
+
+
+def _render_jobs(path: str):
+    """Point d'entrée de python -m reports : rend les semaines du fichier path dans un pool."""
+    with open(path, "rb") as f:
+        job = pickle.load(f)
+    with ProcessPoolExecutor(max_workers=job["workers"]) as pool:
+        futures = {pool.submit(write_week, job["out_dir"], df, y, w): (y, w) for y, w, df in job["weeks"]}
+        for future in as_completed(futures):
+            try:
+                outcome = {"files": future.result()}
+            except Exception as exc:
+                outcome = {"error": f"{type(exc).__name__}: {exc}"}
+            print(json.dumps({"week": futures[future], **outcome}), flush=True)
+
+
+def list_reports(out_dir: str) -> list:
+    """[(libellé, chemin html, chemin csv)] des rapports existants, plus récents d'abord."""
+    reports = []
+    for label, entry in sorted(load_manifest(out_dir).items(), reverse=True):
+        paths = (os.path.join(out_dir, entry["html"]), os.path.join(out_dir, entry["csv"]))
+        if all(os.path.exists(p) for p in paths):
+            reports.append((label, *paths))
+    return reports
+
+
+class ReportJob:
+    """Une génération à la fois, dans un thread de fond ; état lisible par l'UI."""
+
+    def __init__(self, store, out_dir: str, workers: int = None):
+        self.store = store
+        self.out_dir = out_dir
+        self.workers = workers
+        self.stats = None
+        self.error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, weeks, force: bool = False) -> bool:
+        """Lance la génération ; False si une génération est déjà en cours."""
+        with self._lock:
+            if self.running:
+                return False
+            self.stats = {"weeks": len(weeks), "generated": 0, "skipped": 0, "failed": 0}
+            self.error = None
+            self._thread = threading.Thread(
+                target=self._run, args=(list(weeks), force), name="reports", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self, weeks, force: bool):
+        try:
+            with instrument.run("reports"):
+                self.stats = generate_reports(
+                    self.store, weeks, self.out_dir, workers=self.workers, force=force,
+                    on_progress=lambda stats: setattr(self, "stats", dict(stats)),
+                )
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+            log.warning("génération des rapports en échec : %s", exc)
+
+
+if __name__ == "__main__":
+    _render_jobs(sys.argv[1])
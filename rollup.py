@@ -0,0 +1,170 @@
+"""
+Agrégats hebdomadaires matérialisés (rollups) et vues de tendance.
+
+La table des rollups a une ligne par (semaine ISO, paire) : nombre de
+trades, trades pris, Win / Loss / BE des trades pris, sommes et extrêmes
+des scores, somme des RR. Elle est construite une fois avec le
+DataFrame des trades, puis tenue à jour par deltas : un ajout ajoute les
+contributions des nouvelles lignes, une édition pris / résultat retire
+les anciennes contributions et ajoute les nouvelles (score, semaine et
+paire ne changent pas, les extrêmes restent donc exacts).
+
+Les vues multi-semaines (weekly, trend) ne lisent que les rollups :
+quelques lignes par semaine, quel que soit le nombre de trades.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+KEYS = ["week", "pair"]
+COUNTS = ("trades", "taken", "win", "loss", "be", "score_n", "rr_n")
+SUMS = COUNTS + ("score_sum", "rr_sum")
+EXTREMES = {"score_min": np.fmin, "score_max": np.fmax}
+
+
+def _contributions(df: pd.DataFrame) -> dict:
+    """Valeurs de chaque trade daté, prêtes à être sommées par (semaine, paire)."""
+    df = df[df["iso_year"].notna().to_numpy()]
+    taken = (df["taken"] == "Oui").to_numpy()
+    result = df["result"]
+    score = df["score_percent"].to_numpy(dtype=float)
+    rr = df["rr"].to_numpy(dtype=float)
+    return {
+        "week": df["iso_year"].to_numpy(dtype=np.int64) * 100 + df["iso_week"].to_numpy(dtype=np.int64),
+        "pair": df["pair"],
+        "trades": np.ones(len(df)),
+        "taken": taken,
+        "win": taken & (result == "Win").to_numpy(),
+        "loss": taken & (result == "Loss").to_numpy(),
+        "be": taken & (result == "BE").to_numpy(),
+        "score_n": ~np.isnan(score),
+        "rr_n": ~np.isnan(rr),
+        "score_sum": np.nan_to_num(score),
+        "rr_sum": np.nan_to_num(rr),
+        "score": score,
+    }
+
+
+def _aggregate(df: pd.DataFrame) -> pd.DataFrame:
+    rows = _contributions(df)
+    # Clé entière (semaine, code de paire) : sommes par bincount, sans groupby sur du texte
+    pair_codes, pairs = pd.factorize(rows["pair"].astype(object).fillna(""))
+    n_pairs = max(len(pairs), 1)
+    group, keys = pd.factorize(rows["week"] * n_pairs + pair_codes)
+    out = {name: np.bincount(group, weights=rows[name], minlength=len(keys)) for name in SUMS}
+    score = pd.Series(rows["score"]).groupby(group)
+    out["score_min"] = score.min().reindex(range(len(keys))).to_numpy()
+    out["score_max"] = score.max().reindex(range(len(keys))).to_numpy()
+    index = pd.MultiIndex.from_arrays(
+        [keys // n_pairs, np.asarray(pairs, dtype=object)[keys % n_pairs]], names=KEYS
+    )
+    return pd.DataFrame(out, index=index).astype({c: np.int64 for c in COUNTS}).sort_index()
+
+
+def build_rollups(df: pd.DataFrame) -> pd.DataFrame:
+    """Table des rollups (index (week, pair), week = année * 100 + semaine)."""
+    with instrument.stage("rollup.build", rows=len(df)):
+        return _aggregate(df)
+
+
+def apply_append(rollups: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Rollups après ajout des trades new (nouvelle table, l'ancienne est intacte)."""
+    return merge(rollups, _aggregate(new))
+
+
+def merge(rollups: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """Rollups de deux ensembles de trades disjoints (ex. feuille + archive)."""
+    if delta.empty:
+        return rollups
+    out = rollups[list(SUMS)].add(delta[list(SUMS)], fill_value=0)
+    for col, combine in EXTREMES.items():
+        # fmin / fmax : une valeur manquante d'un côté garde celle de l'autre
+        out[col] = combine(rollups[col].reindex(out.index), delta[col].reindex(out.index))
+    return out.astype({c: np.int64 for c in COUNTS})
+
+
+def apply_change(rollups: pd.DataFrame, old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Rollups après édition pris / résultat : lignes old remplacées par new."""
+    delta = _aggregate(new)[list(SUMS)].sub(_aggregate(old)[list(SUMS)], fill_value=0)
+    out = rollups.copy()
+    out[list(SUMS)] = rollups[list(SUMS)].add(delta, fill_value=0).loc[rollups.index]
+    return out.astype({c: np.int64 for c in COUNTS})
+
+
+# ──────────────────────────────
+# Vues
+# ──────────────────────────────
+def _mondays(weeks) -> pd.DatetimeIndex:
+    """Lundi de chaque semaine ISO (clés année * 100 + semaine)."""
+    return pd.DatetimeIndex(pd.to_datetime([f"{w // 100}-{w % 100}-1" for w in weeks], format="%G-%V-%u"))
+
+
+def _week_key(day: pd.Timestamp) -> int:
+    iso = day.isocalendar()
+    return iso[0] * 100 + iso[1]
+
+
+def _ratios(sums: pd.DataFrame) -> pd.DataFrame:
+    evaluated = sums["win"] + sums["loss"] + sums["be"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "winrate": sums["win"] / evaluated.where(evaluated > 0) * 100,
+            "score_mean": sums["score_sum"] / sums["score_n"].where(sums["score_n"] > 0),
+            "rr_mean": sums["rr_sum"] / sums["rr_n"].where(sums["rr_n"] > 0),
+        }, index=sums.index)
+
+
+def weekly(rollups: pd.DataFrame, pairs=None) -> pd.DataFrame:
+    """
+    Une ligne par semaine calendaire (lundi de la semaine ISO en index),
+    semaines sans trade comprises, pour les paires demandées (toutes par défaut).
+    """
+    if pairs:
+        rollups = rollups[rollups.index.get_level_values("pair").isin(list(pairs))]
+    if rollups.empty:
+        columns = [*SUMS, *EXTREMES, "winrate", "score_mean", "rr_mean"]
+        return pd.DataFrame({c: pd.Series(dtype=np.int64 if c in COUNTS else float) for c in columns})
+    g = rollups.groupby(level="week")
+    out = g[list(SUMS)].sum()
+    out["score_min"] = g["score_min"].min()
+    out["score_max"] = g["score_max"].max()
+    out.index = _mondays(out.index)
+    calendar = pd.date_range(out.index.min(), out.index.max(), freq="W-MON")
+    out = out.reindex(calendar)
+    out[list(SUMS)] = out[list(SUMS)].fillna(0)
+    out = out.astype({c: np.int64 for c in COUNTS})
+    return out.join(_ratios(out))
+
+
+def trend(rollups: pd.DataFrame, last_weeks: int, window: int, pairs=None, until=None) -> pd.DataFrame:
+    """
+    Les last_weeks dernières semaines (jusqu'à la semaine de until, par
+    défaut aujourd'hui ou la dernière semaine ayant des trades si elle est
+    après) : valeurs de la semaine et moyennes glissantes sur window
+    semaines (winrate et score pondérés par les trades).
+    """
+    with instrument.stage("rollup.trend", rows=len(rollups)):
+        if until is None:
+            until = pd.Timestamp(date.today())
+            if len(rollups):
+                until = max(until, _mondays([rollups.index.get_level_values("week").max()])[0])
+        end = pd.Timestamp(until).normalize()
+        end -= pd.Timedelta(days=end.weekday())
+        calendar = pd.date_range(end=end, periods=last_weeks + window - 1, freq="W-MON")
+        # Seules les semaines affichées sont regroupées
+        keys = rollups.index.get_level_values("week")
+        rollups = rollups[(keys >= _week_key(calendar[0])) & (keys <= _week_key(calendar[-1]))]
+        weeks = weekly(rollups, pairs)
+        weeks = weeks.reindex(calendar)
+        weeks[list(SUMS)] = weeks[list(SUMS)].fillna(0)
+        weeks = weeks.astype({c: np.int64 for c in COUNTS})
+        rolled = _ratios(weeks[list(SUMS)].rolling(window, min_periods=1).sum())
+        out = weeks.assign(
+            winrate_rolling=rolled["winrate"],
+            score_mean_rolling=rolled["score_mean"],
+            trades_rolling=weeks["trades"].rolling(window, min_periods=1).mean(),
+        )
+        return out.iloc[window - 1:]
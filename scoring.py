@@ -0,0 +1,252 @@
+"""
+Modèle de score des setups, sous forme de table de règles.
+
+Chaque règle classe un setup dans une de ses issues (points, note).
+Le moteur calcule les codes de toutes les règles en une passe vectorisée
+sur un DataFrame : le score est une somme de lookups numpy, et les notes
+ne sont construites qu'une fois par combinaison d'issues distincte.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NO_TRADE_THRESHOLD = 80
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    # Une issue = (points, note ou None) ; l'index de l'issue est le code
+    outcomes: tuple
+    # DataFrame de setups -> codes (np.ndarray d'entiers) des issues
+    classify: Callable[[pd.DataFrame], np.ndarray]
+    # Pour les règles à choix : question et options affichées dans l'UI
+    question: Optional[str] = None
+    choices: tuple = field(default_factory=tuple)
+
+    @property
+    def points(self) -> np.ndarray:
+        return np.array([p for p, _ in self.outcomes], dtype=np.int64)
+
+
+def _factorized(values: pd.Series, fn):
+    """Applique fn aux valeurs distinctes seulement, puis diffuse."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.asarray([fn(u) for u in uniques], dtype=np.int64)[codes]
+
+
+def choice_rule(name: str, question: str, options: Sequence[tuple]) -> Rule:
+    """Règle à choix unique : options = [(libellé, points, note), ...]."""
+    labels = tuple(o[0] for o in options)
+    index = {label: i for i, label in enumerate(labels)}
+
+    def classify(df):
+        def code(v):
+            if v not in index:
+                raise ValueError(f"{name}: option inconnue {v!r}")
+            return index[v]
+        return _factorized(df[name], code)
+
+    return Rule(
+        name=name,
+        outcomes=tuple((p, n) for _, p, n in options),
+        classify=classify,
+        question=question,
+        choices=labels,
+    )
+
+
+# ──────────────────────────────
+# Règles spéciales
+# ──────────────────────────────
+RR_BANDS = (2, 3)
+
+
+def _rr_rule() -> Rule:
+    def classify(df):
+        rr = pd.to_numeric(df["rr"], errors="raise").to_numpy(dtype=float)
+        return np.searchsorted(np.asarray(RR_BANDS, dtype=float), rr, side="right")
+
+    return Rule(
+        name="rr",
+        outcomes=((0, "RR < 1:2 (0)"), (5, "RR correct (+5)"), (10, "RR excellent (+10)")),
+        classify=classify,
+    )
+
+
+SESSIONS = ("Tokyo", "Sydney", "London", "New York", "Autre")
+SESSION_OUTCOMES = (
+    (5, "Session London (+5)"),
+    (5, "Session New York (+5)"),
+    (0, "Tokyo OK pour JPY (0)"),
+    (0, "Sydney OK pour AUD/NZD (0)"),
+    (-5, "Session Tokyo (-5)"),
+    (-5, "Session Sydney (-5)"),
+    (0, None),
+)
+
+
+def _session_code(session: str, pair: str) -> int:
+    pair_upper = pair.upper()
+    if session == "London":
+        return 0
+    if session == "New York":
+        return 1
+    if session == "Tokyo":
+        return 2 if "JPY" in pair_upper else 4
+    if session == "Sydney":
+        return 3 if ("AUD" in pair_upper or "NZD" in pair_upper) else 5
+    return 6
+
+
+def _session_rule() -> Rule:
+    def classify(df):
+        # Table (session x paire) calculée sur les valeurs distinctes
+        s_codes, sessions = pd.factorize(df["session"], use_na_sentinel=False)
+        p_codes, pairs = pd.factorize(df["pair"], use_na_sentinel=False)
+        table = np.array(
+            [[_session_code(str(s), str(p)) for p in pairs] for s in sessions],
+            dtype=np.int64,
+        ).reshape(len(sessions), len(pairs))
+        return table[s_codes, p_codes]
+
+    return Rule(
+        name="session",
+        outcomes=SESSION_OUTCOMES,
+        classify=classify,
+        question="Session du trade",
+        choices=SESSIONS,
+    )
+
+
+MS_HTF_MAX = 5
+
+
+def _ms_htf_rule() -> Rule:
+    def classify(df):
+        ms = pd.to_numeric(df["ms_htf"], errors="raise").to_numpy(dtype=np.int64)
+        if ((ms < 0) | (ms > MS_HTF_MAX)).any():
+            raise ValueError(f"ms_htf doit être entre 0 et {MS_HTF_MAX}")
+        return ms
+
+    return Rule(
+        name="ms_htf",
+        outcomes=tuple(
+            (n, f"Market structure HTF alignée (+{n})" if n > 0 else None)
+            for n in range(MS_HTF_MAX + 1)
+        ),
+        classify=classify,
+        question="La structure de marché HTF (H4/Daily/Weekly) est-elle propre et alignée avec ton trade ?",
+    )
+
+
+# ──────────────────────────────
+# Table des règles (ordre = ordre des notes)
+# ──────────────────────────────
+RULES = (
+    choice_rule("sync_option", "Quels timeframes sont alignés (bullish ou bearish) ?", [
+        ("Aucun vraiment aligné", 0, "Contexte HTF pas aligné (0)"),
+        ("H4 + Daily alignés", 10, "H4 + Daily alignés (+10)"),
+        ("Daily + Weekly alignés", 15, "Daily + Weekly alignés (+15)"),
+        ("H4 + Daily + Weekly alignés", 20, "H4 + Daily + Weekly alignés (+20)"),
+    ]),
+    choice_rule("aoi_choice", "Où se situe le trade par rapport à tes AOI Daily / Weekly ?", [
+        ("Pas vraiment sur une AOI", 0, "Pas sur une AOI (0)"),
+        ("Sur une AOI Daily uniquement", 10, "Sur AOI Daily (+10)"),
+        ("Sur une AOI Weekly uniquement", 15, "Sur AOI Weekly (+15)"),
+        ("Sur une AOI alignée Daily + Weekly (même zone)", 20, "AOI Daily + Weekly alignées (+20)"),
+    ]),
+    choice_rule("aoi_recent", "Le prix a-t-il touché une AOI récemment (sans forcément s'y installer) ?", [
+        ("Non", 0, None),
+        ("Oui", 5, "Touché AOI récemment (+5)"),
+    ]),
+    choice_rule("hs_quality", "Qualité du pattern Head & Shoulders (dans le sens du trade)", [
+        ("Pas vraiment un H&S", 0, None),
+        ("H&S présent mais pas super clean", 10, "H&S correct (+10)"),
+        ("H&S très propre", 15, "H&S très propre (+15)"),
+    ]),
+    choice_rule("neckline_break", "Cassure de la neckline", [
+        ("Cassure molle / discutable", 3, "Cassure moyenne (+3)"),
+        ("Cassure nette avec impulsion", 5, "Cassure nette (+5)"),
+    ]),
+    choice_rule("neckline_retest", "Retest de la neckline", [
+        ("Pas de vrai retest", 0, None),
+        ("Retest clair de la neckline", 3, "Retest (+3)"),
+    ]),
+    choice_rule("cont_pattern", "Continuation pattern pour l'entrée (tes patterns de continuation)", [
+        ("Pas de pattern clair", 0, None),
+        ("Pattern présent mais moyen", 3, "Pattern de continuation moyen (+3)"),
+        ("Pattern de continuation très propre", 5, "Pattern de continuation très propre (+5)"),
+    ]),
+    choice_rule("ema50_align", "Alignement avec l'EMA 50 (selon les timeframes)", [
+        ("Contre EMA 50 sur la plupart des TF", -5, "Contre EMA 50 globalement (-5)"),
+        ("Aligné seulement sur la TF d'entrée (≤ M30)", 3, "EMA 50 alignée seulement sur la TF d'entrée (+3)"),
+        ("Aligné sur H1", 5, "EMA 50 alignée sur H1 (+5)"),
+        ("Aligné sur H4 ou TF plus haute", 8, "EMA 50 alignée sur H4 / HTF (+8)"),
+        ("Aligné sur plusieurs TF (entrée + H1/H4)", 10, "EMA 50 alignée sur plusieurs TF (+10)"),
+    ]),
+    _rr_rule(),
+    choice_rule("plan_respecte", "Lien avec ton plan de début de semaine", [
+        ("Hors plan / improvisé", 0, "Hors plan (0)"),
+        ("Dans une paire intéressante mais pas setup principal", 10, "Dans une paire intéressante (+10)"),
+        ("Pile dans le scénario principal du plan", 20, "Dans le scénario du plan (+20)"),
+    ]),
+    _session_rule(),
+    _ms_htf_rule(),
+)
+
+RULES_BY_NAME = {r.name: r for r in RULES}
+
+# Colonnes d'entrée attendues par le moteur
+SETUP_FIELDS = tuple(r.name for r in RULES) + ("pair",)
+
+
+# ──────────────────────────────
+# Moteur
+# ──────────────────────────────
+def rule_codes(df: pd.DataFrame, rules=RULES) -> np.ndarray:
+    """Matrice (n_setups, n_règles) des issues de chaque règle."""
+    missing = [c for c in SETUP_FIELDS if c not in df.columns]
+    if missing:
+        raise KeyError(f"Colonnes manquantes : {missing}")
+    if not len(df):
+        return np.empty((0, len(rules)), dtype=np.int64)
+    return np.column_stack([r.classify(df) for r in rules])
+
+
+def score_frame(df: pd.DataFrame, rules=RULES, with_notes: bool = True) -> pd.DataFrame:
+    """
+    Score vectorisé d'un DataFrame de setups (une ligne par setup).
+    Retourne un DataFrame aligné sur df avec les colonnes score et notes
+    (tuple de notes, dans l'ordre des règles).
+    """
+    codes = rule_codes(df, rules)
+    score = np.zeros(len(df), dtype=np.int64)
+    for j, rule in enumerate(rules):
+        score += rule.points[codes[:, j]]
+    out = pd.DataFrame({"score": score}, index=df.index)
+    if not with_notes:
+        return out
+
+    # Clé mixte (base = nb d'issues de chaque règle) : une entrée par combinaison
+    key = np.zeros(len(df), dtype=np.int64)
+    for j, rule in enumerate(rules):
+        key = key * len(rule.outcomes) + codes[:, j]
+    _, first_rows, inverse = np.unique(key, return_index=True, return_inverse=True)
+    combo_notes = np.empty(len(first_rows), dtype=object)
+    for i, row in enumerate(first_rows):
+        combo_notes[i] = tuple(
+            note for j, rule in enumerate(rules)
+            if (note := rule.outcomes[codes[row, j]][1]) is not None
+        )
+    out["notes"] = combo_notes[inverse]
+    return out
+
+
+def score_setup(setup: dict, rules=RULES):
+    """Score d'un seul setup : (score, liste des notes)."""
+    res = score_frame(pd.DataFrame([setup]), rules)
+    return int(res["score"].iat[0]), list(res["notes"].iat[0])
+
@@ -0,0 +1,272 @@
+"""
+Recherche dans le journal : index inversé sur les mots des commentaires,
+index de facettes (pair, direction, session, timeframe, taken, result) et
+scores / RR triés pour les plages de valeurs.
+
+Requête : termes séparés par des espaces (ET implicite), AND, OR, NOT et
+parenthèses, par exemple
+
+    retest AND XAUUSD AND Loss AND score>=80
+    (London OR "New York") NOT BE rr>=2
+
+Un terme est :
+  - champ:valeur (pair:XAUUSD, result:Loss, session:"New York"…) ;
+  - score ou rr suivi de >=, <=, >, <, = et d'un nombre ;
+  - sinon une valeur de facette ou un mot du commentaire (sans casse ni
+    accents), l'un ou l'autre.
+
+Chaque terme est lu dans l'index (liste des positions des trades) et
+devient un masque de bits ; les opérateurs combinent ces masques, le
+DataFrame n'est jamais parcouru. L'index est construit une fois par frame, puis
+étendu aux lignes ajoutées et mis à jour aux éditions pris / résultat
+(copie à l'écriture, comme le cache).
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+FACETS = ("pair", "direction", "session", "timeframe", "taken", "result")
+RANGES = {"score": "score_percent", "rr": "rr"}
+TEXT_FIELDS = ("commentaire", "comment", "texte")
+
+_TOKEN = re.compile(r'\(|\)|"[^"]*"?|[^\s()"]+(?:"[^"]*"?)?')
+_WORD = re.compile(r"\w+")
+_RANGE = re.compile(r"(score|rr)(>=|<=|>|<|=)(-?\d+(?:[.,]\d+)?)", re.IGNORECASE)
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def words(text: str) -> list:
+    """Mots d'un texte, en minuscules et sans accents."""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    return _WORD.findall("".join(ch for ch in text if not unicodedata.combining(ch)))
+
+
+def _key(value) -> str:
+    return str(value).casefold()
+
+
+def _groups(codes: np.ndarray, offset: int):
+    """(code, positions triées) de chaque code >= 0."""
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    for chunk in np.split(order, bounds):
+        if len(chunk) and codes[chunk[0]] >= 0:
+            yield int(codes[chunk[0]]), chunk.astype(np.int64) + offset
+
+
+def _extend(postings: dict, added: dict) -> dict:
+    """Nouvelles listes en fin de celles existantes (positions croissantes)."""
+    out = dict(postings)
+    for key, ids in added.items():
+        out[key] = np.concatenate([out[key], ids]) if key in out else ids
+    return out
+
+
+# ──────────────────────────────
+# Requêtes
+# ──────────────────────────────
+class _Parser:
+    def __init__(self, query: str):
+        self.tokens = _TOKEN.findall(query)
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.i += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("requête vide")
+        node = self.expr()
+        if self.peek() is not None:
+            raise ValueError(f"« {self.peek()} » inattendu")
+        return node
+
+    def expr(self):
+        node = self.and_expr()
+        while self.peek() == "OR":
+            self.take()
+            node = ("or", node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            node = ("and", node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        if self.peek() == "NOT":
+            self.take()
+            return ("not", self.not_expr())
+        return self.atom()
+
+    def atom(self):
+        token = self.take()
+        if token is None or token in ("AND", "OR", ")"):
+            raise ValueError("terme manquant" if token is None else f"« {token} » inattendu")
+        if token == "(":
+            node = self.expr()
+            if self.take() != ")":
+                raise ValueError("parenthèse non fermée")
+            return node
+        return _term(token)
+
+
+def _unquote(value: str) -> str:
+    return value[1:].rstrip('"') if value.startswith('"') else value
+
+
+def _term(token: str):
+    match = _RANGE.fullmatch(token)
+    if match:
+        field, op, number = match.groups()
+        return ("range", RANGES[field.lower()], op, float(number.replace(",", ".")))
+    field, sep, value = token.partition(":")
+    if sep and not token.startswith('"'):
+        field = field.lower()
+        value = _unquote(value)
+        if not value:
+            raise ValueError(f"valeur manquante après {field}:")
+        if field in FACETS:
+            return ("facet", field, _key(value))
+        if field in TEXT_FIELDS:
+            return ("text", tuple(words(value)))
+        raise ValueError(f"champ inconnu : {field} (attendu : {', '.join(FACETS + TEXT_FIELDS[:1])})")
+    value = _unquote(token)
+    return ("any", _key(value), tuple(words(value)))
+
+
+def parse(query: str):
+    """Arbre de la requête ; ValueError si elle est invalide."""
+    return _Parser(query).parse()
+
+
+# ──────────────────────────────
+# Index
+# ──────────────────────────────
+class SearchIndex:
+    """Listes de positions (triées) par mot, par valeur de facette, et valeurs triées."""
+
+    def __init__(self, n: int, terms: dict, facets: dict, ranges: dict):
+        self.n = n
+        self.terms = terms
+        self.facets = facets
+        self.ranges = ranges
+
+    @classmethod
+    def build(cls, df: pd.DataFrame) -> "SearchIndex":
+        empty = {col: (np.empty(0, dtype=np.float32), _EMPTY) for col in RANGES.values()}
+        with instrument.stage("search.build", rows=len(df)):
+            return cls(0, {}, {col: {} for col in FACETS}, empty).extended(df)
+
+    def extended(self, new: pd.DataFrame) -> "SearchIndex":
+        """Index après ajout des lignes new (positions à la suite) ; l'ancien est intact."""
+        offset = self.n
+        terms = {}
+        if "commentaire" in new.columns:
+            # Un découpage par commentaire distinct, diffusé à ses lignes
+            codes, uniques = pd.factorize(new["commentaire"].fillna("").to_numpy(dtype=object))
+            for code, ids in _groups(codes, offset):
+                for word in set(words(uniques[code])):
+                    terms.setdefault(word, []).append(ids)
+        terms = {w: np.sort(np.concatenate(parts)) if len(parts) > 1 else parts[0] for w, parts in terms.items()}
+
+        facets = dict(self.facets)
+        for col in FACETS:
+            if col not in new.columns:
+                continue
+            column = new[col]
+            added = {}
+            for code, ids in _groups(column.cat.codes.to_numpy(), offset):
+                key = _key(column.cat.categories[code])
+                added[key] = np.sort(np.concatenate([added[key], ids])) if key in added else ids
+            facets[col] = _extend(facets[col], added)
+
+        ranges = dict(self.ranges)
+        for col, (values, ids) in self.ranges.items():
+            if col not in new.columns:
+                continue
+            new_values = new[col].to_numpy(dtype=np.float32)
+            keep = np.flatnonzero(~np.isnan(new_values))
+            order = keep[np.argsort(new_values[keep], kind="stable")]
+            at = np.searchsorted(values, new_values[order], side="right")
+            ranges[col] = (np.insert(values, at, new_values[order]), np.insert(ids, at, order + offset))
+
+        return SearchIndex(offset + len(new), _extend(self.terms, terms), facets, ranges)
+
+    def with_changes(self, col: str, positions, old, new) -> "SearchIndex":
+        """Index après édition de la facette col aux positions données (old -> new)."""
+        facet = dict(self.facets[col])
+        for pos, before, after in zip(positions, old, new):
+            if pd.isna(before) and pd.isna(after) or before == after:
+                continue
+            if not pd.isna(before) and _key(before) in facet:
+                ids = facet[_key(before)]
+                facet[_key(before)] = ids[ids != pos]
+            if not pd.isna(after):
+                ids = facet.get(_key(after), _EMPTY)
+                facet[_key(after)] = np.insert(ids, np.searchsorted(ids, pos), pos)
+        return SearchIndex(self.n, self.terms, {**self.facets, col: facet}, self.ranges)
+
+    # ── évaluation ────────────────────────────────────────
+    def _mask(self, ids) -> np.ndarray:
+        mask = np.zeros(self.n, dtype=bool)
+        mask[ids] = True
+        return mask
+
+    def _text(self, tokens: tuple) -> np.ndarray:
+        mask = self._mask(self.terms.get(tokens[0], _EMPTY)) if tokens else self._mask(_EMPTY)
+        for token in tokens[1:]:
+            mask &= self._mask(self.terms.get(token, _EMPTY))
+        return mask
+
+    def _range(self, col: str, op: str, number: float) -> np.ndarray:
+        values, ids = self.ranges[col]
+        lo, hi = 0, len(values)
+        if op in (">=", "="):
+            lo = np.searchsorted(values, number, side="left")
+        elif op == ">":
+            lo = np.searchsorted(values, number, side="right")
+        if op in ("<=", "="):
+            hi = np.searchsorted(values, number, side="right")
+        elif op == "<":
+            hi = np.searchsorted(values, number, side="left")
+        return self._mask(ids[lo:hi])
+
+    def _eval(self, node) -> np.ndarray:
+        """Masque des lignes (un booléen par position) qui satisfont node."""
+        kind = node[0]
+        if kind == "and":
+            return self._eval(node[1]) & self._eval(node[2])
+        if kind == "or":
+            return self._eval(node[1]) | self._eval(node[2])
+        if kind == "not":
+            return ~self._eval(node[1])
+        if kind == "facet":
+            return self._mask(self.facets[node[1]].get(node[2], _EMPTY))
+        if kind == "range":
+            return self._range(*node[1:])
+        if kind == "text":
+            return self._text(node[1])
+        # Mot seul : valeur d'une facette ou mot du commentaire
+        mask = self._text(node[2])
+        for facet in self.facets.values():
+            if node[1] in facet:
+                mask[facet[node[1]]] = True
+        return mask
+
+    def evaluate(self, node) -> np.ndarray:
+        """Positions triées des lignes qui satisfont l'arbre node (voir parse)."""
+        return np.flatnonzero(self._eval(node))
@@ -0,0 +1,224 @@
+"""
+Pool de connexions Sheets partagé par tout le processus.
+
+Toutes les sessions Streamlit passent par le même pool :
+  - un seau à jetons par quota Sheets (lectures / écritures par minute) ;
+  - un nombre borné de connexions (un client gspread chacune), où une
+    écriture en attente passe devant les lectures du dashboard ;
+  - les lectures identiques simultanées sont fusionnées en une requête ;
+  - les erreurs transitoires (429, 5xx) sont retentées avec backoff
+    exponentiel et jitter avant d'être remontées. Un ajout ou une
+    suppression de lignes / colonnes n'est retenté que sur 429 (requête refusée) : après un
+    5xx il a pu être appliqué, c'est à la file d'écriture de vérifier
+    (voir writebehind.py) plutôt que de dupliquer des lignes.
+"""
+import copy
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import instrument
+
+log = logging.getLogger(__name__)
+
+READ_METHODS = ("row_values", "col_values", "get_all_values", "get", "batch_get")
+WRITE_METHODS = (
+    "append_row", "append_rows", "batch_update", "update", "update_cell", "add_cols", "clear",
+    "update_dimensions",
+)
+# Pas idempotentes : rejouées seulement si la requête a été refusée (429)
+NON_IDEMPOTENT_METHODS = ("append_row", "append_rows", "add_cols", "update_dimensions")
+
+# Quotas par défaut de l'API Sheets (requêtes / minute / utilisateur)
+READ_PER_MINUTE = 60
+WRITE_PER_MINUTE = 60
+TRANSIENT_CODES = (429, 500, 502, 503, 504)
+
+
+def error_code(exc):
+    """Code HTTP d'une erreur d'API (gspread.APIError, QuotaExceededError…)."""
+    code = getattr(exc, "code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(exc) -> bool:
+    return error_code(exc) in TRANSIENT_CODES
+
+
+class TokenBucket:
+    """per_minute jetons par minute, au plus burst d'avance (None = illimité)."""
+
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.capacity = float(burst or per_minute or 0)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Prend un jeton, en attendant si besoin ; retourne le temps attendu (s)."""
+        if not self.per_minute:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.per_minute / 60)
+            self._stamp = now
+            # Jeton réservé tout de suite : les appelants suivants attendent leur tour
+            self._tokens -= 1
+            wait = -self._tokens * 60 / self.per_minute if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SheetPool:
+    """
+    factory() ouvre une connexion (worksheet) ; jusqu'à size connexions sont
+    ouvertes à la demande, la première compris : créer le pool ne fait
+    aucun appel réseau. Les écritures en attente sont servies avant les
+    lectures.
+    """
+
+    def __init__(self, factory, size: int = 4, read_per_minute=READ_PER_MINUTE,
+                 write_per_minute=WRITE_PER_MINUTE, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 32.0):
+        self.factory = factory
+        self.size = max(1, size)
+        self.buckets = {"read": TokenBucket(read_per_minute), "write": TokenBucket(write_per_minute)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = Counter()
+
+        self._handles = [None]
+        self._free = [0]
+        self._writers_waiting = 0
+        self._cond = threading.Condition()
+        self._flights = {}
+        # Incrémenté à chaque écriture : une lecture lancée après ne rejoint
+        # pas une lecture en vol partie avant
+        self._generation = 0
+        self._flights_lock = threading.Lock()
+        # primary (hors bail) et le slot 0 peuvent ouvrir la même connexion
+        self._open_lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self._handle(0)
+
+    # ── connexions ────────────────────────────────────────
+    def _lease(self, kind: str) -> int:
+        with self._cond:
+            if kind == "write":
+                self._writers_waiting += 1
+            try:
+                while True:
+                    can_go = kind == "write" or not self._writers_waiting
+                    if can_go and self._free:
+                        return self._free.pop(0)
+                    if can_go and len(self._handles) < self.size:
+                        self._handles.append(None)
+                        return len(self._handles) - 1
+                    self._cond.wait()
+            finally:
+                if kind == "write":
+                    self._writers_waiting -= 1
+
+    def _release(self, i: int):
+        with self._cond:
+            self._free.append(i)
+            self._free.sort()
+            self._cond.notify_all()
+
+    def _handle(self, i: int):
+        if self._handles[i] is None:
+            with self._open_lock:
+                if self._handles[i] is None:
+                    self._handles[i] = self.factory()
+        return self._handles[i]
+
+    # ── appels ────────────────────────────────────────────
+    def call(self, method: str, *args, **kwargs):
+        if method in WRITE_METHODS:
+            try:
+                return self._dispatch("write", method, args, kwargs)
+            finally:
+                with self._flights_lock:
+                    self._generation += 1
+        key = (method, repr(args), repr(sorted(kwargs.items())), self._generation)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self.stats["coalesced"] += 1
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+        try:
+            flight.result = self._dispatch("read", method, args, kwargs)
+            return flight.result
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _dispatch(self, kind: str, method: str, args, kwargs):
+        attempt = 0
+        while True:
+            waited = self.buckets[kind].acquire()
+            if waited:
+                self.stats["throttled_s"] += waited
+            i = self._lease(kind)
+            try:
+                self.stats[kind] += 1
+                instrument.api_call(method)
+                return getattr(self._handle(i), method)(*args, **kwargs)
+            except Exception as exc:
+                retryable = is_transient(exc) and (
+                    method not in NON_IDEMPOTENT_METHODS or error_code(exc) == 429
+                )
+                if not retryable or attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                log.warning("Sheets %s: %s, nouvel essai dans %.1f s", method, exc, delay)
+                attempt += 1
+            finally:
+                self._release(i)
+            with instrument.stage("sheets.backoff"):
+                time.sleep(delay)
+
+
+class PooledWorksheet:
+    """Worksheet dont les appels API passent par un SheetPool."""
+
+    def __init__(self, pool: SheetPool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        if name in READ_METHODS or name in WRITE_METHODS:
+            return lambda *args, **kwargs: self.pool.call(name, *args, **kwargs)
+        return getattr(self.pool.primary, name)
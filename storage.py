@@ -0,0 +1,436 @@
+"""
+Backends de stockage de la feuille des trades.
+
+Toute l'app parle à un objet « worksheet » avec le sous-ensemble de
+l'API gspread qu'elle utilise (row_values, col_values, get_all_values,
+get, batch_get, append_row(s), batch_update, update, add_cols, clear),
+plus update_dimensions : requêtes de structure (deleteDimension,
+moveDimension, insertDimension, appendDimension) de
+spreadsheets.batchUpdate, envoyées en un appel.
+Trois implémentations :
+  - gsheets : la vraie feuille Google Sheets (gspread) ;
+  - sqlite  : une feuille locale persistée dans un fichier SQLite ;
+  - memory  : une feuille en mémoire, avec latence et erreurs de quota
+              simulées, pour tourner et mesurer sans réseau.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import instrument
+from a1 import a1_range_to_grid_range, rowcol_to_a1
+from sheetpool import READ_PER_MINUTE, WRITE_PER_MINUTE, PooledWorksheet, SheetPool
+from trade_store import TradeStore
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+BACKENDS = ("gsheets", "sqlite", "memory")
+
+# Méthodes qui font un appel à l'API Sheets
+API_METHODS = (
+    "row_values", "col_values", "get_all_values", "get", "batch_get",
+    "append_row", "append_rows", "batch_update", "update", "update_cell", "add_cols", "clear",
+    "update_dimensions",
+)
+
+
+class QuotaExceededError(Exception):
+    """Équivalent local d'une réponse 429 de l'API Sheets."""
+
+    code = 429
+
+
+def _cell(value) -> str:
+    """Valeur telle que Sheets la renvoie (3.0 -> "3")."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class GridWorksheet:
+    """
+    Feuille en mémoire compatible gspread. Les sous-classes ajoutent la
+    persistance (_persist) ou la simulation réseau (_call).
+    """
+
+    title = "Sheet1"
+
+    def __init__(self, rows=None, col_count: int = 26):
+        self._rows = [[_cell(v) for v in r] for r in rows or []]
+        self.col_count = col_count
+        self.calls = Counter()
+        self._lock = threading.RLock()
+
+    # ── hooks ─────────────────────────────────────────────
+    def _call(self, name: str):
+        self.calls[name] += 1
+
+    def _persist(self, first_row: int, last_row: int):
+        """Lignes first_row..last_row (1-indexées) modifiées."""
+
+    # ── utilitaires ───────────────────────────────────────
+    @property
+    def row_count(self) -> int:
+        return max(1000, len(self._rows))
+
+    def _grid(self, range_name: str):
+        g = a1_range_to_grid_range(range_name.split("!")[-1])
+        width = max((len(r) for r in self._rows), default=0)
+        return (
+            g.get("startRowIndex", 0),
+            g.get("endRowIndex", len(self._rows)),
+            g.get("startColumnIndex", 0),
+            g.get("endColumnIndex", width),
+        )
+
+    def _read(self, range_name: str):
+        r0, r1, c0, c1 = self._grid(range_name)
+        out = []
+        for row in self._rows[r0:r1]:
+            cells = row[c0:c1]
+            # Comme l'API : cellules vides de fin de ligne et lignes vides de fin omises
+            while cells and cells[-1] == "":
+                cells.pop()
+            out.append(cells)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def _set(self, row: int, col: int, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = _cell(value)
+
+    def _write(self, range_name: str, values):
+        r0, _, c0, _ = self._grid(range_name)
+        for i, vals in enumerate(values):
+            for j, v in enumerate(vals):
+                self._set(r0 + i + 1, c0 + j + 1, v)
+        if values:
+            self._persist(r0 + 1, r0 + len(values))
+
+    # ── lecture ───────────────────────────────────────────
+    def row_values(self, row: int, **kwargs):
+        self._call("row_values")
+        with self._lock:
+            values = self._read(f"{row}:{row}")
+        return values[0] if values else []
+
+    def col_values(self, col: int, **kwargs):
+        self._call("col_values")
+        with self._lock:
+            values = [r[col - 1] if col <= len(r) else "" for r in self._rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        with self._lock:
+            return [list(r) for r in self._read(f"1:{max(len(self._rows), 1)}")]
+
+    def get(self, range_name=None, **kwargs):
+        self._call("get")
+        with self._lock:
+            return self._read(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self._call("batch_get")
+        with self._lock:
+            return [self._read(r) for r in ranges]
+
+    # ── écriture ──────────────────────────────────────────
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        with self._lock:
+            while self._rows and not any(self._rows[-1]):
+                self._rows.pop()
+            start = len(self._rows) + 1
+            self._rows.extend([_cell(v) for v in row] for row in values)
+            end = len(self._rows)
+            if values:
+                self._persist(start, end)
+        width = max((len(r) for r in values), default=1)
+        return {
+            "updates": {
+                "updatedRange": f"{self.title}!A{start}:{rowcol_to_a1(end, width)}",
+                "updatedRows": len(values),
+            }
+        }
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        with self._lock:
+            for d in data:
+                self._write(d["range"], d["values"])
+        return {"totalUpdatedCells": sum(len(v) for d in data for v in d["values"])}
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self._call("update")
+        with self._lock:
+            self._write(range_name or "A1", values or [])
+        return {}
+
+    def update_cell(self, row: int, col: int, value):
+        self._call("update_cell")
+        with self._lock:
+            self._set(row, col, value)
+            self._persist(row, row)
+        return {}
+
+    def add_cols(self, cols: int):
+        self._call("add_cols")
+        self.col_count += cols
+
+    def clear(self):
+        self._call("clear")
+        with self._lock:
+            self._rows = []
+            self._persist(1, 0)
+
+    def update_dimensions(self, requests):
+        """Requêtes de structure appliquées dans l'ordre, comme un batchUpdate."""
+        self._call("update_dimensions")
+        with self._lock:
+            for request in requests:
+                (kind, body), = request.items()
+                if kind == "appendDimension":
+                    if body["dimension"] == "COLUMNS":
+                        self.col_count += body["length"]
+                    continue
+                r = body["range"] if "range" in body else body["source"]
+                s, e = r["startIndex"], r["endIndex"]
+                if r["dimension"] == "ROWS":
+                    self._rows = self._resized(kind, self._rows, s, e, body, [])
+                    continue
+                width = max([e, body.get("destinationIndex", 0)] + [len(c) for c in self._rows])
+                self._rows = [
+                    self._resized(kind, c + [""] * (width - len(c)), s, e, body, "") for c in self._rows
+                ]
+                if kind != "moveDimension":
+                    self.col_count += (e - s) * (1 if kind == "insertDimension" else -1)
+            # Lignes décalées : tout est réécrit
+            self._persist(1, 0)
+            self._persist(1, len(self._rows))
+        return {}
+
+    @staticmethod
+    def _resized(kind: str, items: list, s: int, e: int, body: dict, empty) -> list:
+        if kind == "deleteDimension":
+            return items[:s] + items[e:]
+        if kind == "insertDimension":
+            return items[:s] + [type(empty)() for _ in range(e - s)] + items[s:]
+        if kind == "moveDimension":
+            # destinationIndex : position avant le déplacement, comme l'API
+            block, rest = items[s:e], items[:s] + items[e:]
+            d = body["destinationIndex"]
+            d = d if d <= s else d - (e - s)
+            return rest[:d] + block + rest[d:]
+        raise ValueError(f"requête non gérée : {kind}")
+
+
+class FakeWorksheet(GridWorksheet):
+    """
+    Stand-in en mémoire de la feuille Google : chaque appel attend
+    `latency` s (± jitter) et peut lever QuotaExceededError, soit au hasard
+    (error_rate), soit au-delà de quota_per_minute appels glissants.
+    """
+
+    def __init__(self, rows=None, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, quota_per_minute=None, seed=None):
+        super().__init__(rows)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self._random = random.Random(seed)
+        self._recent = []
+
+    def _call(self, name: str):
+        super()._call(name)
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+        if self.quota_per_minute is not None:
+            now = time.monotonic()
+            with self._lock:
+                self._recent = [t for t in self._recent if now - t < 60]
+                if len(self._recent) >= self.quota_per_minute:
+                    raise QuotaExceededError(f"{name}: quota de {self.quota_per_minute} appels/min dépassé")
+                self._recent.append(now)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise QuotaExceededError(f"{name}: erreur de quota simulée")
+
+
+class SQLiteWorksheet(GridWorksheet):
+    """Feuille locale : grille en mémoire, chaque écriture persistée dans SQLite."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS grid (row INTEGER PRIMARY KEY, cells TEXT)")
+        rows = []
+        for r, cells in self._conn.execute("SELECT row, cells FROM grid ORDER BY row"):
+            rows.extend([] for _ in range(r - 1 - len(rows)))
+            rows.append(json.loads(cells))
+        super().__init__(rows)
+
+    def _persist(self, first_row: int, last_row: int):
+        with self._conn:
+            if last_row < first_row:
+                self._conn.execute("DELETE FROM grid")
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO grid VALUES (?, ?)",
+                ((r, json.dumps(self._rows[r - 1], ensure_ascii=False)) for r in range(first_row, last_row + 1)),
+            )
+
+
+class InstrumentedWorksheet:
+    """
+    Enveloppe d'un worksheet : chaque appel API devient une étape
+    « sheets.<méthode> » du run en cours (durée, lignes). Les appels
+    réellement envoyés sont comptés par le pool (fusions et retries).
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if name not in API_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            with instrument.stage(f"sheets.{name}") as s:
+                result = attr(*args, **kwargs)
+                if isinstance(result, list):
+                    s.rows = len(result)
+                elif name == "append_rows" and args:
+                    s.rows = len(args[0])
+                return result
+
+        return call
+
+
+class GoogleWorksheet:
+    """Worksheet gspread, plus update_dimensions (sheetId de la feuille rempli)."""
+
+    def __init__(self, ws):
+        self._ws = ws
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+    def update_dimensions(self, requests):
+        for request in requests:
+            for body in request.values():
+                for part in [body, *body.values()]:
+                    if isinstance(part, dict) and "dimension" in part:
+                        part["sheetId"] = self._ws.id
+        return self._ws.spreadsheet.batch_update({"requests": requests})
+
+
+def open_google_sheet(service_account_info: dict, gsheet_id: str):
+    """Première feuille du classeur Google Sheets, via un compte de service."""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_info(dict(service_account_info), scopes=SCOPE)
+    client = gspread.authorize(creds)
+    return GoogleWorksheet(client.open_by_key(gsheet_id).sheet1)
+
+
+def open_backend(config: dict, service_account_info=None):
+    """
+    config = {"backend": "gsheets" | "sqlite" | "memory", ...}
+      sqlite : path
+      memory : latency, jitter, error_rate, quota_per_minute, seed
+      tous   : pool_size, read_per_minute, write_per_minute (voir sheetpool.py)
+    Le worksheet renvoyé passe par un pool de connexions limité en débit
+    (quotas Sheets par défaut pour gsheets, illimité sinon) et est
+    instrumenté (voir instrument.py). Aucune connexion n'est ouverte ici :
+    gspread est importé et le compte de service autorisé au premier appel.
+    """
+    kind = config.get("backend", "gsheets")
+    if kind == "gsheets":
+        # Une connexion (client gspread) par slot du pool
+        factory = lambda: open_google_sheet(service_account_info, service_account_info["gsheet_id"])
+        size, reads, writes = 4, READ_PER_MINUTE, WRITE_PER_MINUTE
+    else:
+        # Feuille locale : un seul objet, thread-safe, partagé par les slots
+        ws = _open_local(kind, config)
+        factory = lambda: ws
+        size, reads, writes = 1, None, None
+    pool = SheetPool(
+        factory,
+        size=int(config.get("pool_size", size)),
+        read_per_minute=_optional_int(config.get("read_per_minute", reads)),
+        write_per_minute=_optional_int(config.get("write_per_minute", writes)),
+    )
+    return InstrumentedWorksheet(PooledWorksheet(pool))
+
+
+def storage_config(section=None) -> dict:
+    """
+    Section [storage] des secrets (backend = gsheets | sqlite | memory).
+    La variable d'environnement TRADE_RATER_BACKEND l'emporte.
+    """
+    config = dict(section or {})
+    config["backend"] = os.environ.get("TRADE_RATER_BACKEND") or config.get("backend", "gsheets")
+    return config
+
+
+def open_store(config: dict, service_account_info=None, start_writer: bool = True) -> TradeStore:
+    """
+    TradeStore sur le backend configuré ; data_dir par défaut propre au
+    backend. Les screenshots (blob_dir) et l'archive des anciennes semaines
+    (archive_dir) ne sont pas un cache : hors de data_dir. hot_weeks :
+    semaines gardées dans la feuille (semaine en cours comprise), les plus
+    anciennes sont archivées.
+    """
+    backend = config.get("backend", "gsheets")
+    ws = open_backend(config, service_account_info)
+    data_dir = config.get("data_dir", ".trade_cache" if backend == "gsheets" else f".trade_cache/{backend}")
+    blob_dir = config.get("blob_dir", "screenshots")
+    archive_dir = config.get("archive_dir", "archive" if backend == "gsheets" else f"archive/{backend}")
+    return TradeStore(
+        ws, data_dir=data_dir, start_writer=start_writer, blob_dir=blob_dir,
+        archive_dir=archive_dir, hot_weeks=_optional_int(config.get("hot_weeks")),
+    )
+
+
+def _optional_int(value):
+    return int(value) if value is not None else None
+
+
+def _open_local(kind: str, config: dict):
+    if kind == "sqlite":
+        return SQLiteWorksheet(config.get("path", ".trade_cache/sqlite/sheet.sqlite"))
+    if kind == "memory":
+        quota = config.get("quota_per_minute")
+        return FakeWorksheet(
+            latency=float(config.get("latency", 0.0)),
+            jitter=float(config.get("jitter", 0.0)),
+            error_rate=float(config.get("error_rate", 0.0)),
+            quota_per_minute=int(quota) if quota is not None else None,
+            seed=config.get("seed"),
+        )
+    raise ValueError(f"Backend de stockage inconnu : {kind!r} (attendu : {', '.join(BACKENDS)})")
@@ -0,0 +1,125 @@
+"""Remise en ordre de l'en-tête (ensure_header) sur la feuille en mémoire."""
+import time
+
+from storage import FakeWorksheet
+from trade_store import TRADE_COLUMNS, TradeStore, ensure_header
+
+ID = TRADE_COLUMNS.index("trade_id")
+
+
+def trade(i: int) -> dict:
+    return {
+        "datetime": f"2026-10-0{i + 1} 10:00:00", "date_trade": f"2026-10-0{i + 1}",
+        "pair": "XAUUSD", "direction": "Buy", "timeframe": "M15", "session": "London",
+        "rr": "2", "score_percent": str(50 + i), "commentaire": f"c{i}", "taken": "Oui",
+        "result": "Win", "trade_id": f"id{i}", "screenshot": "",
+    }
+
+
+def sheet(header, n: int = 3, extra=None) -> FakeWorksheet:
+    """Feuille de n trades sous header ; extra : {colonne inconnue: préfixe des valeurs}."""
+    extra = extra or {}
+    rows = [[f"{extra[c]}{i}" if c in extra else trade(i)[c] for c in header] for i in range(n)]
+    return FakeWorksheet([list(header)] + rows)
+
+
+def grid(ws) -> list:
+    """Lignes de la feuille complétées à la largeur de la plus longue."""
+    values = ws.get_all_values()
+    width = max(len(r) for r in values)
+    return [r + [""] * (width - len(r)) for r in values]
+
+
+def by_name(ws) -> list:
+    header, *rows = grid(ws)
+    return [dict(zip(header, r)) for r in rows]
+
+
+def test_aligned_header_is_left_alone():
+    ws = sheet(TRADE_COLUMNS)
+    ws.calls.clear()
+    assert ensure_header(ws) is False
+    assert set(ws.calls) == {"row_values"}
+
+
+def test_empty_sheet_gets_header():
+    ws = FakeWorksheet([])
+    assert ensure_header(ws) is True
+    assert ws.get_all_values() == [TRADE_COLUMNS]
+
+
+def test_old_prefix_header_gets_missing_columns_and_ids():
+    ws = sheet(TRADE_COLUMNS[:ID])
+    assert ensure_header(ws) is True
+    values = ws.get_all_values()
+    assert values[0] == TRADE_COLUMNS
+    ids = [r[ID] for r in values[1:]]
+    assert all(len(i) == 32 for i in ids) and len(set(ids)) == len(ids)
+    assert [r["commentaire"] for r in by_name(ws)] == ["c0", "c1", "c2"]
+
+
+def test_reorder_keeps_values_with_their_column_and_extras_after():
+    header = ["note", "pair", "datetime"] + [c for c in TRADE_COLUMNS if c not in ("pair", "datetime")]
+    ws = sheet(header, extra={"note": "n"})
+    ws.calls.clear()
+    assert ensure_header(ws) is True
+    values = ws.get_all_values()
+    assert values[0] == TRADE_COLUMNS + ["note"]
+    for i, row in enumerate(values[1:]):
+        assert row == [trade(i)[c] for c in TRADE_COLUMNS] + [f"n{i}"]
+    # Colonnes déplacées, aucune cellule existante réécrite
+    assert "update_dimensions" in ws.calls
+    assert not {"update", "batch_update", "clear"} & set(ws.calls)
+
+
+def test_reorder_inserts_missing_columns_and_fills_trade_ids():
+    header = ["pair", "datetime"] + [c for c in TRADE_COLUMNS if c not in ("pair", "datetime", "trade_id", "screenshot")]
+    ws = sheet(header, n=2)
+    ws._rows.append([""] * len(header))   # ligne vide au milieu des données
+    ws._rows.append([trade(2)[c] for c in header])
+    assert ensure_header(ws) is True
+    values = grid(ws)
+    assert values[0] == TRADE_COLUMNS
+    assert [r[TRADE_COLUMNS.index("pair")] for r in values[1:]] == ["XAUUSD", "XAUUSD", "", "XAUUSD"]
+    ids = [r[ID] for r in values[1:]]
+    assert ids[2] == "" and all(len(ids[i]) == 32 for i in (0, 1, 3))
+    assert ws.col_count >= len(TRADE_COLUMNS)
+
+
+def test_reorder_swapped_columns_then_no_change():
+    header = list(TRADE_COLUMNS)
+    i, j = header.index("taken"), header.index("rr")
+    header[i], header[j] = header[j], header[i]
+    ws = sheet(header)
+    assert ensure_header(ws) is True
+    assert [r["taken"] for r in by_name(ws)] == ["Oui"] * 3 and [r["rr"] for r in by_name(ws)] == ["2"] * 3
+    assert ensure_header(ws) is False
+
+
+def test_unnamed_filled_column_is_kept():
+    header = ["datetime", ""] + TRADE_COLUMNS[1:]
+    ws = sheet(header, extra={"": "x"})
+    assert ensure_header(ws) is True
+    values = ws.get_all_values()
+    assert values[0][:len(TRADE_COLUMNS)] == TRADE_COLUMNS
+    assert [r[len(TRADE_COLUMNS)] for r in values[1:]] == ["x0", "x1", "x2"]
+
+
+def test_writer_realigns_header_before_sending_journaled_rows(tmp_path):
+    ws = sheet(TRADE_COLUMNS, n=1)
+    store = TradeStore(ws, data_dir=str(tmp_path), start_writer=False)
+    store.load_all_trades()
+    store.append_trade(trade(1))   # journalisé, pas envoyé
+    # Colonnes réordonnées à la main pendant l'arrêt
+    i, j = TRADE_COLUMNS.index("pair"), TRADE_COLUMNS.index("commentaire")
+    for r in ws._rows:
+        r[i], r[j] = r[j], r[i]
+
+    restarted = TradeStore(ws, data_dir=str(tmp_path))
+    deadline = time.monotonic() + 5
+    while restarted.queue.depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    values = grid(ws)
+    assert values[0] == TRADE_COLUMNS
+    assert values[1:] == [[trade(k)[c] for c in TRADE_COLUMNS] for k in range(2)]
@@ -0,0 +1,98 @@
+"""Miroir SQLite : synchro incrémentale et resynchro complète."""
+import pytest
+
+from mirror import HeaderMismatch, SheetMirror
+from storage import FakeWorksheet
+from trade_store import TRADE_COLUMNS
+
+ID = TRADE_COLUMNS.index("trade_id")
+PAIR = TRADE_COLUMNS.index("pair")
+TAKEN = TRADE_COLUMNS.index("taken")
+
+
+def row(i: int, pair: str = "XAUUSD") -> list:
+    r = [""] * len(TRADE_COLUMNS)
+    r[0] = f"2026-10-0{i % 9 + 1} 10:00:00"
+    r[PAIR] = pair
+    r[TAKEN] = "Non"
+    r[ID] = f"id{i}"
+    return r
+
+
+@pytest.fixture
+def ws():
+    return FakeWorksheet([TRADE_COLUMNS] + [row(i) for i in range(4)])
+
+
+@pytest.fixture
+def mirror(tmp_path, ws):
+    m = SheetMirror(str(tmp_path / "trades.sqlite"), TRADE_COLUMNS, key="trade_id")
+    assert m.sync(ws)["mode"] == "full"
+    return m
+
+
+def column(mirror, name: str) -> list:
+    return list(mirror.read_columns()[name])
+
+
+def test_delta_sync_reads_appended_rows_and_edits(ws, mirror):
+    ws.append_rows([row(4), row(5)])
+    ws.update_cell(2, TAKEN + 1, "Oui")
+    ws.calls.clear()
+    assert mirror.sync(ws) == {"mode": "delta", "appended": 2, "changed": 1}
+    assert "get_all_values" not in ws.calls
+    assert column(mirror, "trade_id") == [f"id{i}" for i in range(6)]
+    assert column(mirror, "taken")[0] == "Oui"
+
+
+def test_checksum_mismatch_triggers_full_resync(ws, mirror):
+    # Tri à la main : mêmes lignes, autre ordre
+    ws._rows[1:] = ws._rows[1:][::-1]
+    ws._rows[1][PAIR] = "EURUSD"
+    assert mirror.sync(ws)["mode"] == "full"
+    assert column(mirror, "trade_id") == ["id3", "id2", "id1", "id0"]
+    assert column(mirror, "pair")[0] == "EURUSD"
+    assert list(mirror.read_columns()["sheet_row"]) == [2, 3, 4, 5]
+
+
+def test_deleted_row_triggers_full_resync(ws, mirror):
+    del ws._rows[2]
+    assert mirror.sync(ws)["mode"] == "full"
+    assert column(mirror, "trade_id") == ["id0", "id2", "id3"]
+
+
+def test_row_without_trade_id_is_counted(ws, mirror):
+    typed = row(9, pair="GBPUSD")
+    typed[ID] = ""
+    ws.append_rows([typed])
+    assert mirror.sync(ws) == {"mode": "delta", "appended": 1, "changed": 0}
+    assert column(mirror, "pair")[-1] == "GBPUSD"
+    # Ligne suivante : les lignes sans id ne décalent pas la somme de contrôle
+    ws.append_rows([row(10)])
+    assert mirror.sync(ws) == {"mode": "delta", "appended": 1, "changed": 0}
+
+
+def test_manual_edit_of_other_columns_is_picked_up_by_periodic_resync(ws, mirror):
+    ws.update_cell(3, PAIR + 1, "US30")
+    assert mirror.sync(ws)["mode"] == "delta"
+    assert column(mirror, "pair")[1] == "XAUUSD"
+    mirror.full_every = 0
+    assert mirror.sync(ws)["mode"] == "full"
+    assert column(mirror, "pair")[1] == "US30"
+
+
+def test_reset_forces_full_resync(ws, mirror):
+    ws.update_cell(3, PAIR + 1, "US30")
+    mirror.reset()
+    assert not mirror.has_synced()
+    assert mirror.sync(ws)["mode"] == "full"
+    assert column(mirror, "pair")[1] == "US30"
+
+
+def test_reordered_header_raises(ws, mirror):
+    header = list(TRADE_COLUMNS)
+    header[0], header[1] = header[1], header[0]
+    ws._rows[0] = header
+    with pytest.raises(HeaderMismatch) as exc:
+        mirror.sync(ws)
+    assert exc.value.header == header
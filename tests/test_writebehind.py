@@ -0,0 +1,111 @@
+"""File d'écriture différée : relecture du journal et idempotence des envois."""
+import time
+
+import pytest
+
+from storage import FakeWorksheet
+from trade_store import TRADE_COLUMNS, _row_key
+from writebehind import WriteBehindQueue
+
+ID = TRADE_COLUMNS.index("trade_id")
+
+
+def row(i: int, datetime: str = "2026-10-01 10:00:00") -> list:
+    r = [""] * len(TRADE_COLUMNS)
+    r[0] = datetime
+    r[ID] = f"id{i}"
+    return r
+
+
+def ids(ws) -> list:
+    return ws.col_values(ID + 1)[1:]
+
+
+def queue(path, ws, **kwargs) -> WriteBehindQueue:
+    return WriteBehindQueue(str(path), ws, _row_key, ID + 1, base_delay=0.01, idle_wait=0.05, **kwargs)
+
+
+def drain(q, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while q.depth:
+        assert time.monotonic() < deadline, f"{q.depth} ligne(s) encore en attente ({q.last_error})"
+        time.sleep(0.01)
+
+
+class AppliedThenFails(FakeWorksheet):
+    """append_rows écrit les lignes puis lève une erreur (5xx après commit)."""
+
+    def __init__(self, rows, failures: int = 1, concurrent=()):
+        super().__init__(rows)
+        self.failures = failures
+        # Lignes ajoutées par un autre process juste après l'envoi en échec
+        self.concurrent = list(concurrent)
+
+    def append_rows(self, values, **kwargs):
+        response = super().append_rows(values, **kwargs)
+        if self.failures:
+            self.failures -= 1
+            if self.concurrent:
+                super().append_rows(self.concurrent)
+            raise RuntimeError("503 après écriture")
+        return response
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tmp_path / "journal.jsonl"
+
+
+def test_rows_are_sent_once_with_their_sheet_rows(journal):
+    ws = FakeWorksheet([TRADE_COLUMNS, row(0)])
+    flushed = []
+    q = queue(journal, ws, on_flushed=flushed.extend).start()
+    q.enqueue_many([row(1), row(2)])
+    drain(q)
+    assert ids(ws) == ["id0", "id1", "id2"]
+    assert {e["key"]: e["sheet_row"] for e in flushed} == {"id1": 3, "id2": 4}
+
+
+def test_journal_is_replayed_after_a_crash(journal):
+    ws = FakeWorksheet([TRADE_COLUMNS])
+    queue(journal, ws).enqueue_many([row(1), row(2)])   # jamais démarrée : arrêt brutal
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"op": "append", "key": "tron')      # dernière ligne tronquée
+
+    q = queue(journal, ws)
+    assert q.depth == 2 and q.pending_keys() == {"id1", "id2"}
+    q.start()
+    drain(q)
+    assert ids(ws) == ["id1", "id2"]
+    assert queue(journal, ws).depth == 0
+
+
+def test_crash_after_append_before_ack_does_not_duplicate(journal):
+    ws = FakeWorksheet([TRADE_COLUMNS])
+    queue(journal, ws).enqueue_many([row(1), row(2)])
+    ws.append_rows([row(1), row(2)])   # envoi abouti, acquittement perdu
+
+    q = queue(journal, ws).start()
+    drain(q)
+    assert ids(ws) == ["id1", "id2"]
+
+
+def test_5xx_after_append_is_not_resent(journal):
+    ws = AppliedThenFails([TRADE_COLUMNS, row(0)])
+    flushed = []
+    q = queue(journal, ws, on_flushed=flushed.extend).start()
+    q.enqueue_many([row(1), row(2)])
+    drain(q)
+    assert ids(ws) == ["id0", "id1", "id2"]
+    assert {e["key"]: e["sheet_row"] for e in flushed} == {"id1": 3, "id2": 4}
+    assert q.last_error is None
+
+
+def test_5xx_after_append_with_concurrent_rows_and_empty_column_a(journal):
+    # Le lot n'est plus en fin de feuille et sa colonne A est vide
+    others = [row(100 + i) for i in range(10)]
+    ws = AppliedThenFails([TRADE_COLUMNS, row(0)], concurrent=others)
+    q = queue(journal, ws).start()
+    q.enqueue_many([row(1, datetime=""), row(2, datetime="")])
+    drain(q)
+    assert ids(ws) == ["id0", "id1", "id2"] + [f"id{100 + i}" for i in range(10)]
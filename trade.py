@@ -1,9 +1,23 @@
+import base64
+import functools
+import os
+import re
+
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
 
-import gspread
-from google.oauth2.service_account import Credentials
+import instrument
+from blobstore import is_digest
+from importer import import_trades
+from perf import breakdown, build_cube, totals
+from reports import ReportJob, list_reports
+from rollup import trend, weekly
+from scoring import MS_HTF_MAX, NO_TRADE_THRESHOLD, RULES_BY_NAME, score_setup
+from sheetpool import is_transient
+from storage import open_store, storage_config
+from trade_store import CATEGORY_COLUMNS, TradeStore
+from whatif import COLUMNS as WHATIF_COLUMNS, REWEIGHTABLE_RULES, WhatIfModel, at_threshold, default_weights
 
 st.set_page_config(page_title="Trade Rater %", layout="centered")
 
@@ -22,110 +36,232 @@ st.markdown("""
 st.title("📊 Trade Rater — Score en % ")
 
 # ──────────────────────────────
-# Connexion Google Sheets
+# Stockage des trades
 # ──────────────────────────────
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+def _storage_config() -> dict:
+    try:
+        section = st.secrets.get("storage", {})
+    except FileNotFoundError:
+        section = {}
+    return storage_config(section)
+
 
 @st.cache_resource
-def get_worksheet():
-    # infos du compte de service
-    info = dict(st.secrets["gcp_service_account"])
-    creds = Credentials.from_service_account_info(info, scopes=SCOPE)
-    client = gspread.authorize(creds)
-
-    # gsheet_id stocké dans la même section
-    gsheet_id = st.secrets["gcp_service_account"]["gsheet_id"]
-
-    sh = client.open_by_key(gsheet_id)
-    ws = sh.sheet1
-
-    # S'assurer que l'en-tête existe
-    header = ws.row_values(1)
-    expected = [
-        "datetime","date_trade","pair","direction","timeframe",
-        "session","rr","score_percent","commentaire","taken","result"
-    ]
-    if header != expected:
-        ws.clear()
-        ws.append_row(expected)
-    return ws
-
-
-ws = get_worksheet()
-
-def append_trade(row_dict: dict):
-    """Ajoute un trade en fin de feuille."""
-    row = [
-        row_dict.get("datetime", ""),
-        row_dict.get("date_trade", ""),
-        row_dict.get("pair", ""),
-        row_dict.get("direction", ""),
-        row_dict.get("timeframe", ""),
-        row_dict.get("session", ""),
-        row_dict.get("rr", ""),
-        row_dict.get("score_percent", ""),
-        row_dict.get("commentaire", ""),
-        row_dict.get("taken", ""),
-        row_dict.get("result", ""),
-    ]
-    ws.append_row(row)
-
-def load_all_trades() -> pd.DataFrame:
-    """Charge tous les trades depuis Sheets dans un DataFrame."""
-    values = ws.get_all_values()
-    if len(values) <= 1:
-        return pd.DataFrame(columns=[
-            "datetime","date_trade","pair","direction","timeframe",
-            "session","rr","score_percent","commentaire","taken","result","sheet_row"
-        ])
-    header = values[0]
-    rows = values[1:]
-    df = pd.DataFrame(rows, columns=header)
-    # Ajouter index de ligne réelle dans la feuille (1 = header)
-    df["sheet_row"] = df.index + 2
-
-    # Types
-    if "date_trade" in df.columns:
-        df["date_trade"] = pd.to_datetime(df["date_trade"], errors="coerce").dt.date
-    if "datetime" in df.columns:
-        df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
-    for col in ["rr", "score_percent"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    return df
-
-def update_taken_and_result(updates):
-    """
-    updates = list of dict: {"sheet_row": int, "taken": str, "result": str}
-    """
-    header = ws.row_values(1)
-    col_taken = header.index("taken") + 1
-    col_result = header.index("result") + 1
-    for u in updates:
-        r = int(u["sheet_row"])
-        if u.get("taken") is not None:
-            ws.update_cell(r, col_taken, u["taken"])
-        if u.get("result") is not None:
-            ws.update_cell(r, col_result, u["result"])
+def get_store() -> TradeStore:
+    """Sans appel réseau : connexion, en-tête et premier chargement se font en fond."""
+    config = _storage_config()
+    info = st.secrets["gcp_service_account"] if config["backend"] == "gsheets" else None
+    store = open_store(config, info)
+    store.start_warm_up()
+    store.start_archiving()
+    return store
+
+
+@st.cache_resource
+def get_report_job() -> ReportJob:
+    """Génération des rapports hebdo, une par process (partagée par les sessions)."""
+    return ReportJob(get_store(), _storage_config().get("report_dir", "reports"))
+
 
 # ──────────────────────────────
 # UI
 # ──────────────────────────────
 
-mode = st.sidebar.selectbox(
-    "Mode",
-    ["Nouveau trade", "Dashboard hebdo"]
-)
+@st.cache_data(max_entries=1024)
+def thumbnail_uri(digest: str):
+    """Vignette d'un screenshot en data URI, générée une seule fois."""
+    path = store.blobs.thumbnail(digest) if is_digest(digest) else None
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+
+
+@st.cache_data(max_entries=32)
+def week_perf_cube(_df_eval: pd.DataFrame, data_version: int, iso_year: int, iso_week: int) -> pd.DataFrame:
+    """Cube de perf d'une semaine, recalculé seulement si les données changent."""
+    with instrument.stage("perf.cube", rows=len(_df_eval)):
+        return build_cube(_df_eval)
+
+
+@st.cache_resource(max_entries=2)
+def get_whatif_model(data_version: int) -> WhatIfModel:
+    df = get_store().load_all_trades(WHATIF_COLUMNS)
+    with instrument.stage("whatif.model", rows=len(df)):
+        return WhatIfModel(df)
+
+
+@st.cache_data(max_entries=64)
+def whatif_curve(_model: WhatIfModel, data_version: int, weights: tuple) -> pd.DataFrame:
+    with instrument.stage("whatif.sweep", rows=_model.n):
+        return _model.sweep(dict(weights))
+
+
+TAKEN_OPTIONS = ["Oui", "Non"]
+RESULT_OPTIONS = ["Win", "Loss", "BE", "Non pris"]
+RANKING_PAGE_SIZES = [25, 50, 100]
+
+
+def editor_updates(original: pd.DataFrame, edited: pd.DataFrame) -> list:
+    """
+    Diff entre le tableau affiché et le tableau édité (index = sheet_row) :
+    seules les cellules taken / result modifiées et non vides sont gardées.
+    Les trades archivés (sheet_row 0) ne sont plus dans la feuille : ignorés.
+    """
+    original = original[original.index != 0]
+    edited = edited[edited.index != 0]
+    updates = []
+    changed = {}
+    for col in ("taken", "result"):
+        new = edited[col].fillna("")
+        changed[col] = (new != original[col].fillna("")) & (new != "")
+    rows = edited.index[changed["taken"] | changed["result"]]
+    for sheet_row in rows:
+        updates.append({
+            "trade_id": edited.at[sheet_row, "trade_id"] if "trade_id" in edited.columns else None,
+            "sheet_row": int(sheet_row),
+            "taken": edited.at[sheet_row, "taken"] if changed["taken"].at[sheet_row] else None,
+            "result": edited.at[sheet_row, "result"] if changed["result"].at[sheet_row] else None,
+        })
+    return updates
+
+
+def stage_table(stages) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Étape": ["\u00a0\u00a0" * s.depth + s.name for s in stages],
+        "ms": [round((s.seconds or 0.0) * 1000, 1) for s in stages],
+        "Lignes": [s.rows for s in stages],
+        "API": [sum(s.api_calls.values()) for s in stages],
+    })
+
+
+def debug_panel(last_run):
+    """Profil du dernier rerun terminé de la session, et des derniers envois en fond."""
+    with st.sidebar.expander("🐞 Profil du dernier rerun", expanded=True):
+        if last_run is None:
+            st.caption("Disponible au prochain rerun.")
+        else:
+            calls = sum(last_run.api_calls.values())
+            st.caption(
+                f"{last_run.label} — {last_run.seconds * 1000:.0f} ms, {calls} appel(s) API"
+                + (" (interrompu)" if last_run.status == "stopped" else "")
+            )
+            st.dataframe(stage_table(last_run.stages), hide_index=True, width="stretch")
+        fragments = [r for r in st.session_state.get("perf_fragments", []) if r.done]
+        if fragments:
+            st.caption("Reruns partiels (fragments)")
+            st.dataframe(stage_table([s for r in fragments for s in r.stages]), hide_index=True, width="stretch")
+        background = [r for r in instrument.PROFILER.runs if r.label == "write-behind"][-5:]
+        if background:
+            st.caption("Envois en fond (write-behind)")
+            st.dataframe(stage_table([s for r in background for s in r.stages]), hide_index=True, width="stretch")
+        st.download_button(
+            "⬇️ Export JSON lines", instrument.PROFILER.to_jsonl(),
+            file_name="trade_rater_stages.jsonl", mime="application/x-ndjson",
+        )
+        st.download_button(
+            "⬇️ Export Prometheus", instrument.PROFILER.to_prometheus(),
+            file_name="trade_rater.prom", mime="text/plain",
+        )
+
+
+REPORT_WEEKS = 12
+
+
+@st.fragment
+def reports_panel():
+    """Rapports hebdo statiques : générés en fond, téléchargeables une fois prêts."""
+    job = get_report_job()
+    with st.expander("📄 Rapports hebdo"):
+        n_weeks = st.number_input("Dernières semaines", min_value=1, max_value=520, value=REPORT_WEEKS, step=1)
+        force = st.checkbox("Régénérer même si inchangées", value=False)
+        if st.button("Générer les rapports", disabled=job.running):
+            weeks = sheets_data(store.list_weeks)
+            if weeks is not None:
+                job.start(weeks[-int(n_weeks):], force=force)
+        stats = job.stats
+        if stats is not None:
+            done = stats["generated"] + stats["skipped"] + stats["failed"]
+            st.caption(
+                ("⏳ En cours : " if job.running else "Dernière génération : ")
+                + f"{done}/{stats['weeks']} semaine(s), {stats['generated']} générée(s), "
+                f"{stats['skipped']} inchangée(s)"
+                + (f", {stats['failed']} en échec" if stats["failed"] else "")
+            )
+            if job.running:
+                st.button("🔄 Actualiser")
+        if job.error:
+            st.warning(f"Génération interrompue : {job.error}")
+
+        reports = list_reports(job.out_dir)
+        if not reports:
+            return
+        label = st.selectbox("Rapport", [r[0] for r in reports])
+        _, html_path, csv_path = next(r for r in reports if r[0] == label)
+        col_html, col_csv = st.columns(2)
+        with open(html_path, "rb") as f:
+            col_html.download_button("⬇️ HTML", f.read(), file_name=os.path.basename(html_path), mime="text/html")
+        with open(csv_path, "rb") as f:
+            col_csv.download_button("⬇️ CSV", f.read(), file_name=os.path.basename(csv_path), mime="text/csv")
+
+
+def rule_selectbox(name: str):
+    """Selectbox construite depuis la table des règles de score."""
+    rule = RULES_BY_NAME[name]
+    return st.selectbox(rule.question, rule.choices)
+
+
+def profiled(label: str, fragment: bool = False):
+    """
+    Section de page mesurée comme une étape du rerun. fragment=True : la
+    section est un st.fragment, relancée seule quand ses propres widgets
+    changent ; ces reruns partiels forment leur propre run de profilage.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrument.scope(label, enabled=st.session_state.get("debug", False)) as scope:
+                result = fn(*args, **kwargs)
+            if isinstance(scope, instrument.Run):
+                st.session_state["perf_fragments"] = [*st.session_state.get("perf_fragments", [])[-4:], scope]
+            return result
+        return st.fragment(wrapper) if fragment else wrapper
+    return decorate
+
+
+def flash(kind: str, message: str):
+    """Message affiché après le prochain rerun (st.success, st.info…)."""
+    st.session_state.setdefault("flash", []).append((kind, message))
+
+
+def show_flash():
+    for kind, message in st.session_state.pop("flash", []):
+        getattr(st, kind)(message)
+
+
+def sheets_data(load):
+    """
+    Résultat de load() (lecture des trades), ou None après un message si
+    Google Sheets ne répond pas (quota / réseau) et que le miroir local est vide.
+    """
+    try:
+        data = load()
+    except Exception as exc:
+        if not is_transient(exc):
+            raise
+        st.error(f"Google Sheets ne répond pas (quota ou réseau) : données indisponibles, réessaie dans un instant ({exc})")
+        return None
+    if store.sync_error:
+        st.warning(f"Quota Google Sheets atteint : données locales affichées, possiblement pas à jour ({store.sync_error})")
+    return data
+
 
 # =========================================================
 # MODE 1 : NOUVEAU TRADE
 # =========================================================
-if mode == "Nouveau trade":
-
+@profiled("ui.new_trade", fragment=True)
+def new_trade_page():
+    """Formulaire en fragment : l'aperçu du score ne relance que le formulaire."""
     st.write("Remplis les critères de ton setup, et je calcule un pourcentage de qualité (peut dépasser 100%).")
 
     # --- Infos générales ---
@@ -139,233 +275,46 @@ if mode == "Nouveau trade":
     with col2:
         timeframe = st.selectbox("Timeframe d'entrée", ["M1", "M5", "M15", "M30", "H1", "H2", "H4"])
         rr = st.number_input("Risque / Reward (ex: 3 pour 1:3)", min_value=0.1, step=0.1, value=3.0)
-        plan_respecte = st.selectbox(
-            "Lien avec ton plan de début de semaine",
-            [
-                "Hors plan / improvisé",
-                "Dans une paire intéressante mais pas setup principal",
-                "Pile dans le scénario principal du plan"
-            ]
-        )
+        plan_respecte = rule_selectbox("plan_respecte")
 
     screenshot = st.file_uploader("Screenshot du chart (optionnel)", type=["png", "jpg", "jpeg"])
 
-    score = 0
-    notes = []
-
     # --- A. Contexte HTF ---
     st.subheader("A. Contexte HTF (H4 / Daily / Weekly)")
 
-    sync_option = st.selectbox(
-        "Quels timeframes sont alignés (bullish ou bearish) ?",
-        [
-            "Aucun vraiment aligné",
-            "H4 + Daily alignés",
-            "Daily + Weekly alignés",
-            "H4 + Daily + Weekly alignés"
-        ]
-    )
-
-    if sync_option == "Aucun vraiment aligné":
-        score += 0
-        notes.append("Contexte HTF pas aligné (0)")
-    elif sync_option == "H4 + Daily alignés":
-        score += 10
-        notes.append("H4 + Daily alignés (+10)")
-    elif sync_option == "Daily + Weekly alignés":
-        score += 15
-        notes.append("Daily + Weekly alignés (+15)")
-    elif sync_option == "H4 + Daily + Weekly alignés":
-        score += 20
-        notes.append("H4 + Daily + Weekly alignés (+20)")
+    setup = {"pair": pair, "rr": rr, "plan_respecte": plan_respecte}
+    setup["sync_option"] = rule_selectbox("sync_option")
 
     # --- B. AOI ---
     st.subheader("B. Zone d'intérêt (AOI)")
 
-    aoi_choice = st.selectbox(
-        "Où se situe le trade par rapport à tes AOI Daily / Weekly ?",
-        [
-            "Pas vraiment sur une AOI",
-            "Sur une AOI Daily uniquement",
-            "Sur une AOI Weekly uniquement",
-            "Sur une AOI alignée Daily + Weekly (même zone)"
-        ]
-    )
-
-    if aoi_choice == "Pas vraiment sur une AOI":
-        score += 0
-        notes.append("Pas sur une AOI (0)")
-    elif aoi_choice == "Sur une AOI Daily uniquement":
-        score += 10
-        notes.append("Sur AOI Daily (+10)")
-    elif aoi_choice == "Sur une AOI Weekly uniquement":
-        score += 15
-        notes.append("Sur AOI Weekly (+15)")
-    elif aoi_choice == "Sur une AOI alignée Daily + Weekly (même zone)":
-        score += 20
-        notes.append("AOI Daily + Weekly alignées (+20)")
-
-    aoi_recent = st.selectbox(
-        "Le prix a-t-il touché une AOI récemment (sans forcément s'y installer) ?",
-        ["Non", "Oui"]
-    )
-    if aoi_recent == "Oui":
-        score += 5
-        notes.append("Touché AOI récemment (+5)")
+    setup["aoi_choice"] = rule_selectbox("aoi_choice")
+    setup["aoi_recent"] = rule_selectbox("aoi_recent")
 
     # --- C. Pattern & entrée ---
     st.subheader("C. Pattern Head & Shoulders / Entrée")
 
-    hs_quality = st.selectbox(
-        "Qualité du pattern Head & Shoulders (dans le sens du trade)",
-        [
-            "Pas vraiment un H&S",
-            "H&S présent mais pas super clean",
-            "H&S très propre"
-        ]
-    )
-
-    neckline_break = st.selectbox(
-        "Cassure de la neckline",
-        [
-            "Cassure molle / discutable",
-            "Cassure nette avec impulsion"
-        ]
-    )
-
-    neckline_retest = st.selectbox(
-        "Retest de la neckline",
-        [
-            "Pas de vrai retest",
-            "Retest clair de la neckline"
-        ]
-    )
-
-    cont_pattern = st.selectbox(
-        "Continuation pattern pour l'entrée (tes patterns de continuation)",
-        [
-            "Pas de pattern clair",
-            "Pattern présent mais moyen",
-            "Pattern de continuation très propre"
-        ]
-    )
-
-    # H&S
-    if hs_quality == "Pas vraiment un H&S":
-        score += 0
-    elif hs_quality == "H&S présent mais pas super clean":
-        score += 10
-        notes.append("H&S correct (+10)")
-    elif hs_quality == "H&S très propre":
-        score += 15
-        notes.append("H&S très propre (+15)")
-
-    # Cassure neckline
-    if neckline_break == "Cassure molle / discutable":
-        score += 3
-        notes.append("Cassure moyenne (+3)")
-    else:
-        score += 5
-        notes.append("Cassure nette (+5)")
-
-    # Retest
-    if neckline_retest == "Retest clair de la neckline":
-        score += 3
-        notes.append("Retest (+3)")
-
-    # Pattern de continuation
-    if cont_pattern == "Pattern présent mais moyen":
-        score += 3
-        notes.append("Pattern de continuation moyen (+3)")
-    elif cont_pattern == "Pattern de continuation très propre":
-        score += 5
-        notes.append("Pattern de continuation très propre (+5)")
+    setup["hs_quality"] = rule_selectbox("hs_quality")
+    setup["neckline_break"] = rule_selectbox("neckline_break")
+    setup["neckline_retest"] = rule_selectbox("neckline_retest")
+    setup["cont_pattern"] = rule_selectbox("cont_pattern")
 
     # --- D. Confluences ---
     st.subheader("D. Confluences & exécution")
 
-    ema50_align = st.selectbox(
-        "Alignement avec l'EMA 50 (selon les timeframes)",
-        [
-            "Contre EMA 50 sur la plupart des TF",
-            "Aligné seulement sur la TF d'entrée (≤ M30)",
-            "Aligné sur H1",
-            "Aligné sur H4 ou TF plus haute",
-            "Aligné sur plusieurs TF (entrée + H1/H4)"
-        ]
-    )
-
-    if ema50_align == "Contre EMA 50 sur la plupart des TF":
-        score -= 5
-        notes.append("Contre EMA 50 globalement (-5)")
-    elif ema50_align == "Aligné seulement sur la TF d'entrée (≤ M30)":
-        score += 3
-        notes.append("EMA 50 alignée seulement sur la TF d'entrée (+3)")
-    elif ema50_align == "Aligné sur H1":
-        score += 5
-        notes.append("EMA 50 alignée sur H1 (+5)")
-    elif ema50_align == "Aligné sur H4 ou TF plus haute":
-        score += 8
-        notes.append("EMA 50 alignée sur H4 / HTF (+8)")
-    elif ema50_align == "Aligné sur plusieurs TF (entrée + H1/H4)":
-        score += 10
-        notes.append("EMA 50 alignée sur plusieurs TF (+10)")
-
-    # RR
-    if rr < 2:
-        notes.append("RR < 1:2 (0)")
-    elif 2 <= rr < 3:
-        score += 5
-        notes.append("RR correct (+5)")
-    else:
-        score += 10
-        notes.append("RR excellent (+10)")
-
-    # Plan
-    if plan_respecte == "Hors plan / improvisé":
-        score += 0
-        notes.append("Hors plan (0)")
-    elif plan_respecte == "Dans une paire intéressante mais pas setup principal":
-        score += 10
-        notes.append("Dans une paire intéressante (+10)")
-    else:
-        score += 20
-        notes.append("Dans le scénario du plan (+20)")
+    setup["ema50_align"] = rule_selectbox("ema50_align")
 
     # --- E. Session ---
     st.subheader("E. Session")
 
-    session = st.selectbox("Session du trade", ["Tokyo", "Sydney", "London", "New York", "Autre"])
-
-    session_bonus = 0
-    pair_upper = pair.upper()
-
-    if session in ["London", "New York"]:
-        session_bonus = 5
-        notes.append(f"Session {session} (+5)")
-    elif session in ["Tokyo", "Sydney"]:
-        if "JPY" in pair_upper and session == "Tokyo":
-            session_bonus = 0
-            notes.append("Tokyo OK pour JPY (0)")
-        elif ("AUD" in pair_upper or "NZD" in pair_upper) and session == "Sydney":
-            session_bonus = 0
-            notes.append("Sydney OK pour AUD/NZD (0)")
-        else:
-            session_bonus = -5
-            notes.append(f"Session {session} (-5)")
-
-    score += session_bonus
+    session = setup["session"] = rule_selectbox("session")
 
     # --- F. Market structure HTF ---
     st.subheader("F. Market structure HTF")
 
-    ms_htf = st.slider(
-        "La structure de marché HTF (H4/Daily/Weekly) est-elle propre et alignée avec ton trade ?",
-        0, 5, 0
-    )
-    score += ms_htf
-    if ms_htf > 0:
-        notes.append(f"Market structure HTF alignée (+{ms_htf})")
+    setup["ms_htf"] = st.slider(RULES_BY_NAME["ms_htf"].question, 0, MS_HTF_MAX, 0)
+
+    score, notes = score_setup(setup)
 
     # --- Résultat + AUTO-REFUS ---
     st.subheader("Résultat")
@@ -374,10 +323,10 @@ if mode == "Nouveau trade":
 
     st.metric("Qualité du setup", f"{score_percent:.1f} %")
 
-    if score_percent < 80:
-        st.error("❌ NO TRADE — Score < 80%. Le plan dit NON.")
+    if score_percent < NO_TRADE_THRESHOLD:
+        st.error(f"❌ NO TRADE — Score < {NO_TRADE_THRESHOLD}%. Le plan dit NON.")
     else:
-        st.success("✅ Trade potentiellement acceptable selon le plan (≥ 80%).")
+        st.success(f"✅ Trade potentiellement acceptable selon le plan (≥ {NO_TRADE_THRESHOLD}%).")
 
     st.write("Notes :")
     for n in notes:
@@ -408,141 +357,171 @@ if mode == "Nouveau trade":
             "taken": taken_default,
             "result": result_default,
         }
-        append_trade(row)
-        st.success("✅ Trade enregistré dans Google Sheets")
+        if screenshot is not None:
+            # Fichier rangé sous son hash ; seul le hash va dans la feuille
+            screenshot.seek(0)
+            row["screenshot"] = store.blobs.put(screenshot)
+        store.append_trade(row)
+        st.success("✅ Trade enregistré (envoi vers Google Sheets en arrière-plan)")
+
 
 # =========================================================
 # MODE 2 : DASHBOARD HEBDO
 # =========================================================
-else:
-    st.subheader("📅 Dashboard hebdo — scores & ranking")
-
-    df = load_all_trades()
-    if df.empty:
-        st.warning("Aucun trade enregistré pour l’instant.")
-        st.stop()
-
-    # ISO semaine
-    iso_calendar = pd.to_datetime(df["date_trade"]).map(lambda d: d.isocalendar())
-    df["iso_year"] = [x.year for x in iso_calendar]
-    df["iso_week"] = [x.week for x in iso_calendar]
-
-    today = date.today()
-    current_iso = today.isocalendar()
-    current_year, current_week = current_iso.year, current_iso.week
-
-    weeks_available = (
-        df[["iso_year", "iso_week"]]
-        .drop_duplicates()
-        .sort_values(["iso_year", "iso_week"], ascending=[False, False])
-    )
-
-    weeks_labels = [
-        f"{int(row.iso_year)}-W{int(row.iso_week)}"
-        for _, row in weeks_available.iterrows()
-    ]
-
-    default_label = f"{current_year}-W{current_week}"
-    default_index = weeks_labels.index(default_label) if default_label in weeks_labels else 0
-
-    selected_label = st.selectbox(
-        "Choisis la semaine (année-ISOsemaine)",
-        weeks_labels,
-        index=default_index
-    )
-
-    sel_year, sel_week = selected_label.split("-W")
-    sel_year = int(sel_year)
-    sel_week = int(sel_week)
-
-    df_week = df[(df["iso_year"] == sel_year) & (df["iso_week"] == sel_week)]
-
-    if df_week.empty:
-        st.info("Aucun trade pour cette semaine.")
-        st.stop()
-
-    st.write(f"Trades pour la semaine {sel_year}-W{sel_week} : {len(df_week)} trade(s).")
-
-    # ------------------------------------------------------------------
-    # 1) Ranking détaillé + édition pris / résultat
-    # ------------------------------------------------------------------
+@profiled("ui.ranking", fragment=True)
+def ranking_section(sel_year: int, sel_week: int):
+    """
+    Ranking détaillé + édition pris / résultat, en fragment : pagination et
+    édition ne relancent que cette section.
+    """
     st.subheader("🏆 Ranking des trades (par score)")
+    show_flash()
 
+    df_week = store.load_week_trades(sel_year, sel_week)
     df_sorted = df_week.sort_values("score_percent", ascending=False).reset_index(drop=True)
 
-    updates = []
+    # Un seul éditeur tabulaire, paginé : le rendu ne dépend pas du nombre de trades
+    col_size, col_page = st.columns(2)
+    page_size = col_size.selectbox("Trades par page", RANKING_PAGE_SIZES, index=1)
+    n_pages = max(1, -(-len(df_sorted) // page_size))
+    page = col_page.number_input("Page", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+
+    first = (page - 1) * page_size
+    page_df = df_sorted.iloc[first:first + page_size]
+    ranking = pd.DataFrame({
+        "#": page_df.index + 1,
+        "date_trade": page_df["date_trade"],
+        "pair": page_df["pair"],
+        "direction": page_df["direction"],
+        "timeframe": page_df["timeframe"],
+        "session": page_df["session"],
+        "score_percent": page_df["score_percent"],
+        "taken": page_df["taken"],
+        "result": page_df["result"],
+        "commentaire": page_df["commentaire"],
+        "screenshot": page_df["screenshot"].map(thumbnail_uri),
+        "trade_id": page_df["trade_id"],
+    })
+    # Trades archivés (sheet_row 0) : hors de la feuille, en lecture seule
+    ranking = ranking.set_index(page_df["sheet_row"])
+    n_archived = int((page_df["sheet_row"] == 0).sum())
+    archived = len(page_df) > 0 and n_archived == len(page_df)
+    if archived:
+        st.caption("🗄️ Semaine archivée : pris / résultat ne sont plus modifiables.")
+    elif n_archived:
+        st.caption(f"🗄️ {n_archived} trade(s) archivé(s) sur cette page : pris / résultat non modifiables pour eux.")
+    # Page éditable : colonnes catégorielles repassées en texte
+    ranking = ranking.astype({c: object for c in CATEGORY_COLUMNS})
+
+    # Modifications non enregistrées, gardées d'une page à l'autre (sheet_row -> update) :
+    # l'éditeur d'une page quittée perd son état
+    pending = st.session_state.setdefault(f"ranking_pending_{sel_year}_{sel_week}", {})
+    page_view = ranking.copy()
+    for u in pending.values():
+        if u["sheet_row"] in page_view.index:
+            for col in ("taken", "result"):
+                if u[col] is not None:
+                    page_view.loc[u["sheet_row"], col] = u[col]
+
+    edited = st.data_editor(
+        page_view,
+        key=f"ranking_{sel_year}_{sel_week}_{page}_{page_size}",
+        hide_index=True,
+        width="stretch",
+        disabled=archived or [c for c in ranking.columns if c not in ("taken", "result")],
+        column_order=[c for c in ranking.columns if c != "trade_id"],
+        column_config={
+            "#": st.column_config.NumberColumn("#", width="small"),
+            "date_trade": st.column_config.DateColumn("Date"),
+            "pair": "Paire",
+            "direction": "Sens",
+            "timeframe": "TF",
+            "session": "Session",
+            "score_percent": st.column_config.NumberColumn("Score", format="%.1f %%"),
+            "taken": st.column_config.SelectboxColumn("Pris ?", options=TAKEN_OPTIONS),
+            "result": st.column_config.SelectboxColumn("Résultat", options=RESULT_OPTIONS),
+            "commentaire": st.column_config.TextColumn("💬 Commentaire", width="large"),
+            "screenshot": st.column_config.ImageColumn("📷", width="small"),
+        },
+    )
 
-    for idx, row in df_sorted.iterrows():
-        st.markdown(
-            f"### {idx+1}. {row['date_trade']} — {row['pair']} {row['direction']} "
-            f"({row['timeframe']} / {row['session']}) → **{row['score_percent']:.1f}%**"
+    # Image en taille réelle seulement pour le trade choisi
+    shots = page_df[page_df["screenshot"].map(is_digest)]
+    if len(shots):
+        shown = st.selectbox(
+            "🖼️ Voir le screenshot",
+            [None, *shots.index],
+            format_func=lambda i: "—" if i is None else f"#{i + 1} {shots.at[i, 'pair']} {shots.at[i, 'direction']}",
         )
+        if shown is not None:
+            st.image(store.blobs.path(shots.at[shown, "screenshot"]))
+
+    # Diff par rapport à la feuille : remplace les modifications connues pour cette page
+    for sheet_row in ranking.index:
+        pending.pop(int(sheet_row), None)
+    pending.update({u["sheet_row"]: u for u in editor_updates(ranking, edited)})
+    if pending:
+        st.caption(f"✏️ {len(pending)} trade(s) modifié(s), pas encore enregistré(s) (toutes pages).")
+
+    if (not archived or pending) and st.button("💾 Enregistrer les modifications (pris / résultat)"):
+        try:
+            sent = store.update_taken_and_result(list(pending.values()))
+        except Exception as exc:
+            if not is_transient(exc):
+                raise
+            st.error(f"Modifications non enregistrées : Google Sheets ne répond pas (quota ou réseau), réessaie ({exc})")
+            return
+        pending.clear()
+        if sent["cells"] == 0 and not sent["missing"]:
+            st.info("Aucune modification à enregistrer.")
+            return
+        flash(
+            "success",
+            f"✅ Modifications enregistrées dans Google Sheets "
+            f"({sent['cells']} cellule(s), {sent['requests']} requête(s)).",
+        )
+        if sent["moved"]:
+            flash("info", f"{sent['moved']} trade(s) avaient changé de ligne dans la feuille : écrits à leur nouvelle position.")
+        if sent["missing"]:
+            flash("warning", f"{sent['missing']} trade(s) introuvable(s) dans la feuille (supprimés ?) : non modifiés.")
+        # Stats et perf dépendent des résultats : rerun complet
+        st.rerun()
 
-        st.write(f"Pris : {row.get('taken', '')} | Résultat : {row.get('result', '')}")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            taken_new = st.selectbox(
-                f"Pris ? (trade {idx+1})",
-                ["", "Oui", "Non"],
-                index=["", "Oui", "Non"].index(row["taken"]) if row["taken"] in ["Oui", "Non"] else 0,
-                key=f"taken_{row['sheet_row']}"
-            )
-        with col2:
-            result_new = st.selectbox(
-                f"Résultat (trade {idx+1})",
-                ["", "Win", "Loss", "BE", "Non pris"],
-                index=["", "Win", "Loss", "BE", "Non pris"].index(row["result"]) if row["result"] in ["Win", "Loss", "BE", "Non pris"] else 0,
-                key=f"result_{row['sheet_row']}"
-            )
-
-        updates.append({
-            "sheet_row": row["sheet_row"],
-            "taken": taken_new if taken_new != "" else None,
-            "result": result_new if result_new != "" else None,
-        })
-
-        if isinstance(row.get("commentaire", ""), str) and row["commentaire"].strip():
-            st.write(f"💬 _{row['commentaire']}_")
-        st.write("---")
-
-    if st.button("💾 Enregistrer les modifications (pris / résultat)"):
-        update_taken_and_result(updates)
-        st.success("✅ Modifications enregistrées dans Google Sheets (recharge la page pour voir à jour).")
 
-    # ------------------------------------------------------------------
-    # 2) Histogramme des scores
-    # ------------------------------------------------------------------
+@profiled("ui.histogram")
+def histogram_section(df_week: pd.DataFrame):
     st.subheader("📊 Distribution des scores")
 
-    chart_df = df_sorted[["datetime", "score_percent"]].copy()
-    chart_df = chart_df.set_index("datetime")
+    chart_df = df_week[["datetime", "score_percent"]].set_index("datetime")
 
     st.bar_chart(chart_df, y="score_percent")
 
-    # ------------------------------------------------------------------
-    # 3) Stats globales semaine
-    # ------------------------------------------------------------------
+
+@profiled("ui.stats")
+def stats_section(sel_year: int, sel_week: int):
     st.subheader("📈 Stats rapides (tous les trades de la semaine)")
 
-    moyenne = df_week["score_percent"].mean()
-    max_score = df_week["score_percent"].max()
-    min_score = df_week["score_percent"].min()
+    # Lues dans les rollups de la semaine, pas recalculées sur les trades
+    week = weekly(store.load_rollups().loc[[sel_year * 100 + sel_week]])
+    moyenne = week["score_mean"].iat[0]
+    max_score = week["score_max"].iat[0]
+    min_score = week["score_min"].iat[0]
 
     col_a, col_b, col_c = st.columns(3)
     col_a.metric("Score moyen", f"{moyenne:.1f} %")
     col_b.metric("Meilleur score", f"{max_score:.1f} %")
     col_c.metric("Pire score", f"{min_score:.1f} %")
 
-    # ------------------------------------------------------------------
-    # 4) Perf sur les trades PRIS uniquement
-    # ------------------------------------------------------------------
+
+@profiled("ui.perf")
+def perf_section(df_week: pd.DataFrame, sel_year: int, sel_week: int):
+    """Perf sur les trades PRIS uniquement."""
     st.subheader("🎯 Performance sur les trades PRIS uniquement")
 
     df_taken = df_week[df_week["taken"] == "Oui"].copy()
     if df_taken.empty:
         st.info("Tu n'as marqué aucun trade comme 'Pris' pour cette semaine.")
-        st.stop()
+        return
 
     # On ne compte que Win / Loss / BE dans le calcul winrate
     mask_eval = df_taken["result"].isin(["Win", "Loss", "BE"])
@@ -551,55 +530,368 @@ else:
     if df_eval.empty:
         st.info("Aucun résultat (Win/Loss/BE) renseigné pour les trades pris.")
     else:
-        wins = (df_eval["result"] == "Win").sum()
-        losses = (df_eval["result"] == "Loss").sum()
-        be = (df_eval["result"] == "BE").sum()
-        total = wins + losses + be
-        winrate = (wins / total * 100) if total > 0 else 0.0
+        # Une seule passe sur les trades ; chaque tableau re-groupe le cube
+        cube = week_perf_cube(df_eval, store.cache.version, sel_year, sel_week)
+        tot = totals(cube)
 
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Trades pris", len(df_taken))
-        col2.metric("Win", wins)
-        col3.metric("Loss", losses)
-        col4.metric("Winrate (Win / (W+L+BE))", f"{winrate:.1f} %")
+        col2.metric("Win", tot["win"])
+        col3.metric("Loss", tot["loss"])
+        col4.metric("Winrate (Win / (W+L+BE))", f"{tot['winrate']:.1f} %")
 
         # --------------------------------------------------------------
         # 5) Performance par paire
         # --------------------------------------------------------------
         st.subheader("📌 Performance par paire (trades pris)")
 
-        def agg_perf(group):
-            wins_g = (group["result"] == "Win").sum()
-            losses_g = (group["result"] == "Loss").sum()
-            be_g = (group["result"] == "BE").sum()
-            total_g = wins_g + losses_g + be_g
-            winrate_g = (wins_g / total_g * 100) if total_g > 0 else 0.0
-            return pd.Series({
-                "Trades": len(group),
-                "Win": wins_g,
-                "Loss": losses_g,
-                "BE": be_g,
-                "Winrate %": round(winrate_g, 1),
-                "Score moyen": round(group["score_percent"].mean(), 1),
-                "RR moyen": round(group["rr"].mean(), 2) if "rr" in group.columns else None,
-            })
-
-        perf_pair = df_eval.groupby("pair").apply(agg_perf).reset_index().sort_values("Winrate %", ascending=False)
-        st.dataframe(perf_pair, use_container_width=True)
+        with instrument.stage("perf.breakdown.pair"):
+            st.dataframe(breakdown(cube, "pair"), width="stretch")
 
         # --------------------------------------------------------------
         # 6) Performance Buy vs Sell
         # --------------------------------------------------------------
         st.subheader("🧭 Performance Buy vs Sell (trades pris)")
 
-        perf_dir = df_eval.groupby("direction").apply(agg_perf).reset_index().sort_values("Winrate %", ascending=False)
-        st.dataframe(perf_dir, use_container_width=True)
+        with instrument.stage("perf.breakdown.direction"):
+            st.dataframe(breakdown(cube, "direction"), width="stretch")
 
         # --------------------------------------------------------------
         # 7) Bonus : performance par session
         # --------------------------------------------------------------
         st.subheader("🕒 Performance par session (trades pris)")
 
-        perf_sess = df_eval.groupby("session").apply(agg_perf).reset_index().sort_values("Winrate %", ascending=False)
-        st.dataframe(perf_sess, use_container_width=True)
+        with instrument.stage("perf.breakdown.session"):
+            st.dataframe(breakdown(cube, "session"), width="stretch")
+
+
+@profiled("ui.week_select")
+def select_week():
+    """(année, semaine ISO) choisie, ou None si rien à afficher."""
+    if st.sidebar.button("🔄 Recharger depuis Google Sheets"):
+        # Resynchro complète : reprend aussi les cellules modifiées à la main
+        store.mirror.reset()
+        store.cache.invalidate()
+
+    weeks = sheets_data(store.list_weeks)
+    if weeks is None:
+        return None
+    if not weeks:
+        st.warning("Aucun trade enregistré pour l’instant.")
+        return None
+
+    today = date.today()
+    current_iso = today.isocalendar()
+    current_year, current_week = current_iso.year, current_iso.week
+
+    weeks_labels = [f"{y}-W{w}" for y, w in sorted(weeks, reverse=True)]
+
+    default_label = f"{current_year}-W{current_week}"
+    default_index = weeks_labels.index(default_label) if default_label in weeks_labels else 0
+
+    selected_label = st.selectbox(
+        "Choisis la semaine (année-ISOsemaine)",
+        weeks_labels,
+        index=default_index
+    )
+
+    sel_year, sel_week = selected_label.split("-W")
+    return int(sel_year), int(sel_week)
+
+
+def dashboard_page():
+    st.subheader("📅 Dashboard hebdo — scores & ranking")
+
+    selected = select_week()
+    if selected is None:
+        return
+    sel_year, sel_week = selected
+
+    df_week = sheets_data(lambda: store.load_week_trades(sel_year, sel_week))
+    if df_week is None:
+        return
+    if df_week.empty:
+        st.info("Aucun trade pour cette semaine.")
+        return
+
+    st.write(f"Trades pour la semaine {sel_year}-W{sel_week} : {len(df_week)} trade(s).")
+
+    # Chaque section ne dépend que de la semaine choisie et des données
+    ranking_section(sel_year, sel_week)
+    histogram_section(df_week)
+    stats_section(sel_year, sel_week)
+    perf_section(df_week, sel_year, sel_week)
+
+
+# =========================================================
+# MODE 3 : ANALYSE WHAT-IF
+# =========================================================
+@profiled("ui.whatif", fragment=True)
+def whatif_page():
+    """Poids et seuil en fragment : seule l'analyse est recalculée."""
+    st.subheader("🧪 Analyse what-if — seuil NO TRADE & poids des règles")
+
+    st.write(
+        "Re-calcule winrate, nombre de trades et espérance (en R) sur tout l'historique "
+        "des trades pris, pour un autre seuil ou d'autres poids. Seules les règles "
+        "dont les entrées sont enregistrées (RR, session) peuvent être re-pondérées."
+    )
+
+    data_version = store.cache.version
+    model = sheets_data(lambda: get_whatif_model(data_version))
+    if model is None:
+        return
+    if model.n == 0:
+        st.warning("Aucun trade pris avec un résultat Win / Loss / BE pour l'instant.")
+        return
+
+    weights = []
+    with st.expander("Poids des règles"):
+        for name in REWEIGHTABLE_RULES:
+            points = []
+            for i, (p, note) in enumerate(RULES_BY_NAME[name].outcomes):
+                label = re.sub(r"\s*\([+-]?\d+\)$", "", note) if note else "Autre session"
+                points.append(int(st.number_input(label, value=p, step=1, key=f"w_{name}_{i}")))
+            weights.append((name, tuple(points)))
+    weights = tuple(weights)
+
+    curve = whatif_curve(model, data_version, weights)
+    baseline = whatif_curve(model, data_version, tuple(default_weights().items()))
+
+    # Bornes fixées par la courbe de référence : le slider garde sa valeur
+    threshold = st.slider(
+        "Seuil NO TRADE (score minimum)",
+        int(baseline["threshold"].min()), int(baseline["threshold"].max()),
+        NO_TRADE_THRESHOLD,
+    )
+
+    now = at_threshold(baseline, NO_TRADE_THRESHOLD)
+    new = at_threshold(curve, threshold)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Trades gardés", int(new["trades"]), int(new["trades"] - now["trades"]))
+    col2.metric("Winrate", f"{new['winrate']:.1f} %", f"{new['winrate'] - now['winrate']:+.1f} pts")
+    col3.metric("Espérance (R / trade)", f"{new['expectancy_r']:.2f}", f"{new['expectancy_r'] - now['expectancy_r']:+.2f}")
+    st.caption(f"Référence : règles actuelles, seuil {NO_TRADE_THRESHOLD}% sur {model.n} trade(s) évalué(s).")
+
+    st.subheader("📉 Courbe par seuil")
+    chart = curve.set_index("threshold")
+    st.line_chart(chart[["winrate"]])
+    st.line_chart(chart[["expectancy_r"]])
+    st.line_chart(chart[["trades"]])
+
+
+# =========================================================
+# MODE 4 : TENDANCES MULTI-SEMAINES
+# =========================================================
+@st.cache_data(max_entries=32)
+def trend_view(_rollups: pd.DataFrame, data_version: int, last_weeks: int, window: int, pairs: tuple):
+    return trend(_rollups, last_weeks, window, pairs=list(pairs))
+
+
+@profiled("ui.trends", fragment=True)
+def trends_page():
+    """Tendances sur N semaines, lues dans les rollups hebdomadaires seulement."""
+    st.subheader("📆 Tendances multi-semaines")
+
+    rollups = sheets_data(store.load_rollups)
+    if rollups is None:
+        return
+    if rollups.empty:
+        st.info("Aucun trade daté pour l'instant.")
+        return
+
+    col_n, col_w = st.columns(2)
+    last_weeks = col_n.number_input("Semaines affichées", min_value=4, max_value=260, value=26, step=1)
+    window = col_w.number_input("Fenêtre glissante (semaines)", min_value=1, max_value=26, value=4, step=1)
+    all_pairs = sorted(rollups.index.get_level_values("pair").unique())
+    pairs = st.multiselect("Paires (toutes si vide)", all_pairs)
+
+    view = trend_view(rollups, store.cache.version, int(last_weeks), int(window), tuple(pairs))
+    taken = int(view["win"].sum() + view["loss"].sum() + view["be"].sum())
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Trades", int(view["trades"].sum()))
+    col2.metric("Trades pris évalués", taken)
+    col3.metric("Winrate", f"{view['win'].sum() / taken * 100:.1f} %" if taken else "—")
+
+    st.subheader("Winrate (trades pris, W / (W+L+BE))")
+    st.line_chart(view[["winrate", "winrate_rolling"]].rename(
+        columns={"winrate": "Semaine", "winrate_rolling": f"Glissant {window} sem."}
+    ))
+    st.subheader("Score moyen")
+    st.line_chart(view[["score_mean", "score_mean_rolling"]].rename(
+        columns={"score_mean": "Semaine", "score_mean_rolling": f"Glissant {window} sem."}
+    ))
+    st.subheader("Nombre de trades")
+    st.bar_chart(view[["trades"]].rename(columns={"trades": "Trades"}))
+
+    with st.expander("Détail par semaine"):
+        table = view.assign(semaine=view.index.strftime("%G-W%V")).set_index("semaine")
+        st.dataframe(pd.DataFrame({
+            "Trades": table["trades"],
+            "Pris": table["taken"],
+            "Win": table["win"],
+            "Loss": table["loss"],
+            "BE": table["be"],
+            "Winrate %": table["winrate"].round(1),
+            "Score moyen": table["score_mean"].round(1),
+            "Score min": table["score_min"],
+            "Score max": table["score_max"],
+        }), width="stretch")
+
+
+# =========================================================
+# MODE 5 : RECHERCHE
+# =========================================================
+SEARCH_MAX_ROWS = 500
+
+
+@profiled("ui.search", fragment=True)
+def search_page():
+    """Recherche plein texte + facettes sur tout l'historique (index, sans scan)."""
+    st.subheader("🔎 Recherche dans le journal")
+    st.caption(
+        "Ex. : `retest AND XAUUSD AND Loss AND score>=80` — AND (implicite), OR, NOT, parenthèses ; "
+        "`pair:`, `direction:`, `session:`, `timeframe:`, `taken:`, `result:`, `commentaire:` ; "
+        "`score` / `rr` avec >=, <=, >, <, =."
+    )
+    query = st.text_input("Requête")
+    if not query.strip():
+        return
+    try:
+        results = sheets_data(lambda: store.search_trades(query))
+    except ValueError as exc:
+        st.error(f"Requête invalide : {exc}")
+        return
+    if results is None:
+        return
+
+    evaluated = results[(results["taken"] == "Oui") & results["result"].isin(["Win", "Loss", "BE"])]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Trades trouvés", len(results))
+    col2.metric("Trades pris évalués", len(evaluated))
+    col3.metric(
+        "Winrate",
+        f"{(evaluated['result'] == 'Win').mean() * 100:.1f} %" if len(evaluated) else "—",
+    )
+    if results.empty:
+        return
+    if len(results) > SEARCH_MAX_ROWS:
+        st.caption(f"{SEARCH_MAX_ROWS} plus récents affichés.")
+    st.dataframe(
+        results.head(SEARCH_MAX_ROWS)[[
+            "datetime", "pair", "direction", "timeframe", "session",
+            "score_percent", "rr", "taken", "result", "commentaire",
+        ]],
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "datetime": st.column_config.DatetimeColumn("Date", format="YYYY-MM-DD HH:mm"),
+            "pair": "Paire",
+            "direction": "Sens",
+            "timeframe": "TF",
+            "session": "Session",
+            "score_percent": st.column_config.NumberColumn("Score", format="%.1f %%"),
+            "rr": st.column_config.NumberColumn("RR", format="%.2f"),
+            "taken": "Pris ?",
+            "result": "Résultat",
+            "commentaire": st.column_config.TextColumn("💬 Commentaire", width="large"),
+        },
+    )
+
+
+# =========================================================
+# MODE 6 : IMPORT CSV
+# =========================================================
+@profiled("ui.import")
+def import_page():
+    """Import en masse d'un relevé de broker ou d'un journal CSV."""
+    st.subheader("📥 Import d'un relevé de broker / journal CSV")
+    st.write(
+        "Colonnes reconnues : date/heure d'ouverture, symbole, sens (Buy / Sell), et si "
+        "présents timeframe, session, RR, commentaire, résultat ou profit. Les trades déjà "
+        "présents sont ignorés ; un import interrompu reprend là où il s'était arrêté."
+    )
+    uploaded = st.file_uploader("Fichier CSV", type=["csv", "txt"])
+    dayfirst = st.checkbox("Dates au format jour/mois/année", value=False)
+    if uploaded is None or not st.button("Importer"):
+        return
+
+    bar = st.progress(0.0, text="Lecture du fichier…")
+
+    def progress(stats):
+        done = stats["read"] / stats["total"] if stats["total"] else 0.0
+        text = (
+            f"{stats['read']} / {stats['total']} ligne(s) lue(s) — {stats['imported']} importé(s), "
+            f"{stats['duplicates']} doublon(s), {stats['pending']} en attente d'envoi"
+        )
+        if stats["error"]:
+            text += " — Google Sheets ne répond pas, nouvel essai automatique"
+        bar.progress(min(done, 1.0), text=text)
+
+    try:
+        stats = import_trades(store, uploaded, dayfirst=dayfirst, on_progress=progress)
+    except ValueError as exc:
+        st.error(f"Import impossible : {exc}")
+        return
+    if stats["resumed_from"]:
+        st.info(f"Import repris à la ligne {stats['resumed_from'] + 1}.")
+    if stats["stalled"]:
+        st.warning(
+            f"Import interrompu à la ligne {stats['read'] + 1} : Google Sheets ne prend plus les envois "
+            f"({stats['error'] or 'aucun progrès'}). Relance l'import plus tard pour reprendre."
+        )
+    st.success(
+        f"✅ {stats['imported']} trade(s) importé(s), {stats['duplicates']} doublon(s) ignoré(s), "
+        f"{stats['invalid']} ligne(s) invalide(s)."
+        + (f" {stats['pending']} en cours d'envoi vers Google Sheets." if stats["pending"] else "")
+    )
+
+
+mode = st.sidebar.selectbox(
+    "Mode",
+    ["Nouveau trade", "Dashboard hebdo", "Tendances", "Recherche", "Analyse what-if", "Import CSV"]
+)
+
+# Profilage opt-in : le panneau montre le rerun précédent (celui-ci n'est pas fini)
+debug = st.sidebar.toggle("Profilage (debug)", value=False, key="debug")
+last_run = st.session_state.get("perf_run")
+# Run fermé même sur st.rerun / st.stop : un rerun de fragment sur ce
+# thread ne doit pas s'y rattacher
+with instrument.run(mode, enabled=debug) as perf_run:
+    st.session_state["perf_run"] = perf_run
+    if debug:
+        debug_panel(last_run)
+
+    with instrument.stage("store.open"):
+        store = get_store()
+
+    write_queue = store.queue
+    latency = write_queue.last_flush_latency
+    st.sidebar.caption(
+        f"📤 En attente d'envoi : {write_queue.depth} | Dernier envoi : "
+        + (f"{latency * 1000:.0f} ms" if latency is not None else "—")
+    )
+    if write_queue.last_error:
+        st.sidebar.warning(f"Envoi vers Google Sheets en échec, nouvel essai automatique ({write_queue.last_error})")
+    with st.sidebar:
+        reports_panel()
+
+    # Le formulaire s'affiche tout de suite ; les autres modes lisent les trades
+    if mode != "Nouveau trade" and not store.warmed.is_set():
+        with st.spinner("Connexion à Google Sheets…"):
+            store.warmed.wait()
+
+    if mode == "Nouveau trade":
+        new_trade_page()
+    elif mode == "Dashboard hebdo":
+        dashboard_page()
+    elif mode == "Tendances":
+        trends_page()
+    elif mode == "Recherche":
+        search_page()
+    elif mode == "Analyse what-if":
+        whatif_page()
+    else:
+        import_page()
 
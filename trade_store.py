@@ -0,0 +1,834 @@
+"""
+Couche de données des trades, indépendante de Streamlit.
+
+TradeStore relie un worksheet (voir storage.py) au miroir SQLite local,
+au cache partagé du DataFrame, à l'index trade_id -> ligne, à la file
+d'écriture différée et à l'archive Parquet des semaines anciennes (voir
+archive.py). L'UI, les benchmarks et les scripts passent tous par cette
+classe.
+"""
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import rollup
+from a1 import col_letter, rowcol_to_a1
+from archive import TradeArchive
+from search import SearchIndex, parse
+from blobstore import BlobStore
+from mirror import HeaderMismatch, SheetMirror
+from sheetpool import is_transient
+from writebehind import WriteBehindQueue
+
+TRADE_COLUMNS = [
+    "datetime","date_trade","pair","direction","timeframe",
+    "session","rr","score_percent","commentaire","taken","result","trade_id","screenshot"
+]
+
+# Colonnes à faible cardinalité, stockées en codes catégoriels
+CATEGORY_COLUMNS = ("pair", "direction", "timeframe", "session", "taken", "result")
+FLOAT_COLUMNS = ("rr", "score_percent")
+
+log = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Frames parsés de l'archive gardés en mémoire (semaines, colonnes)
+COLD_CACHE_ENTRIES = 8
+
+
+def new_trade_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _add_missing_columns(ws, header):
+    """
+    Ancien en-tête (préfixe de TRADE_COLUMNS) : ajoute les colonnes
+    manquantes en fin de feuille, trade_id rempli pour les lignes existantes.
+    """
+    missing = TRADE_COLUMNS[len(header):]
+    n_rows = len(ws.col_values(1))
+    if ws.col_count < len(TRADE_COLUMNS):
+        ws.add_cols(len(TRADE_COLUMNS) - ws.col_count)
+    values = [missing] + [
+        [new_trade_id() if c == "trade_id" else "" for c in missing]
+        for _ in range(n_rows - 1)
+    ]
+    first = rowcol_to_a1(1, len(header) + 1)
+    last = rowcol_to_a1(n_rows, len(TRADE_COLUMNS))
+    ws.update(range_name=f"{first}:{last}", values=values)
+
+
+def _reorder_columns(ws):
+    """
+    Colonnes de TRADE_COLUMNS ramenées en tête, dans l'ordre, d'après leur
+    nom : déplacées (moveDimension) ou insérées (insertDimension) en une
+    requête, les colonnes inconnues à la suite. Aucune cellule existante
+    n'est réécrite : valeurs, formules et formats suivent leur colonne ;
+    seuls l'en-tête des colonnes ajoutées et les trade_id manquants sont écrits.
+    """
+    values = ws.get_all_values()
+    # Colonnes sans nom mais remplies : traitées comme des colonnes inconnues
+    cols = _pad(values[0], max(len(r) for r in values))
+    requests, added = [], []
+    for i, name in enumerate(TRADE_COLUMNS):
+        if i < len(cols) and cols[i] == name:
+            continue
+        if name in cols[i:]:
+            j = cols.index(name, i)
+            requests.append({"moveDimension": {
+                "source": {"dimension": "COLUMNS", "startIndex": j, "endIndex": j + 1},
+                "destinationIndex": i,
+            }})
+            cols.insert(i, cols.pop(j))
+            continue
+        if i < len(cols):
+            requests.append({"insertDimension": {
+                "range": {"dimension": "COLUMNS", "startIndex": i, "endIndex": i + 1},
+                "inheritFromBefore": False,
+            }})
+        cols.insert(i, name)
+        added.append(i)
+    inserted = sum("insertDimension" in r for r in requests)
+    if len(cols) > ws.col_count + inserted:
+        requests.append({"appendDimension": {"dimension": "COLUMNS", "length": len(cols) - ws.col_count - inserted}})
+    if requests:
+        ws.update_dimensions(requests)
+
+    data = []
+    for i in added:
+        column = [[TRADE_COLUMNS[i]]]
+        if TRADE_COLUMNS[i] == "trade_id":
+            column += [[new_trade_id() if any(r) else ""] for r in values[1:]]
+        data.append({"range": f"{col_letter(i + 1)}1:{col_letter(i + 1)}{len(column)}", "values": column})
+    if data:
+        ws.batch_update(data)
+
+
+def ensure_header(ws, header=None) -> bool:
+    """
+    Aligne l'en-tête de la feuille sur TRADE_COLUMNS, par nom, sans
+    jamais effacer de données. header : première ligne déjà lue (sinon
+    relue). Retourne True si la feuille a été modifiée.
+    """
+    if header is None:
+        header = ws.row_values(1)
+    n = len(TRADE_COLUMNS)
+    if header[:n] == TRADE_COLUMNS:
+        return False
+    if not any(header):
+        # Feuille neuve (ou première ligne vide) : en-tête seul
+        ws.update(range_name=f"A1:{rowcol_to_a1(1, n)}", values=[TRADE_COLUMNS])
+    elif header == TRADE_COLUMNS[:len(header)]:
+        _add_missing_columns(ws, header)
+    else:
+        _reorder_columns(ws)
+    return True
+
+
+def build_week_index(df: pd.DataFrame) -> dict:
+    """{(iso_year, iso_week): positions des lignes} à partir des colonnes ISO."""
+    with instrument.stage("week.index", rows=len(df)):
+        return _build_week_index(df)
+
+
+def _build_week_index(df: pd.DataFrame) -> dict:
+    years = df["iso_year"].to_numpy(dtype="float64", na_value=np.nan)
+    weeks = df["iso_week"].to_numpy(dtype="float64", na_value=np.nan)
+    pos = np.flatnonzero(~np.isnan(years))
+    if not len(pos):
+        return {}
+    key = years[pos].astype(np.int64) * 100 + weeks[pos].astype(np.int64)
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    bounds = np.flatnonzero(np.diff(sorted_key)) + 1
+    groups = np.split(pos[order], bounds)
+    return {(int(k // 100), int(k % 100)): g for k, g in zip(sorted_key[np.r_[0, bounds]], groups)}
+
+
+def _factorize(values):
+    """Codes (-1 = manquant) et valeurs distinctes : chaque conversion ne
+    porte que sur les valeurs distinctes, puis est diffusée par les codes."""
+    return pd.factorize(np.asarray(values, dtype=object))
+
+
+def _categorical(values) -> pd.Categorical:
+    codes, uniques = _factorize(values)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+
+def _float32(values) -> np.ndarray:
+    codes, uniques = _factorize(values)
+    table = pd.to_numeric(np.asarray(uniques, dtype=object), errors="coerce").astype(np.float32)
+    return np.append(table, np.float32(np.nan))[codes]
+
+
+def _interned(values) -> pd.Series:
+    """Une seule chaîne Python par valeur distincte (commentaires vides ou répétés)."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    table = np.array([sys.intern(u) if isinstance(u, str) else u for u in uniques], dtype=object)
+    return pd.Series(table[codes], dtype=object)
+
+
+def _dates(values):
+    """(dates, semaine ISO) : quelques centaines de dates distinctes pour des milliers de trades."""
+    codes, uniques = _factorize(values)
+    parsed = pd.to_datetime(np.asarray(uniques, dtype=object), errors="coerce")
+    iso = parsed.isocalendar()
+    return (
+        parsed.take(codes, allow_fill=True, fill_value=pd.NaT),
+        iso["year"].astype("Int32").array.take(codes, allow_fill=True),
+        iso["week"].astype("Int8").array.take(codes, allow_fill=True),
+    )
+
+
+def build_frame(raw) -> pd.DataFrame:
+    """
+    DataFrame compact et typé, construit en une passe depuis les valeurs
+    brutes ({colonne: valeurs texte} ou DataFrame brut) : catégories pour
+    CATEGORY_COLUMNS, float32 pour rr / score_percent, commentaires
+    internés, dates en datetime64 et semaine ISO en entiers.
+    """
+    out = {}
+    iso = None
+    with instrument.stage("parse.coerce") as s:
+        for col in raw:
+            values = raw[col]
+            if col in CATEGORY_COLUMNS:
+                out[col] = _categorical(values)
+            elif col in FLOAT_COLUMNS:
+                out[col] = _float32(values)
+            elif col == "commentaire":
+                out[col] = _interned(values)
+            elif col == "date_trade":
+                with instrument.stage("parse.iso_week"):
+                    # Semaine ISO calculée une fois, en vectorisé, au chargement
+                    out[col], *iso = _dates(values)
+            elif col == "datetime":
+                out[col] = pd.to_datetime(np.asarray(values, dtype=object), errors="coerce", format="ISO8601")
+            elif col == "sheet_row":
+                out[col] = np.asarray(values, dtype=np.int64)
+            else:
+                out[col] = np.asarray(values, dtype=object)
+        if iso is not None:
+            out["iso_year"], out["iso_week"] = iso
+        df = pd.DataFrame(out)
+        s.rows = len(df)
+    return df
+
+
+def _concat(df: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Ajout de lignes en gardant les colonnes catégorielles (catégories réunies)."""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and col in new.columns:
+            cats = df[col].cat.categories.union(new[col].cat.categories)
+            if not cats.equals(df[col].cat.categories):
+                df = df.assign(**{col: df[col].cat.set_categories(cats)})
+            new = new.assign(**{col: new[col].cat.set_categories(cats)})
+    return pd.concat([df, new], ignore_index=True)
+
+
+class TradeCache:
+    """
+    DataFrame des trades déjà parsé, partagé par toutes les sessions, avec
+    son index par semaine ISO. Borné en durée (TTL) et en mémoire ; chaque
+    écriture ou rechargement incrémente la version, ce qui empêche un
+    chargement concurrent d'écraser un patch et sert de clé aux calculs
+    dérivés mis en cache.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.version = 0
+        self._df = None
+        self._weeks = {}
+        self._rollups = None
+        # Index de recherche du frame, construit à la première recherche
+        self._search = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        (df, index semaines, rollups) partagés par toutes les sessions, sans
+        copie : lecture seule. Le DataFrame n'est jamais modifié en place,
+        les patchs en construisent un nouveau.
+        """
+        with self._lock:
+            if self._df is None or time.monotonic() - self._loaded_at > self.ttl:
+                return None
+            return self._df, self._weeks, self._rollups
+
+    def put(self, df: pd.DataFrame, version: int):
+        if df.memory_usage(deep=True).sum() > self.max_bytes:
+            return
+        weeks = build_week_index(df)
+        rollups = rollup.build_rollups(df)
+        with self._lock:
+            if version != self.version:
+                return
+            self.version += 1
+            self._df = df
+            self._weeks = weeks
+            self._rollups = rollups
+            self._search = None
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._df = None
+            self._weeks = {}
+            self._rollups = None
+            self._search = None
+
+    def search_index(self, df: pd.DataFrame) -> SearchIndex:
+        """Index de recherche de df, gardé tant que df est le frame en cache."""
+        with self._lock:
+            if self._df is df and self._search is not None:
+                return self._search
+        index = SearchIndex.build(df)
+        with self._lock:
+            if self._df is df:
+                self._search = index
+        return index
+
+    def patch_append(self, rows, sheet_rows):
+        """Ajoute un lot de lignes (listes dans l'ordre de TRADE_COLUMNS)."""
+        columns = list(zip(*rows))
+        new = build_frame({**dict(zip(TRADE_COLUMNS, columns)), "sheet_row": list(sheet_rows)})
+        with self._lock:
+            self.version += 1
+            if self._df is None:
+                return
+            pos = len(self._df)
+            # Copie à l'écriture : les snapshots déjà distribués restent cohérents
+            self._df = _concat(self._df, new)
+            added = _build_week_index(new)
+            if added:
+                weeks = dict(self._weeks)
+                for key, positions in added.items():
+                    weeks[key] = np.append(weeks.get(key, np.empty(0, dtype=np.int64)), positions + pos)
+                self._weeks = weeks
+                self._rollups = rollup.apply_append(self._rollups, new)
+            if self._search is not None:
+                self._search = self._search.extended(new)
+
+    def patch_cells(self, updates):
+        with self._lock:
+            self.version += 1
+            if self._df is None:
+                return
+            pos = pd.Series(self._df.index, index=self._df["sheet_row"])
+            # Copie à l'écriture des seules colonnes modifiées
+            df = self._df.copy(deep=False)
+            touched = set()
+            for col in ("taken", "result"):
+                changes = {
+                    pos[int(u["sheet_row"])]: u[col]
+                    for u in updates
+                    if u.get(col) is not None and int(u["sheet_row"]) in pos.index
+                }
+                if not changes:
+                    continue
+                column = df[col]
+                new_cats = set(changes.values()) - set(column.cat.categories)
+                column = column.cat.add_categories(sorted(new_cats)) if new_cats else column.copy()
+                if self._search is not None:
+                    self._search = self._search.with_changes(
+                        col, list(changes), df[col].loc[list(changes)], list(changes.values())
+                    )
+                column.loc[list(changes)] = list(changes.values())
+                df[col] = column
+                touched.update(changes)
+            if touched:
+                touched = sorted(touched)
+                self._rollups = rollup.apply_change(self._rollups, self._df.loc[touched], df.loc[touched])
+            self._df = df
+
+
+class TradeIndex:
+    """trade_id -> numéro de ligne Sheets, maintenu au fil des ajouts."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, trade_ids, sheet_rows):
+        rows = {tid: int(r) for tid, r in zip(trade_ids, sheet_rows) if tid}
+        with self._lock:
+            self._rows = rows
+
+    def add(self, trade_id: str, sheet_row: int):
+        if trade_id:
+            with self._lock:
+                self._rows[trade_id] = int(sheet_row)
+
+    def get(self, trade_id):
+        return self._rows.get(trade_id)
+
+
+def _pad(row, width: int) -> list:
+    return (list(row) + [""] * width)[:width]
+
+
+def _row_ranges(rows) -> list:
+    """(première, dernière) des plages de numéros de ligne consécutifs, de bas en haut."""
+    ranges = []
+    for r in sorted(rows, reverse=True):
+        if ranges and ranges[-1][0] == r + 1:
+            ranges[-1][0] = r
+        else:
+            ranges.append([r, r])
+    return ranges
+
+
+def _row_key(row) -> str:
+    """Clé d'idempotence d'une ligne : son trade_id."""
+    i = TRADE_COLUMNS.index("trade_id")
+    return str(row[i]) if i < len(row) else ""
+
+
+class TradeStore:
+    """
+    Accès aux trades d'un worksheet. data_dir contient le miroir SQLite
+    (trades.sqlite) et le journal d'écriture différée (journal.jsonl) ;
+    blob_dir (par défaut data_dir/blobs) les screenshots ; archive_dir
+    (par défaut data_dir/archive) les semaines archivées. hot_weeks :
+    nombre de semaines gardées dans la feuille, semaine en cours comprise
+    (None = pas d'archivage).
+
+    La construction ne fait aucun appel réseau : l'en-tête est vérifié au
+    premier accès à la feuille (voir ensure_schema), et le writer démarre
+    dans un thread de fond une fois l'en-tête relu et remis en ordre.
+    """
+
+    def __init__(self, ws, data_dir: str = ".trade_cache",
+                 cache_ttl: float = CACHE_TTL_SECONDS, cache_max_bytes: int = CACHE_MAX_BYTES,
+                 start_writer: bool = True, blob_dir: str = None,
+                 archive_dir: str = None, hot_weeks: int = None):
+        self.ws = ws
+        self.data_dir = data_dir
+        # Screenshots : seul leur hash est écrit dans la feuille
+        self.blobs = BlobStore(blob_dir or os.path.join(data_dir, "blobs"))
+        self.archive = TradeArchive(archive_dir or os.path.join(data_dir, "archive"), TRADE_COLUMNS)
+        self.hot_weeks = hot_weeks
+        self.cache = TradeCache(cache_ttl, cache_max_bytes)
+        self._archive_version = self.archive.version
+        self._cold = functools.lru_cache(maxsize=COLD_CACHE_ENTRIES)(self._read_cold)
+        self._rollups = (None, None, None)
+        self._cold_search = (None, None, None)
+        # Édition pris / résultat, réécriture de la feuille par l'archivage
+        # et remise en ordre des colonnes (réentrant : voir _fix_header)
+        self._write_lock = threading.RLock()
+        self._schema_checked = False
+        # Connexion et premier chargement faits en fond (voir start_warm_up)
+        self.warmed = threading.Event()
+        self.index = TradeIndex()
+        # Dernière synchro en échec (quota / réseau) : données servies depuis le miroir
+        self.sync_error = None
+        self.mirror = SheetMirror(os.path.join(data_dir, "trades.sqlite"), TRADE_COLUMNS, key="trade_id")
+        self.queue = WriteBehindQueue(
+            os.path.join(data_dir, "journal.jsonl"), ws, _row_key,
+            TRADE_COLUMNS.index("trade_id") + 1, on_flushed=self._on_trades_flushed
+        )
+        if start_writer:
+            threading.Thread(target=self._start_writer, name="writer-start", daemon=True).start()
+
+    # ── connexion et en-tête ──────────────────────────────
+    def ensure_schema(self, verify: bool = False):
+        """
+        En-tête de la feuille vérifié une fois par process. Sans appel
+        réseau si le miroir a déjà été synchronisé avec ces colonnes (chemin
+        de l'UI) : chaque synchro relit l'en-tête de toute façon
+        (HeaderMismatch). verify=True : en-tête toujours relu.
+        """
+        if self._schema_checked and not verify:
+            return
+        with self._write_lock:
+            if self._schema_checked and not verify:
+                return
+            if verify or not self.mirror.has_synced():
+                with instrument.stage("sheet.header"):
+                    self._fix_header(None)
+            self._schema_checked = True
+
+    def _fix_header(self, header):
+        """Colonnes remises en place par nom (voir ensure_header) ; caches locaux invalidés si besoin."""
+        with self._write_lock, self.queue.paused():
+            if ensure_header(self.ws, header):
+                log.warning("en-tête de la feuille réaligné sur %s", TRADE_COLUMNS)
+                self.mirror.reset()
+                self.cache.invalidate()
+
+    def _start_writer(self):
+        # Les lignes journalisées sont dans l'ordre de TRADE_COLUMNS : en-tête relu
+        # avant le premier envoi (feuille neuve, colonnes réordonnées à la main)
+        attempt = 0
+        while True:
+            try:
+                self.ensure_schema(verify=True)
+                break
+            except Exception as exc:
+                delay = min(60.0, 2.0 ** attempt)
+                log.warning("vérification de l'en-tête en échec, nouvel essai dans %.0f s : %s", delay, exc)
+                attempt += 1
+                time.sleep(delay)
+        self.queue.start()
+
+    def start_warm_up(self):
+        """
+        Connexion (imports gspread / google-auth compris), en-tête et
+        premier chargement dans un thread de fond : l'app s'affiche sans
+        attendre le réseau. warmed est levé à la fin, même en échec.
+        """
+        def run():
+            try:
+                with instrument.run("warm_up"):
+                    self._load_snapshot()
+            except Exception as exc:
+                log.warning("préchargement des trades en échec : %s", exc)
+            finally:
+                self.warmed.set()
+
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+    # ── écriture : ajout ──────────────────────────────────
+    def _on_trades_flushed(self, entries):
+        """Appelé par le worker après écriture : met à jour miroir, index et cache."""
+        written = [e for e in entries if e["sheet_row"] is not None]
+        if len(written) < len(entries):
+            self.cache.invalidate()
+        if not written:
+            return
+        self.mirror.apply_appends([(e["sheet_row"], e["row"]) for e in written])
+        for e in written:
+            self.index.add(_row_key(e["row"]), e["sheet_row"])
+        self.cache.patch_append([e["row"] for e in written], [e["sheet_row"] for e in written])
+
+    def _trade_row(self, row_dict: dict) -> list:
+        row = [row_dict.get(c, "") for c in TRADE_COLUMNS]
+        row[TRADE_COLUMNS.index("trade_id")] = row_dict.get("trade_id") or new_trade_id()
+        return row
+
+    def append_trade(self, row_dict: dict) -> str:
+        """Ajoute un trade en fin de feuille (journalisé puis envoyé en fond)."""
+        return self.append_trades([row_dict])[0]
+
+    def append_trades(self, row_dicts) -> list:
+        """Ajoute un lot de trades : une écriture du journal, envoi par append_rows."""
+        rows = [self._trade_row(d) for d in row_dicts]
+        with instrument.stage("write.enqueue", rows=len(rows)):
+            return self.queue.enqueue_many(rows)
+
+    # ── lecture ───────────────────────────────────────────
+    def fetch_all_trades(self) -> pd.DataFrame:
+        """
+        Synchronise le miroir local puis le convertit en DataFrame typé (sans
+        cache). Si la feuille reste inaccessible après les retries du pool,
+        le miroir est servi tel quel et sync_error est renseigné.
+        """
+        self.ensure_schema()
+        try:
+            with instrument.stage("mirror.sync") as s:
+                try:
+                    s.rows = self.mirror.sync(self.ws)["appended"]
+                except HeaderMismatch as exc:
+                    # En-tête modifié dans la feuille : colonnes remises en place, puis resynchro
+                    self._fix_header(exc.header)
+                    s.rows = self.mirror.sync(self.ws)["appended"]
+            self.sync_error = None
+        except Exception as exc:
+            if not is_transient(exc) or not self.mirror.row_count():
+                raise
+            self.sync_error = f"{type(exc).__name__}: {exc}"
+            log.warning("synchro de la feuille en échec, miroir local servi : %s", exc)
+        # sheet_row = index de ligne réelle dans la feuille (1 = header)
+        with instrument.stage("mirror.read") as s:
+            raw = self.mirror.read_columns()
+            s.rows = len(raw["sheet_row"])
+        df = build_frame(raw)
+        self.index.rebuild(df["trade_id"], df["sheet_row"])
+        return df
+
+    def _load_snapshot(self):
+        """(df, index semaines, rollups) depuis le cache partagé, rechargé si besoin."""
+        version = self.archive.version
+        if version != self._archive_version:
+            # Archivage (ici ou par un autre process) : des lignes ont quitté la feuille
+            self._archive_version = version
+            self.cache.invalidate()
+        snap = self.cache.snapshot()
+        if snap is None:
+            version = self.cache.version
+            df = self.fetch_all_trades()
+            if self.sync_error is None:
+                # Données du miroir seul : pas mises en cache, nouvel essai au prochain chargement
+                self.cache.put(df, version)
+            # Cache refusé (trop gros / écriture concurrente) : index calculé ici
+            snap = self.cache.snapshot() or (df, build_week_index(df), rollup.build_rollups(df))
+        return snap
+
+    def _read_cold(self, weeks, columns, version) -> pd.DataFrame:
+        """Trades archivés des semaines weeks (None = toutes), parsés comme ceux de la feuille."""
+        with instrument.stage("archive.read") as s:
+            raw = self.archive.read(weeks, columns)
+            s.rows = n = len(next(iter(raw.values())))
+        if columns is None:
+            # Hors de la feuille : pas de ligne, pas d'édition
+            raw["sheet_row"] = np.zeros(n, dtype=np.int64)
+        return build_frame(raw)
+
+    def load_all_trades(self, columns=None) -> pd.DataFrame:
+        """
+        Tous les trades, archivés compris : lecture seule. columns (parmi
+        TRADE_COLUMNS) limite les colonnes lues dans l'archive.
+        """
+        df = self._load_snapshot()[0]
+        if columns is not None:
+            columns = tuple(columns)
+            df = df[list(columns)]
+        if not self.archive.weeks():
+            return df
+        return _concat(self._cold(None, columns, self.archive.version), df)
+
+    def load_week_index(self) -> dict:
+        """{(iso_year, iso_week): positions} des semaines ayant des trades dans la feuille."""
+        return self._load_snapshot()[1]
+
+    def list_weeks(self) -> list:
+        """Toutes les semaines ayant des trades, feuille et archive, triées."""
+        return sorted(set(self.load_week_index()) | set(self.archive.weeks()))
+
+    def load_rollups(self) -> pd.DataFrame:
+        """
+        Agrégats par (semaine, paire), tenus à jour à chaque écriture (voir
+        rollup.py), cumulés à ceux de l'archive.
+        """
+        hot = self._load_snapshot()[2]
+        cold = self.archive.rollups()
+        if cold is None:
+            return hot
+        merged_hot, merged_cold, merged = self._rollups
+        if merged_hot is not hot or merged_cold is not cold:
+            merged = rollup.merge(cold, hot)
+            self._rollups = (hot, cold, merged)
+        return merged
+
+    def load_week_trades(self, iso_year: int, iso_week: int) -> pd.DataFrame:
+        """
+        Trades d'une semaine ISO, lus via l'index (coût indépendant de
+        l'historique) ; semaine archivée : sa seule partition est lue.
+        """
+        df, weeks, _ = self._load_snapshot()
+        pos = weeks.get((iso_year, iso_week))
+        with instrument.stage("week.filter", rows=0 if pos is None else len(pos)):
+            hot = df.iloc[0:0].copy() if pos is None else df.iloc[pos].copy()
+        if not self.archive.has_week(iso_year, iso_week):
+            return hot
+        return _concat(self._cold(((iso_year, iso_week),), None, self.archive.version), hot)
+
+    # ── recherche ─────────────────────────────────────────
+    def _search_indexes(self) -> list:
+        """(frame, index de recherche) de la feuille, puis de l'archive si elle n'est pas vide."""
+        df = self._load_snapshot()[0]
+        out = [(df, self.cache.search_index(df))]
+        version = self.archive.version
+        if self.archive.weeks():
+            if self._cold_search[0] != version:
+                cold = self._cold(None, None, version)
+                self._cold_search = (version, cold, SearchIndex.build(cold))
+            out.insert(0, self._cold_search[1:])
+        return out
+
+    def search_trades(self, query: str) -> pd.DataFrame:
+        """
+        Trades (feuille et archive) correspondant à la requête (voir
+        search.py), les plus récents d'abord. ValueError si la requête est invalide.
+        """
+        tree = parse(query)
+        indexes = self._search_indexes()
+        with instrument.stage("search.query") as s:
+            found = [df.iloc[index.evaluate(tree)] for df, index in indexes]
+            df = found[0] if len(found) == 1 else _concat(*found)
+            s.rows = len(df)
+            return df.sort_values("datetime", ascending=False, kind="stable")
+
+    # ── archivage ─────────────────────────────────────────
+    def archive_older_than(self, hot_weeks: int, today: date = None) -> dict:
+        """
+        Déplace vers l'archive les trades des semaines ISO antérieures aux
+        hot_weeks dernières, semaine en cours comprise. Les semaines de la
+        feuille sont d'abord cherchées dans l'index local : sans semaine à
+        déplacer, ni lecture complète de la feuille ni pause de la file
+        d'écriture. Sinon l'archive est écrite d'abord, puis leurs lignes
+        supprimées de la feuille (deleteDimension, en une requête), file
+        d'écriture en pause : les autres cellules ne sont jamais réécrites.
+        Après une interruption entre les deux, les trades déjà archivés
+        (même trade_id) sont seulement retirés de la feuille. Retourne
+        {"archived", "kept", "weeks"}.
+        """
+        iso = ((today or date.today()) - timedelta(weeks=hot_weeks - 1)).isocalendar()
+        cutoff = iso[0] * 100 + iso[1]
+        df, hot, _ = self._load_snapshot()
+        if not any(year * 100 + week < cutoff for year, week in hot):
+            return {"archived": 0, "kept": len(df), "weeks": 0}
+        self.ensure_schema()
+        with instrument.stage("archive.move") as s, self._write_lock, self.queue.paused():
+            values = self.ws.get_all_values()
+            # Colonnes inconnues après les nôtres : archivées avec leurs lignes
+            width = max([len(TRADE_COLUMNS)] + [len(r) for r in values])
+            rows = [_pad(r, width) for r in values[1:]]
+            _, years, weeks = _dates([r[TRADE_COLUMNS.index("date_trade")] for r in rows])
+            keys = years.to_numpy("float64", na_value=np.nan) * 100 + weeks.to_numpy("float64", na_value=np.nan)
+            old = keys < cutoff
+            if not old.any():
+                return {"archived": 0, "kept": len(rows), "weeks": 0}
+
+            # Colonne trade_id relue avant de supprimer : une ligne déplacée depuis
+            # la lecture (tri à la main, autre process) est retrouvée par son id ;
+            # une ligne sans id n'est retirée que si la colonne n'a pas bougé
+            i = TRADE_COLUMNS.index("trade_id")
+            ids = self.ws.col_values(i + 1)[1:]
+            snapshot = [r[i] for r in rows]
+            while snapshot and not snapshot[-1]:
+                snapshot.pop()
+            where = {tid: row for row, tid in enumerate(ids, start=2) if tid}
+            targets = {}
+            for p in np.flatnonzero(old):
+                if rows[p][i] in where:
+                    targets[where[rows[p][i]]] = p
+                elif not rows[p][i] and ids == snapshot:
+                    targets[p + 2] = p
+
+            archived = self.archive.trade_ids()
+            fresh = [p for p in targets.values() if not rows[p][i] or rows[p][i] not in archived]
+            groups = {}
+            for p in fresh:
+                groups.setdefault((int(years[p]), int(weeks[p])), []).append(rows[p])
+            if fresh:
+                moved = build_frame(dict(zip(TRADE_COLUMNS, zip(*(rows[p] for p in fresh)))))
+                self.archive.write(groups, rollup.build_rollups(moved), header=_pad(values[0], width))
+
+            if targets:
+                # De bas en haut : les indices des plages suivantes restent valides
+                self.ws.update_dimensions([
+                    {"deleteDimension": {"range": {"dimension": "ROWS", "startIndex": first - 1, "endIndex": last}}}
+                    for first, last in _row_ranges(targets)
+                ])
+            s.rows = n = len(targets)
+        # Miroir resynchronisé et cache rechargé au prochain chargement
+        self.cache.invalidate()
+        return {"archived": n, "kept": len(rows) - n, "weeks": len(groups)}
+
+    def start_archiving(self):
+        """Archivage selon hot_weeks dans un thread de fond (au démarrage de l'app)."""
+        if self.hot_weeks is None:
+            return
+
+        def run():
+            try:
+                with instrument.run("archive"):
+                    self.archive_older_than(self.hot_weeks)
+            except Exception as exc:
+                log.warning("archivage des anciennes semaines en échec : %s", exc)
+
+        threading.Thread(target=run, name="archiver", daemon=True).start()
+
+    # ── écriture : pris / résultat ────────────────────────
+    def _resolve_rows(self, updates) -> dict:
+        """
+        Ligne cible de chaque update via l'index trade_id -> ligne, vérifiée par
+        une lecture des cellules trade_id. Si des lignes ont bougé (tri, ajout
+        concurrent, suppression), seule la colonne trade_id est relue.
+        """
+        id_col = TRADE_COLUMNS.index("trade_id") + 1
+        rows, requests, moved, missing = [], 0, 0, 0
+
+        for u in updates:
+            tid = u.get("trade_id")
+            row = self.index.get(tid) if tid else None
+            rows.append(row if row is not None else int(u["sheet_row"]))
+
+        checked = [i for i, u in enumerate(updates) if u.get("trade_id")]
+        if checked:
+            cells = self.ws.batch_get([rowcol_to_a1(rows[i], id_col) for i in checked])
+            requests += 1
+            stale = [
+                i for i, cell in zip(checked, cells)
+                if (cell[0][0] if cell and cell[0] else "") != updates[i]["trade_id"]
+            ]
+            if stale:
+                ids = self.ws.col_values(id_col)
+                requests += 1
+                self.index.rebuild(ids[1:], range(2, len(ids) + 1))
+                # Positions locales obsolètes : miroir et cache seront resynchronisés
+                self.cache.invalidate()
+                for i in stale:
+                    rows[i] = self.index.get(updates[i]["trade_id"])
+                    moved += rows[i] is not None
+                    missing += rows[i] is None
+
+        return {"rows": rows, "requests": requests, "moved": moved, "missing": missing}
+
+    def update_taken_and_result(self, updates) -> dict:
+        """
+        updates = list of dict: {"trade_id": str, "sheet_row": int, "taken": str, "result": str}
+        La ligne est retrouvée par trade_id (sheet_row en secours pour les
+        lignes sans id). Seules les valeurs non None sont écrites, en une seule
+        requête batch. Retourne {"cells", "requests", "moved", "missing"}.
+        """
+        updates = [u for u in updates if u.get("taken") is not None or u.get("result") is not None]
+        if not updates:
+            return {"cells": 0, "requests": 0, "moved": 0, "missing": 0}
+        self.ensure_schema()
+        with instrument.stage("write.update") as s, self._write_lock:
+            sent = self._write_updates(updates)
+            s.rows = sent["cells"]
+        return sent
+
+    def _write_updates(self, updates) -> dict:
+        resolved = self._resolve_rows(updates)
+
+        col_taken = TRADE_COLUMNS.index("taken") + 1
+        col_result = TRADE_COLUMNS.index("result") + 1
+        data = []
+        cells = 0
+        applied = []
+        for u, r in zip(updates, resolved["rows"]):
+            if r is None:
+                continue
+            applied.append({**u, "sheet_row": r})
+            taken, result = u.get("taken"), u.get("result")
+            if taken is not None and result is not None and col_result == col_taken + 1:
+                # Cellules voisines : une seule plage pour la ligne
+                data.append({
+                    "range": f"{rowcol_to_a1(r, col_taken)}:{rowcol_to_a1(r, col_result)}",
+                    "values": [[taken, result]],
+                })
+                cells += 2
+                continue
+            if taken is not None:
+                data.append({"range": rowcol_to_a1(r, col_taken), "values": [[taken]]})
+                cells += 1
+            if result is not None:
+                data.append({"range": rowcol_to_a1(r, col_result), "values": [[result]]})
+                cells += 1
+
+        requests = resolved["requests"]
+        if data:
+            self.ws.batch_update(data, value_input_option="USER_ENTERED")
+            requests += 1
+            self.mirror.apply_cells(applied)
+            self.cache.patch_cells(applied)
+        return {"cells": cells, "requests": requests, "moved": resolved["moved"], "missing": resolved["missing"]}
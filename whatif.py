@@ -0,0 +1,108 @@
+"""
+Analyse « what-if » sur l'historique : seuil d'auto-refus et poids des règles.
+
+Seules les règles dont les entrées sont stockées dans la feuille peuvent
+être re-pondérées après coup : bandes de RR (colonne rr) et bonus de
+session (colonnes session + pair). Le score re-pondéré vaut
+score_percent - points d'origine + nouveaux points.
+
+Pour un jeu de poids, la courbe complète (tous les seuils) est calculée
+en un tri + sommes cumulées ; lire un seuil coûte ensuite O(log n).
+"""
+import numpy as np
+import pandas as pd
+
+from scoring import NO_TRADE_THRESHOLD, RULES_BY_NAME
+
+REWEIGHTABLE_RULES = ("rr", "session")
+EVAL_RESULTS = ("Win", "Loss", "BE")
+# Colonnes lues par le modèle (seules celles-ci sont chargées depuis l'archive)
+COLUMNS = ("taken", "result", "score_percent", "rr", "session", "pair")
+
+
+def default_weights() -> dict:
+    """{nom de règle: tuple des points par issue} tels que dans scoring.py."""
+    return {name: tuple(p for p, _ in RULES_BY_NAME[name].outcomes) for name in REWEIGHTABLE_RULES}
+
+
+def evaluated_trades(df: pd.DataFrame) -> pd.DataFrame:
+    """Trades pris avec un résultat Win / Loss / BE et un score valide."""
+    mask = (
+        (df["taken"] == "Oui")
+        & df["result"].isin(EVAL_RESULTS)
+        & df["score_percent"].notna()
+    )
+    return df.loc[mask]
+
+
+class WhatIfModel:
+    """Données pré-calculées pour re-scorer et balayer les seuils."""
+
+    def __init__(self, df: pd.DataFrame):
+        df = evaluated_trades(df)
+        self.n = len(df)
+        self.score = df["score_percent"].to_numpy(dtype=float)
+        result = df["result"].to_numpy()
+        self.win = (result == "Win").astype(np.int64)
+        self.loss = (result == "Loss").astype(np.int64)
+        self.be = (result == "BE").astype(np.int64)
+        rr = df["rr"].to_numpy(dtype=float)
+        # Résultat en R : Win = +RR, Loss = -1, BE = 0
+        self.r_multiple = np.where(self.win == 1, np.nan_to_num(rr), 0.0) - self.loss
+
+        # Issues des règles re-pondérables, et points d'origine à retirer
+        inputs = df[["rr", "session", "pair"]]
+        self.codes = {}
+        self.base_points = np.zeros(self.n, dtype=float)
+        for name, points in default_weights().items():
+            codes = RULES_BY_NAME[name].classify(inputs) if self.n else np.empty(0, dtype=np.int64)
+            self.codes[name] = codes
+            self.base_points += np.asarray(points, dtype=float)[codes]
+
+    def rescore(self, weights: dict) -> np.ndarray:
+        score = self.score - self.base_points
+        for name, points in weights.items():
+            score = score + np.asarray(points, dtype=float)[self.codes[name]]
+        return score
+
+    def sweep(self, weights=None, thresholds=None) -> pd.DataFrame:
+        """
+        Courbe pour chaque seuil t (trades gardés = score >= t) :
+        trades, win, loss, be, winrate %, espérance (R / trade), total R.
+        """
+        score = self.rescore(weights or default_weights())
+        if thresholds is None:
+            lo = int(np.floor(score.min())) if self.n else 0
+            hi = int(np.ceil(score.max())) if self.n else 0
+            thresholds = np.arange(min(lo, 0), max(hi, NO_TRADE_THRESHOLD) + 2)
+        thresholds = np.asarray(thresholds, dtype=float)
+
+        order = np.argsort(score, kind="stable")
+        sorted_score = score[order]
+        # Sommes cumulées avec un zéro en tête : suffixe = total - préfixe
+        cum = {
+            k: np.concatenate(([0], np.cumsum(v[order])))
+            for k, v in (("win", self.win), ("loss", self.loss), ("be", self.be), ("r", self.r_multiple))
+        }
+        idx = np.searchsorted(sorted_score, thresholds, side="left")
+        suffix = {k: c[-1] - c[idx] for k, c in cum.items()}
+        trades = self.n - idx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            winrate = np.where(trades > 0, suffix["win"] / trades * 100, 0.0)
+            expectancy = np.where(trades > 0, suffix["r"] / trades, 0.0)
+        return pd.DataFrame({
+            "threshold": thresholds,
+            "trades": trades,
+            "win": suffix["win"],
+            "loss": suffix["loss"],
+            "be": suffix["be"],
+            "winrate": winrate,
+            "expectancy_r": expectancy,
+            "total_r": suffix["r"],
+        })
+
+
+def at_threshold(curve: pd.DataFrame, threshold: float) -> pd.Series:
+    """Ligne de la courbe pour un seuil donné (seuils entiers de sweep)."""
+    i = int(np.clip(np.searchsorted(curve["threshold"].to_numpy(), threshold), 0, len(curve) - 1))
+    return curve.iloc[i]
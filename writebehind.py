@@ -0,0 +1,222 @@
+"""
+File d'écriture différée (write-behind) pour les ajouts de trades.
+
+Chaque ligne est d'abord écrite (fsync) dans un journal local en ajout
+seul, puis acquittée tout de suite. Un thread de fond envoie les lignes
+en attente par lots via append_rows, avec retry et backoff exponentiel.
+Chaque ligne porte une clé d'idempotence : après un échec ambigu (la
+requête a pu aboutir côté Sheets), on relit la colonne de la clé dans la
+feuille et on n'envoie pas les lignes déjà présentes.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import instrument
+
+log = logging.getLogger(__name__)
+
+
+def appended_first_row(response):
+    """Première ligne écrite par append_row(s), lue dans la réponse de l'API."""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    m = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(m.group(1)) if m else None
+
+
+class WriteBehindQueue:
+    """
+    key_func(row) -> str calcule la clé d'idempotence d'une ligne ; elle
+    doit être écrite telle quelle dans la colonne key_column (1 = A) de la
+    feuille.
+    on_flushed(entries) est appelé après chaque lot écrit, avec pour chaque
+    entrée {"key", "row", "sheet_row"} (sheet_row peut être None).
+    """
+
+    def __init__(self, journal_path, ws, key_func, key_column: int, on_flushed=None,
+                 batch_size=500, base_delay=1.0, max_delay=60.0, idle_wait=5.0):
+        self.journal_path = journal_path
+        self.ws = ws
+        self.key_func = key_func
+        self.key_column = key_column
+        self.on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idle_wait = idle_wait
+
+        self.last_flush_latency = None
+        self.last_error = None
+        self._pending = []
+        self._keys = set()
+        self._recovered = False
+        self._lock = threading.Lock()
+        # Tenu pendant l'envoi d'un lot (voir paused)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        if os.path.dirname(journal_path):
+            os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        self._replay()
+
+    # ── journal ───────────────────────────────────────────
+    def _replay(self):
+        """Relit le journal : les ajouts sans acquittement restent en attente."""
+        if not os.path.exists(self.journal_path):
+            return
+        pending = {}
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Dernière ligne tronquée par un arrêt brutal
+                    continue
+                if rec["op"] == "append":
+                    pending[rec["key"]] = rec["row"]
+                elif rec["op"] == "ack":
+                    for k in rec["keys"]:
+                        pending.pop(k, None)
+        self._pending = [{"key": k, "row": r} for k, r in pending.items()]
+        self._keys = set(pending)
+        # Un envoi a pu aboutir juste avant l'arrêt : on vérifiera la feuille
+        self._recovered = bool(self._pending)
+        self._compact()
+
+    def _write(self, records):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self):
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in self._pending:
+                f.write(json.dumps({"op": "append", **e}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+
+    # ── API ───────────────────────────────────────────────
+    def enqueue(self, row) -> str:
+        """Journalise la ligne et rend la main ; l'envoi se fait en fond."""
+        return self.enqueue_many([row])[0]
+
+    def enqueue_many(self, rows) -> list:
+        """Journalise plusieurs lignes en une écriture (un seul fsync)."""
+        keys = [self.key_func(row) for row in rows]
+        with self._lock:
+            new = []
+            for key, row in zip(keys, rows):
+                if key not in self._keys:
+                    self._keys.add(key)
+                    new.append({"key": key, "row": row})
+            if new:
+                self._write([{"op": "append", **e} for e in new])
+                self._pending.extend(new)
+        if new:
+            self._wakeup.set()
+        return keys
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def pending_keys(self) -> set:
+        """Clés journalisées pas encore envoyées."""
+        with self._lock:
+            return set(self._keys)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        if self._pending:
+            self._wakeup.set()
+        return self
+
+    @contextmanager
+    def paused(self):
+        """Aucun lot envoyé pendant le bloc (réécriture des lignes de la feuille)."""
+        with self._flush_lock:
+            yield
+
+    # ── worker ────────────────────────────────────────────
+    def _run(self):
+        attempt = 0
+        while True:
+            self._wakeup.wait(self.idle_wait)
+            self._wakeup.clear()
+            while self._pending:
+                batch = list(self._pending[: self.batch_size])
+                try:
+                    with self._flush_lock, instrument.run("write-behind"), \
+                            instrument.stage("write.flush", rows=len(batch)):
+                        self._flush(batch, check_existing=attempt > 0 or self._recovered)
+                except Exception as exc:  # quota, réseau, 5xx…
+                    self.last_error = f"{type(exc).__name__}: {exc}"
+                    log.warning("write-behind flush failed (attempt %d): %s", attempt + 1, exc)
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                    attempt += 1
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+                    continue
+                attempt = 0
+                self._recovered = False
+                self.last_error = None
+
+    def _flush(self, batch, check_existing: bool):
+        start = time.perf_counter()
+        written = self._find_written(batch) if check_existing else {}
+        to_send = [e for e in batch if e["key"] not in written]
+
+        first_row = None
+        if to_send:
+            response = self.ws.append_rows([e["row"] for e in to_send])
+            first_row = appended_first_row(response)
+
+        sent_pos = {e["key"]: i for i, e in enumerate(to_send)}
+        done = []
+        for e in batch:
+            if e["key"] in written:
+                sheet_row = written[e["key"]]
+            elif first_row is not None:
+                sheet_row = first_row + sent_pos[e["key"]]
+            else:
+                sheet_row = None
+            done.append({**e, "sheet_row": sheet_row})
+
+        keys = {e["key"] for e in batch}
+        with self._lock:
+            self._write([{"op": "ack", "keys": sorted(keys)}])
+            self._pending = [e for e in self._pending if e["key"] not in keys]
+            self._keys -= keys
+            if not self._pending:
+                self._compact()
+        self.last_flush_latency = time.perf_counter() - start
+
+        if self.on_flushed is not None:
+            self.on_flushed(done)
+
+    def _find_written(self, batch) -> dict:
+        """
+        Clés du lot déjà présentes dans la feuille -> numéro de ligne. Toute
+        la colonne de la clé est relue : un autre process a pu ajouter des
+        lignes après le lot, et la colonne A peut être vide.
+        """
+        keys = {e["key"] for e in batch}
+        found = {}
+        for i, k in enumerate(self.ws.col_values(self.key_column)[1:], start=2):
+            if k in keys:
+                found[k] = i
+        return found